@@ -6,6 +6,8 @@ import re
 from pathlib import Path
 from typing import Iterable
 
+from lfa_results_db import DEFAULT_DB_NAME, LfaResultsDB
+
 ENCODINGS = ("utf-8-sig", "gbk", "utf-16", "utf-8", "latin-1")
 OUTPUT_COLUMNS = [
     "sample_number",
@@ -41,6 +43,12 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="是否递归搜索子目录",
     )
+    parser.add_argument(
+        "--db",
+        nargs="?",
+        const="",
+        help=f"启用 SQLite 增量索引，只解析新增或变化的文件；不给路径时默认用输入目录下的 {DEFAULT_DB_NAME}",
+    )
     return parser.parse_args()
 
 
@@ -139,22 +147,13 @@ def write_output(records: list[dict[str, object]], output_path: Path) -> None:
         writer.writerows(records)
 
 
-def main() -> int:
-    args = parse_args()
-    input_dir = Path(args.input_dir).expanduser().resolve()
-    if not input_dir.exists() or not input_dir.is_dir():
-        raise SystemExit(f"输入目录不存在: {input_dir}")
-
-    output_path = (
-        Path(args.output).expanduser().resolve()
-        if args.output
-        else input_dir / "extracted_lfa_diffusivity.csv"
-    )
-
+def collect_records(
+    input_dir: Path, pattern: str, recursive: bool
+) -> tuple[list[dict[str, object]], list[str]]:
     records: list[dict[str, object]] = []
     failed_files: list[str] = []
 
-    for file_path in iter_input_files(input_dir, args.pattern, args.recursive):
+    for file_path in iter_input_files(input_dir, pattern, recursive):
         try:
             record = extract_record(file_path)
         except Exception as exc:  # noqa: BLE001
@@ -166,6 +165,73 @@ def main() -> int:
             continue
         records.append(record)
 
+    return records, failed_files
+
+
+def collect_records_incremental(
+    input_dir: Path, pattern: str, recursive: bool, db_path: Path
+) -> tuple[list[dict[str, object]], list[str]]:
+    seen: list[Path] = []
+    parsed = 0
+
+    with LfaResultsDB(db_path) as db:
+        for file_path in iter_input_files(input_dir, pattern, recursive):
+            if file_path == db_path:
+                continue
+            seen.append(file_path)
+            try:
+                cached, mtime_ns, size, sha256 = db.lookup(file_path)
+            except OSError as exc:
+                parsed += 1
+                db.upsert({"source_file": str(file_path)}, 0, 0, "", error=f"无法读取文件: {exc}")
+                continue
+            if cached:
+                continue
+
+            parsed += 1
+            error = None
+            try:
+                record = extract_record(file_path)
+            except Exception as exc:  # noqa: BLE001
+                record = {"source_file": str(file_path)}
+                error = str(exc)
+            else:
+                if record["mean_diffusivity_mm2_s"] is None:
+                    error = "缺少 #Mean 热扩散率"
+            db.upsert(record, mtime_ns, size, sha256, error=error)
+
+        db.prune_missing(input_dir, seen, recursive)
+        records = db.query(root=input_dir, recursive=recursive)
+        failed_files = db.errors_under(input_dir, recursive)
+
+    print(f"索引库 {db_path}: 扫描 {len(seen)} 个文件，新解析 {parsed} 个")
+    return records, failed_files
+
+
+def main() -> int:
+    args = parse_args()
+    input_dir = Path(args.input_dir).expanduser().resolve()
+    if not input_dir.exists() or not input_dir.is_dir():
+        raise SystemExit(f"输入目录不存在: {input_dir}")
+
+    output_path = (
+        Path(args.output).expanduser().resolve()
+        if args.output
+        else input_dir / "extracted_lfa_diffusivity.csv"
+    )
+
+    if args.db is not None:
+        db_path = (
+            Path(args.db).expanduser().resolve()
+            if args.db
+            else input_dir / DEFAULT_DB_NAME
+        )
+        records, failed_files = collect_records_incremental(
+            input_dir, args.pattern, args.recursive, db_path
+        )
+    else:
+        records, failed_files = collect_records(input_dir, args.pattern, args.recursive)
+
     records.sort(key=sort_key)
     write_output(records, output_path)
 
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Iterable
+
+DEFAULT_DB_NAME = "lfa_results.sqlite3"
+DATE_SEPARATORS = ("/", "-", ".", " ", "T")
+RECORD_COLUMNS = [
+    "sample_number",
+    "material_raw",
+    "material_label",
+    "sample",
+    "sample_position",
+    "date",
+    "thickness_mm",
+    "diameter_mm",
+    "mean_diffusivity_mm2_s",
+    "stddev_diffusivity_mm2_s",
+    "source_file",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lfa_results (
+    source_file TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    sample_number INTEGER,
+    material_raw TEXT,
+    material_label TEXT,
+    sample TEXT,
+    sample_position TEXT,
+    date TEXT,
+    thickness_mm REAL,
+    diameter_mm REAL,
+    mean_diffusivity_mm2_s REAL,
+    stddev_diffusivity_mm2_s REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_lfa_material_label ON lfa_results(material_label);
+CREATE INDEX IF NOT EXISTS idx_lfa_date ON lfa_results(date);
+CREATE INDEX IF NOT EXISTS idx_lfa_sample_number ON lfa_results(sample_number);
+"""
+
+
+def file_sha256(file_path: Path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with file_path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LfaResultsDB:
+    """以源文件路径为键的 LFA 提取结果索引，按 mtime/size/哈希判断是否需要重新解析。"""
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self) -> "LfaResultsDB":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def lookup(self, file_path: Path) -> tuple[bool, int, int, str | None]:
+        """判断文件是否已被索引且未变化。
+
+        返回 (是否命中, mtime_ns, size, sha256)。mtime 变化但内容哈希一致时
+        只刷新 mtime，视为命中；sha256 仅在需要时计算，未计算（或读取失败）时为 None。
+        上次未能计算哈希的记录（sha256 为空）不算命中。
+        """
+        stat = file_path.stat()
+        row = self.conn.execute(
+            "SELECT mtime_ns, size, sha256 FROM lfa_results WHERE source_file = ?",
+            (str(file_path),),
+        ).fetchone()
+        if row is None:
+            return False, stat.st_mtime_ns, stat.st_size, None
+        if row["mtime_ns"] == stat.st_mtime_ns and row["size"] == stat.st_size and row["sha256"]:
+            return True, stat.st_mtime_ns, stat.st_size, row["sha256"]
+
+        try:
+            sha256 = file_sha256(file_path)
+        except OSError:
+            return False, stat.st_mtime_ns, stat.st_size, None
+        if row["sha256"] == sha256:
+            self.conn.execute(
+                "UPDATE lfa_results SET mtime_ns = ?, size = ? WHERE source_file = ?",
+                (stat.st_mtime_ns, stat.st_size, str(file_path)),
+            )
+            return True, stat.st_mtime_ns, stat.st_size, sha256
+        return False, stat.st_mtime_ns, stat.st_size, sha256
+
+    def upsert(
+        self,
+        record: dict[str, object],
+        mtime_ns: int,
+        size: int,
+        sha256: str | None,
+        error: str | None = None,
+    ) -> None:
+        source_file = str(record["source_file"])
+        if sha256 is None:
+            try:
+                sha256 = file_sha256(Path(source_file))
+            except OSError as exc:
+                sha256 = ""  # 记为失败，下次 lookup 会重新检查
+                error = error or f"无法读取文件: {exc}"
+        values = [record.get(column) for column in RECORD_COLUMNS]
+        columns = RECORD_COLUMNS + ["mtime_ns", "size", "sha256", "error"]
+        placeholders = ", ".join("?" for _ in columns)
+        updates = ", ".join(
+            f"{column} = excluded.{column}" for column in columns if column != "source_file"
+        )
+        self.conn.execute(
+            f"INSERT INTO lfa_results ({', '.join(columns)}) VALUES ({placeholders}) "
+            f"ON CONFLICT(source_file) DO UPDATE SET {updates}",
+            values + [mtime_ns, size, sha256, error],
+        )
+
+    def prune_missing(self, root: Path, seen: Iterable[Path], recursive: bool = True) -> int:
+        """删除 root 下已不存在（或本次未匹配到）的文件记录。"""
+        seen_paths = {str(path) for path in seen}
+        stale = [
+            row["source_file"]
+            for row in self._rows_under(root, ("source_file",), recursive)
+            if row["source_file"] not in seen_paths
+        ]
+        self.conn.executemany(
+            "DELETE FROM lfa_results WHERE source_file = ?",
+            [(path,) for path in stale],
+        )
+        return len(stale)
+
+    def errors_under(self, root: Path, recursive: bool = True) -> list[str]:
+        return [
+            f"{row['source_file']}: {row['error']}"
+            for row in self._rows_under(root, ("source_file", "error"), recursive)
+            if row["error"]
+        ]
+
+    def query(
+        self,
+        root: Path | None = None,
+        recursive: bool = True,
+        material: str | None = None,
+        date: str | None = None,
+        sample_number: int | None = None,
+    ) -> list[dict[str, object]]:
+        clauses = ["error IS NULL"]
+        params: list[object] = []
+        if root is not None:
+            clauses.append("substr(source_file, 1, ?) = ?")
+            prefix = _dir_prefix(root)
+            params.extend([len(prefix), prefix])
+        if material:
+            clauses.append("(material_label = ? OR material_raw = ?)")
+            params.extend([material, material])
+        if date:
+            # 完整日期精确匹配，或按分隔符对齐的年/年月前缀：2024/4 匹配 2024/4/22，2024/4/2 不匹配 2024/4/22
+            date = date.strip().rstrip("".join(DATE_SEPARATORS))
+            clauses.append(
+                f"(date = ? OR (substr(date, 1, ?) = ? AND substr(date, ?, 1) IN "
+                f"({', '.join('?' for _ in DATE_SEPARATORS)})))"
+            )
+            params.extend([date, len(date), date, len(date) + 1, *DATE_SEPARATORS])
+        if sample_number is not None:
+            clauses.append("sample_number = ?")
+            params.append(sample_number)
+
+        rows = self.conn.execute(
+            f"SELECT {', '.join(RECORD_COLUMNS)} FROM lfa_results "
+            f"WHERE {' AND '.join(clauses)} "
+            "ORDER BY sample_number IS NULL, sample_number, source_file",
+            params,
+        ).fetchall()
+        if root is not None and not recursive:
+            rows = [row for row in rows if Path(row["source_file"]).parent == root]
+        return [dict(row) for row in rows]
+
+    def _rows_under(
+        self, root: Path, columns: tuple[str, ...], recursive: bool
+    ) -> list[sqlite3.Row]:
+        prefix = _dir_prefix(root)
+        rows = self.conn.execute(
+            f"SELECT {', '.join(columns)} FROM lfa_results WHERE substr(source_file, 1, ?) = ?",
+            (len(prefix), prefix),
+        ).fetchall()
+        if recursive:
+            return rows
+        return [row for row in rows if Path(row["source_file"]).parent == root]
+
+
+def _dir_prefix(root: Path) -> str:
+    text = str(root)
+    return text if text.endswith(("/", "\\")) else text + ("\\" if "\\" in text else "/")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="从 LFA 结果索引库中查询热扩散率记录。")
+    parser.add_argument("db", help="SQLite 索引库路径")
+    parser.add_argument("--root", help="只返回该目录下的源文件")
+    parser.add_argument("--material", help="按样品标签或原始 #Material 精确匹配")
+    parser.add_argument("--date", help="按 #Date 匹配完整日期或年/年月前缀，例如 2024/4/22、2024/4")
+    parser.add_argument("--sample-number", type=int, help="按文件名编号匹配")
+    parser.add_argument("--output", help="把查询结果写入 CSV，默认打印到终端")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    db_path = Path(args.db).expanduser().resolve()
+    if not db_path.exists():
+        raise SystemExit(f"索引库不存在: {db_path}")
+
+    with LfaResultsDB(db_path) as db:
+        records = db.query(
+            root=Path(args.root).expanduser().resolve() if args.root else None,
+            material=args.material,
+            date=args.date,
+            sample_number=args.sample_number,
+        )
+
+    if args.output:
+        output_path = Path(args.output).expanduser().resolve()
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        handle = output_path.open("w", encoding="utf-8-sig", newline="")
+    else:
+        handle = sys.stdout
+    try:
+        writer = csv.DictWriter(handle, fieldnames=RECORD_COLUMNS)
+        writer.writeheader()
+        writer.writerows(records)
+    finally:
+        if handle is not sys.stdout:
+            handle.close()
+
+    print(f"共 {len(records)} 条记录", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
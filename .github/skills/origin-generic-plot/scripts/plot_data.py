@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+PLOT_TYPE_ALIASES = {
+    "line": "line",
+    "折线图": "line",
+    "scatter": "scatter",
+    "散点图": "scatter",
+    "line-symbol": "line-symbol",
+    "点线图": "line-symbol",
+    "折线散点": "line-symbol",
+    "column": "column",
+    "柱状图": "column",
+}
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def resolve_path(path_value: str, base_dir: Path) -> Path:
+    path = Path(path_value).expanduser()
+    if not path.is_absolute():
+        path = base_dir / path
+    return path.resolve()
+
+
+def load_config(config_path: Path) -> dict[str, Any]:
+    with config_path.open("r", encoding="utf-8") as handle:
+        config = json.load(handle)
+    if not isinstance(config, dict):
+        raise ConfigError("配置文件顶层必须是 JSON 对象")
+    config["__config_dir__"] = str(config_path.parent)
+    return config
+
+
+def normalize_plot_type(value: str) -> str:
+    key = str(value).strip().lower()
+    if key not in PLOT_TYPE_ALIASES:
+        raise ConfigError(f"不支持的图类型: {value}")
+    return PLOT_TYPE_ALIASES[key]
+
+
+def resolve_column(df: pd.DataFrame, column: Any) -> str:
+    if isinstance(column, int):
+        # 列序号始终按原始文件的列顺序解释，即使读取时只投影了部分列
+        source_columns = df.attrs.get("source_columns", list(df.columns))
+        try:
+            return str(source_columns[column])
+        except IndexError as exc:
+            raise ConfigError(f"列序号越界: {column}") from exc
+    if column not in df.columns:
+        raise ConfigError(f"找不到列: {column}")
+    return str(column)
+
+
+def build_axis_title(axis_config: dict[str, Any], fallback: str) -> str:
+    name = str(axis_config.get("name") or fallback).strip()
+    unit = str(axis_config.get("unit") or "").strip()
+    return f"{name} ({unit})" if unit else name
+
+
+def configured_columns(config: dict[str, Any]) -> list[Any]:
+    layout = str(config.get("layout", "wide")).strip().lower()
+    if layout == "long":
+        columns = [config["x_column"], config["y_column"], config["group_column"]]
+    else:
+        columns = [config["x_column"], *config.get("y_columns", [])]
+    return list(dict.fromkeys(columns))
+
+
+def configured_dtypes(config: dict[str, Any], columns: list[str]) -> dict[str, Any]:
+    dtypes: dict[str, Any] = {}
+    group_column = config.get("group_column")
+    if str(config.get("layout", "wide")).strip().lower() == "long" and group_column in columns:
+        dtypes[group_column] = "category"
+    dtypes.update(config.get("dtypes") or {})
+    return {name: dtype for name, dtype in dtypes.items() if name in columns}
+
+
+def project_columns(wanted: list[Any], header: list[str]) -> list[str]:
+    names: list[str] = []
+    for column in wanted:
+        if isinstance(column, int):
+            try:
+                column = header[column]
+            except IndexError as exc:
+                raise ConfigError(f"列序号越界: {column}") from exc
+        elif column not in header:
+            raise ConfigError(f"找不到列: {column}")
+        names.append(column)
+    return list(dict.fromkeys(names))
+
+
+def read_delimited(input_path: Path, sep: str, config: dict[str, Any]) -> pd.DataFrame:
+    header = [str(name) for name in pd.read_csv(input_path, sep=sep, nrows=0).columns]
+    usecols = project_columns(configured_columns(config), header)
+    df = pd.read_csv(
+        input_path,
+        sep=sep,
+        usecols=usecols,
+        dtype=configured_dtypes(config, usecols) or None,
+        engine=config.get("csv_engine") or None,
+    )
+    df.attrs["source_columns"] = header
+    return df
+
+
+def load_dataframe(config: dict[str, Any]) -> pd.DataFrame:
+    base_dir = Path(config["__config_dir__"])
+    input_path = resolve_path(config["input_path"], base_dir)
+    suffix = input_path.suffix.lower()
+    if not input_path.exists():
+        raise ConfigError(f"输入文件不存在: {input_path}")
+
+    if suffix in {".csv", ".txt", ".dat"}:
+        sep = config.get("sep")
+        if not sep:
+            sep = "\t" if suffix == ".txt" else ","
+        return read_delimited(input_path, sep, config)
+
+    if suffix == ".tsv":
+        return read_delimited(input_path, "\t", config)
+
+    # 其余格式只有在全部按列名配置时才做列投影；含列序号时读全表以保证序号语义不变
+    wanted = configured_columns(config)
+    names = wanted if all(isinstance(column, str) for column in wanted) else None
+
+    if suffix in {".parquet", ".pq", ".feather", ".ftr"}:
+        reader = pd.read_parquet if suffix in {".parquet", ".pq"} else pd.read_feather
+        try:
+            df = reader(input_path, columns=names)
+        except ImportError as exc:
+            raise ConfigError(
+                "读取 Parquet/Feather 需要 pyarrow。当前环境缺少该依赖，请先安装后再运行。"
+            ) from exc
+        except (KeyError, ValueError) as exc:
+            raise ConfigError(f"找不到列: {exc}") from exc
+        dtypes = configured_dtypes(config, [str(name) for name in df.columns])
+        return df.astype(dtypes) if dtypes else df
+
+    if suffix in {".xls", ".xlsx"}:
+        try:
+            df = pd.read_excel(
+                input_path,
+                sheet_name=config.get("sheet_name", 0),
+                usecols=(lambda name: name in names) if names else None,
+            )
+        except ImportError as exc:
+            raise ConfigError(
+                "读取 Excel 需要 openpyxl。当前环境缺少该依赖，请先安装后再运行。"
+            ) from exc
+        dtypes = configured_dtypes(config, [str(name) for name in df.columns])
+        return df.astype(dtypes) if dtypes else df
+
+    raise ConfigError(f"暂不支持的输入文件类型: {suffix}")
+
+
+def normalize_wide_layout(df: pd.DataFrame, config: dict[str, Any]) -> tuple[pd.DataFrame, list[str], str]:
+    x_column = resolve_column(df, config["x_column"])
+    y_columns = [resolve_column(df, col) for col in config["y_columns"]]
+    sample_names = config.get("sample_names") or y_columns
+    if len(sample_names) != len(y_columns):
+        raise ConfigError("sample_names 的长度必须和 y_columns 一致")
+
+    normalized = df[[x_column, *y_columns]].copy()
+    normalized = normalized.dropna(how="all", subset=y_columns)
+    normalized.columns = [x_column, *sample_names]
+    return normalized, [str(name) for name in sample_names], x_column
+
+
+def pivot_mean(working: pd.DataFrame) -> pd.DataFrame:
+    """按 (x, group) 求 y 的均值并展开成宽表，等价于 pivot_table(aggfunc="mean")。
+
+    直接用 factorize 得到整数编码再 bincount 累加，避免 pivot_table 的通用分组开销；
+    group 列按首次出现顺序排列，X 升序。
+    """
+    x_codes, x_values = pd.factorize(working["x"], sort=True)
+    group_codes, groups = pd.factorize(working["group"])
+    shape = (len(x_values), len(groups))
+    flat = x_codes * shape[1] + group_codes
+    sums = np.bincount(flat, weights=working["y"].to_numpy(dtype=float), minlength=shape[0] * shape[1])
+    counts = np.bincount(flat, minlength=shape[0] * shape[1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, sums / counts, np.nan).reshape(shape)
+
+    pivot = pd.DataFrame(means, columns=[str(name) for name in groups])
+    pivot.insert(0, "x", np.asarray(x_values))
+    return pivot
+
+
+def normalize_long_layout(df: pd.DataFrame, config: dict[str, Any]) -> tuple[pd.DataFrame, list[str], str]:
+    x_column = resolve_column(df, config["x_column"])
+    y_column = resolve_column(df, config["y_column"])
+    group_column = resolve_column(df, config["group_column"])
+
+    working = df[[x_column, y_column, group_column]].set_axis(["x", "y", "group"], axis=1)
+    working = working.assign(y=pd.to_numeric(working["y"], errors="coerce"))
+    working = working.dropna(subset=["x", "y", "group"])
+
+    pivot = pivot_mean(working)
+    discovered_order = [str(name) for name in pivot.columns[1:]]
+    sample_names = [str(item) for item in config.get("sample_names") or discovered_order]
+
+    missing_groups = [name for name in sample_names if name not in pivot.columns]
+    if missing_groups:
+        raise ConfigError(f"以下 sample_names 在数据中不存在: {missing_groups}")
+
+    ordered_columns = ["x", *sample_names]
+    pivot = pivot.loc[:, ordered_columns]
+    pivot.columns = [x_column, *sample_names]
+    return pivot, sample_names, x_column
+
+
+def normalize_dataframe(df: pd.DataFrame, config: dict[str, Any]) -> tuple[pd.DataFrame, list[str], str]:
+    layout = str(config.get("layout", "wide")).strip().lower()
+    if layout == "wide":
+        return normalize_wide_layout(df, config)
+    if layout == "long":
+        return normalize_long_layout(df, config)
+    raise ConfigError(f"不支持的 layout: {layout}")
+
+
+def export_normalized_csv(df: pd.DataFrame, config: dict[str, Any]) -> None:
+    output_path = config.get("normalized_output_csv")
+    if not output_path:
+        return
+    base_dir = Path(config["__config_dir__"])
+    csv_path = resolve_path(output_path, base_dir)
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(csv_path, index=False, encoding="utf-8-sig")
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from plot_data import (
+    build_axis_title,
+    export_normalized_csv,
+    load_config,
+    load_dataframe,
+    normalize_dataframe,
+    normalize_plot_type,
+    resolve_path,
+)
+
+STYLE_BY_TYPE = {
+    "line": {"linestyle": "-", "marker": None},
+    "scatter": {"linestyle": "none", "marker": "o"},
+    "line-symbol": {"linestyle": "-", "marker": "o"},
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="根据与 Origin 脚本相同的配置文件，用 matplotlib (Agg) 无界面批量绘图。"
+    )
+    parser.add_argument(
+        "--config",
+        required=True,
+        nargs="+",
+        help="一个或多个 JSON 配置文件；也可以给目录，会处理目录下所有 *.json",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="并行进程数，默认 1；批量出图时可设为 CPU 核数",
+    )
+    parser.add_argument(
+        "--format",
+        help="覆盖配置中的 image_format，例如 png、svg、pdf",
+    )
+    return parser.parse_args()
+
+
+def save_image_path(config: dict[str, Any]) -> Path:
+    base_dir = Path(config["__config_dir__"])
+    image_format = str(config.get("image_format") or "png").lstrip(".")
+    if config.get("save_image"):
+        return resolve_path(config["save_image"], base_dir)
+    if config.get("save_project"):
+        return resolve_path(config["save_project"], base_dir).with_suffix(f".{image_format}")
+    input_path = resolve_path(config["input_path"], base_dir)
+    return input_path.with_name(f"{input_path.stem}_plot.{image_format}")
+
+
+def create_matplotlib_plot(df: pd.DataFrame, sample_names: list[str], x_column: str, config: dict[str, Any]) -> Path:
+    plot_type = normalize_plot_type(config.get("plot_type", "line-symbol"))
+    x_axis_title = build_axis_title(config.get("x_axis", {}), x_column)
+    y_axis_title = build_axis_title(config.get("y_axis", {}), "Y")
+    graph_name = str(config.get("graph_name") or "Origin Plot")
+    figsize = config.get("figsize") or (6.4, 4.8)
+
+    fig, ax = plt.subplots(figsize=tuple(figsize))
+    try:
+        x_values = df.iloc[:, 0]
+        if plot_type == "column":
+            positions = np.arange(len(df))
+            width = 0.8 / max(len(sample_names), 1)
+            for offset, sample_name in enumerate(sample_names):
+                y_values = pd.to_numeric(df.iloc[:, offset + 1], errors="coerce")
+                shift = (offset - (len(sample_names) - 1) / 2) * width
+                ax.bar(positions + shift, y_values, width=width, label=sample_name)
+            ax.set_xticks(positions)
+            ax.set_xticklabels([str(value) for value in x_values])
+        else:
+            style = STYLE_BY_TYPE[plot_type]
+            for offset, sample_name in enumerate(sample_names, start=1):
+                y_values = pd.to_numeric(df.iloc[:, offset], errors="coerce")
+                mask = y_values.notna()
+                ax.plot(x_values[mask], y_values[mask], label=sample_name, **style)
+
+        ax.set_xlabel(x_axis_title)
+        ax.set_ylabel(y_axis_title)
+        ax.set_title(graph_name)
+        ax.legend()
+        fig.tight_layout()
+
+        save_path = save_image_path(config)
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        fig.savefig(save_path, dpi=int(config.get("dpi", 150)))
+    finally:
+        plt.close(fig)
+    return save_path
+
+
+def render_config(config_path: Path, image_format: str | None = None) -> tuple[Path, int]:
+    config = load_config(config_path)
+    if image_format:
+        config["image_format"] = image_format
+        if config.get("save_image"):
+            config["save_image"] = str(Path(config["save_image"]).with_suffix("." + image_format.lstrip(".")))
+    dataframe = load_dataframe(config)
+    normalized_df, sample_names, x_column = normalize_dataframe(dataframe, config)
+    export_normalized_csv(normalized_df, config)
+    return create_matplotlib_plot(normalized_df, sample_names, x_column, config), len(sample_names)
+
+
+def collect_config_paths(values: list[str]) -> list[Path]:
+    paths: list[Path] = []
+    for value in values:
+        path = Path(value).expanduser().resolve()
+        if path.is_dir():
+            paths.extend(sorted(path.glob("*.json")))
+        else:
+            paths.append(path)
+    return paths
+
+
+def main() -> int:
+    args = parse_args()
+    config_paths = collect_config_paths(args.config)
+    if not config_paths:
+        raise SystemExit("没有找到任何配置文件")
+
+    started = time.perf_counter()
+    failed: list[str] = []
+    executor = ProcessPoolExecutor(max_workers=args.jobs) if args.jobs > 1 else None
+    try:
+        if executor is None:
+            results = ((path, lambda path=path: render_config(path, args.format)) for path in config_paths)
+        else:
+            futures = {path: executor.submit(render_config, path, args.format) for path in config_paths}
+            results = ((path, future.result) for path, future in futures.items())
+        for config_path, get_result in results:
+            try:
+                save_path, group_count = get_result()
+            except (ValueError, OSError, KeyError) as exc:
+                failed.append(f"{config_path}: {exc}")
+                continue
+            print(f"图片已保存: {save_path} (数据组数: {group_count})")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - started
+    print(f"共处理 {len(config_paths)} 个配置，失败 {len(failed)} 个，用时 {elapsed:.2f} s")
+    for item in failed:
+        print(f"  - {item}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,7 +1,7 @@
 """
 方格设备摆放优化器 - 最终版
 ==============================
-问题：在10x11的方格中摆放设备和人物：
+问题：在方格（默认10x11，可任意尺寸、可带障碍格）中摆放设备和人物：
   - 每个设备必须与至少一个人相邻（上下左右，斜着不算）
   - 人必须有路径能走过去（所有非设备格子必须连通）
   - 目标：最大化设备数量
@@ -9,12 +9,19 @@
 方法：
   阶段1: 构造模式 + 贪心填充 + 迭代局部搜索 (快速找到好解)
   阶段2: 用好解作为CP-SAT求解器的初始提示 (尝试证明最优性)
+
+问题定义见 GridProblem：尺寸、障碍格（墙/柱子，既不能放设备也不能走）、
+固定为设备或固定为空的格子、入口。不规则房间可以用文本地图描述，见 GridProblem.from_text。
 """
 
+import argparse
+import json
+import math
+import multiprocessing
+import os
 import sys
 import random
 import time as _time
-from collections import deque
 
 
 def install_pkg(package):
@@ -31,300 +38,898 @@ def install_pkg(package):
 ROWS = 10
 COLS = 11
 
-def get_neighbors(r, c):
-    result = []
-    if r > 0: result.append((r-1, c))
-    if r < ROWS-1: result.append((r+1, c))
-    if c > 0: result.append((r, c-1))
-    if c < COLS-1: result.append((r, c+1))
-    return result
-
-NEIGHBORS = {}
-for _r in range(ROWS):
-    for _c in range(COLS):
-        NEIGHBORS[(_r, _c)] = get_neighbors(_r, _c)
-
-
-def is_valid(grid):
-    start = None
-    total_empty = 0
-    for r in range(ROWS):
-        for c in range(COLS):
-            if grid[r][c] == 1:
-                ok = False
-                for nr, nc in NEIGHBORS[(r, c)]:
-                    if grid[nr][nc] == 0:
-                        ok = True
-                        break
-                if not ok:
-                    return False
-            else:
-                total_empty += 1
-                if start is None:
-                    start = (r, c)
-    if total_empty <= 1:
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:  # Python < 3.10
+    def popcount(x):
+        return bin(x).count("1")
+
+
+# ------------------------------------------------------------
+# 问题定义
+# 布局用位棋盘表示：一个 Python int，第 r * cols + c 位为 1 表示该格是设备。
+# 复制布局就是复制一个整数，计数和邻居检查都是位运算。
+# ------------------------------------------------------------
+class GridProblem:
+    """
+    一个摆放问题：
+      rows, cols     尺寸
+      blocked        障碍格 [(r, c)]：不能放设备，也不能行走
+      fixed_devices  必须是设备的格子 [(r, c)]
+      fixed_empty    必须留空（人/通道）的格子 [(r, c)]
+      entry          入口 (r, c)：必须留空，CP-SAT 以它为连通性的根
+    构造时预先计算扁平下标的邻居表、邻居掩码和各种位掩码，所有求解函数都以 problem 作为第一个参数。
+    """
+
+    def __init__(self, rows=ROWS, cols=COLS, blocked=(), fixed_devices=(), fixed_empty=(), entry=None):
+        self.rows = rows
+        self.cols = cols
+        self.cells = rows * cols
+        self.full = (1 << self.cells) - 1
+        self.blocked = self.mask(blocked)
+        self.open = self.full & ~self.blocked
+        self.entry = self.index(*entry) if entry is not None else None
+        self.fixed_device = self.mask(fixed_devices)
+        self.fixed_empty = self.mask(fixed_empty) | (1 << self.entry if self.entry is not None else 0)
+        if self.fixed_device & (self.blocked | self.fixed_empty):
+            raise ValueError("固定设备格不能同时是障碍格、固定空格或入口")
+        if self.fixed_empty & self.blocked:
+            raise ValueError("固定空格/入口不能是障碍格")
+
+        first_col = sum(1 << (r * cols) for r in range(rows))
+        self._not_first_col = self.full & ~first_col
+        self._not_last_col = self.full & ~(first_col << (cols - 1))
+        # 按扁平下标存放的邻居表与邻居掩码（只含非障碍格，障碍格本身没有邻居）
+        self.neighbors = []
+        for i in range(self.cells):
+            r, c = divmod(i, cols)
+            nbrs = []
+            if (self.open >> i) & 1:
+                for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                    if 0 <= nr < rows and 0 <= nc < cols and (self.open >> (nr * cols + nc)) & 1:
+                        nbrs.append(nr * cols + nc)
+            self.neighbors.append(nbrs)
+        self.neighbor_mask = [sum(1 << j for j in nbrs) for nbrs in self.neighbors]
+        # 3x3 窗口内（不含自身）的非障碍格，供局部连通性判断和局部交换使用
+        self.ring = []
+        for i in range(self.cells):
+            r, c = divmod(i, cols)
+            ring = []
+            if (self.open >> i) & 1:
+                for nr in range(r - 1, r + 2):
+                    for nc in range(c - 1, c + 2):
+                        if (0 <= nr < rows and 0 <= nc < cols and (nr, nc) != (r, c)
+                                and (self.open >> (nr * cols + nc)) & 1):
+                            ring.append(nr * cols + nc)
+            self.ring.append(ring)
+        self.ring_mask = [sum(1 << j for j in ring) for ring in self.ring]
+
+    @classmethod
+    def from_text(cls, text):
+        """
+        从文本地图构造问题，每行一排格子：
+          . 自由格   # 障碍   E 固定设备   P 固定留空   S 入口
+        """
+        lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+        if len({len(line) for line in lines}) != 1:
+            raise ValueError("地图每行长度必须相同")
+        cells = {kind: [] for kind in "#EPS"}
+        for r, line in enumerate(lines):
+            for c, ch in enumerate(line):
+                if ch in cells:
+                    cells[ch].append((r, c))
+                elif ch != ".":
+                    raise ValueError(f"地图第 {r + 1} 行含未知字符 {ch!r}")
+        if len(cells["S"]) > 1:
+            raise ValueError("地图中最多只能有一个入口 S")
+        return cls(len(lines), len(lines[0]), blocked=cells["#"], fixed_devices=cells["E"],
+                   fixed_empty=cells["P"], entry=cells["S"][0] if cells["S"] else None)
+
+    def key(self):
+        """问题的规范标识（尺寸、障碍、固定格、入口），用作解缓存的键"""
+        entry = "-" if self.entry is None else str(self.entry)
+        return (f"{self.rows}x{self.cols}:b{self.blocked:x}:d{self.fixed_device:x}"
+                f":e{self.fixed_empty:x}:s{entry}")
+
+    def index(self, r, c):
+        if not (0 <= r < self.rows and 0 <= c < self.cols):
+            raise ValueError(f"格子 ({r}, {c}) 超出 {self.rows}x{self.cols} 的范围")
+        return r * self.cols + c
+
+    def mask(self, cells):
+        result = 0
+        for r, c in cells:
+            result |= 1 << self.index(r, c)
+        return result
+
+    def describe(self):
+        text = f"{self.rows} x {self.cols} = {self.cells}"
+        extras = []
+        if self.blocked:
+            extras.append(f"障碍 {popcount(self.blocked)}")
+        if self.fixed_device:
+            extras.append(f"固定设备 {popcount(self.fixed_device)}")
+        if self.fixed_empty:
+            extras.append(f"固定留空 {popcount(self.fixed_empty)}")
+        if self.entry is not None:
+            extras.append(f"入口 {divmod(self.entry, self.cols)}")
+        return text + (f"（{'，'.join(extras)}）" if extras else "")
+
+    def spread(self, mask):
+        """mask 中每个格子的上下左右非障碍邻居（不含自身）"""
+        cols = self.cols
+        return (((mask << cols) | (mask >> cols)
+                 | ((mask << 1) & self._not_first_col) | ((mask >> 1) & self._not_last_col)) & self.open)
+
+    def cell_bits(self, board):
+        """按扁平下标排列的 '0'/'1' 字符串，逐格读取时比逐位移位快得多"""
+        return format(board, f"0{self.cells}b")[::-1]
+
+    def free_cells(self, board):
+        """可以放设备的空格下标（非障碍、非固定留空、当前不是设备）"""
+        placeable = self.open & ~self.fixed_empty & ~board
+        return [i for i, bit in enumerate(self.cell_bits(placeable)) if bit == "1"]
+
+    def removable_cells(self, board):
+        """可以移除的设备下标（不含固定设备）"""
+        return [i for i, bit in enumerate(self.cell_bits(board & ~self.fixed_device)) if bit == "1"]
+
+    def flip(self, board, axis):
+        """上下（axis="rows"）或左右（axis="cols"）翻转布局"""
+        grid = self.to_grid(board)
+        grid = grid[::-1] if axis == "rows" else [row[::-1] for row in grid]
+        return self.to_board(grid)
+
+    def to_board(self, grid):
+        """二维列表布局 -> 位棋盘"""
+        board = 0
+        for r in range(self.rows):
+            for c in range(self.cols):
+                if grid[r][c]:
+                    board |= 1 << (r * self.cols + c)
+        return board
+
+    def to_grid(self, board):
+        """位棋盘 -> 二维列表布局（1=设备, 0=非设备）"""
+        bits = self.cell_bits(board)
+        return [[int(bits[r * self.cols + c]) for c in range(self.cols)] for r in range(self.rows)]
+
+
+def is_valid(problem, board):
+    if board & ~problem.open or board & problem.fixed_empty or problem.fixed_device & ~board:
+        return False
+    free = problem.open & ~board
+    # 约束1: 每个设备至少有一个非设备邻居
+    if board & ~problem.spread(free):
+        return False
+    # 约束2: 非设备格连通——从最低位的空格出发做位并行洪泛
+    if popcount(free) <= 1:
         return True
-    seen = [[False]*COLS for _ in range(ROWS)]
-    seen[start[0]][start[1]] = True
-    q = deque([start])
-    visited = 0
-    while q:
-        cr, cc = q.popleft()
-        visited += 1
-        for nr, nc in NEIGHBORS[(cr, cc)]:
-            if not seen[nr][nc] and grid[nr][nc] == 0:
-                seen[nr][nc] = True
-                q.append((nr, nc))
-    return visited == total_empty
-
-
-def count_eq(grid):
-    return sum(grid[r][c] for r in range(ROWS) for c in range(COLS))
-
-
-def greedy_fill(grid):
+    reach = free & -free
+    while True:
+        grown = (reach | problem.spread(reach)) & free
+        if grown == reach:
+            return reach == free
+        reach = grown
+
+
+def count_eq(board):
+    return popcount(board)
+
+
+def articulation_points(problem, board):
+    """非设备格连通图的割点掩码（迭代版 Tarjan），这些格子变成设备会把人走的区域切断"""
+    neighbors = problem.neighbors
+    free = [bit == "1" for bit in problem.cell_bits(problem.open & ~board)]
+    disc = [-1] * problem.cells
+    low = [0] * problem.cells
+    cut = 0
+    timer = 0
+    for root in range(problem.cells):
+        if not free[root] or disc[root] >= 0:
+            continue
+        disc[root] = low[root] = timer
+        timer += 1
+        root_children = 0
+        stack = [(root, -1, iter(neighbors[root]))]
+        while stack:
+            node, parent, it = stack[-1]
+            for nxt in it:
+                if not free[nxt] or nxt == parent:
+                    continue
+                if disc[nxt] >= 0:
+                    if disc[nxt] < low[node]:
+                        low[node] = disc[nxt]
+                else:
+                    disc[nxt] = low[nxt] = timer
+                    timer += 1
+                    stack.append((nxt, node, iter(neighbors[nxt])))
+                    break
+            else:
+                stack.pop()
+                if parent < 0:
+                    continue
+                if low[node] < low[parent]:
+                    low[parent] = low[node]
+                if parent == root:
+                    root_children += 1
+                elif low[node] >= disc[parent]:
+                    cut |= 1 << parent
+        if root_children > 1:
+            cut |= 1 << root
+    return cut
+
+
+class FeasibilityEngine:
+    """
+    增量可行性判断：在一个有效布局上逐个把空格变成设备时，不再每次调用 is_valid 全图检查。
+      - empty_nbrs 维护每个格子的非设备邻居数，"设备必须有人相邻"只需检查被翻转格子及其邻居；
+      - 连通性先看 3x3 窗口：格子的非设备邻居不经过它就能在窗口内互相连通时，变成设备不会切断人走的区域；
+        否则用非设备格的割点判断，割点只在布局变化后第一次需要时重新计算（O(格子数)）。
+    要求初始布局有效（is_valid 为 True）。移除设备（remove）总是可行：它原来就有非设备邻居。
+    """
+
+    def __init__(self, problem, board):
+        self.problem = problem
+        self.board = board
+        free = problem.open & ~board
+        self.empty_nbrs = [popcount(mask & free) for mask in problem.neighbor_mask]
+        self.cut = None  # 割点掩码，布局变化后置为 None，需要时再计算
+
+    def can_place(self, i):
+        board = self.board
+        if (board >> i) & 1 or self.empty_nbrs[i] == 0 or (self.problem.fixed_empty >> i) & 1:
+            return False
+        for j in self.problem.neighbors[i]:
+            if (board >> j) & 1 and self.empty_nbrs[j] == 1:
+                return False
+        if self._locally_safe(i):
+            return True
+        if self.cut is None:
+            self.cut = articulation_points(self.problem, board)
+        return not (self.cut >> i) & 1
+
+    def _locally_safe(self, i):
+        """i 的非设备邻居在 3x3 窗口内（不经过 i）互相连通：i 不是割点的充分条件，只看常数个格子"""
+        free = self.problem.ring_mask[i] & ~self.board
+        targets = self.problem.neighbor_mask[i] & free
+        reach = targets & -targets
+        while True:
+            grown = (reach | self.problem.spread(reach)) & free
+            if grown == reach:
+                return not targets & ~reach
+            reach = grown
+
+    def place(self, i):
+        self.board |= 1 << i
+        for j in self.problem.neighbors[i]:
+            self.empty_nbrs[j] -= 1
+        self.cut = None
+
+    def remove(self, i):
+        self.board &= ~(1 << i)
+        for j in self.problem.neighbors[i]:
+            self.empty_nbrs[j] += 1
+        self.cut = None
+
+
+def greedy_fill(problem, board):
+    if not is_valid(problem, board):
+        return board
+    engine = FeasibilityEngine(problem, board)
     changed = True
     while changed:
         changed = False
-        cells = [(r, c) for r in range(ROWS) for c in range(COLS) if grid[r][c] == 0]
+        cells = problem.free_cells(engine.board)
         random.shuffle(cells)
-        for r, c in cells:
-            grid[r][c] = 1
-            if is_valid(grid):
+        for i in cells:
+            if engine.can_place(i):
+                engine.place(i)
                 changed = True
-            else:
-                grid[r][c] = 0
-    return grid
+    return engine.board
 
 
-def multi_greedy(grid, trials=20):
-    best = count_eq(grid)
-    best_grid = [row[:] for row in grid]
+def multi_greedy(problem, board, trials=20):
+    best = count_eq(board)
+    best_board = board
     for _ in range(trials):
-        g = [row[:] for row in grid]
-        g = greedy_fill(g)
+        g = greedy_fill(problem, board)
         eq = count_eq(g)
         if eq > best:
             best = eq
-            best_grid = [row[:] for row in g]
-    return best_grid, best
+            best_board = g
+    return best_board, best
 
 
-def perturb_and_refill(grid, num_remove=5):
-    g = [row[:] for row in grid]
-    eq_cells = [(r, c) for r in range(ROWS) for c in range(COLS) if g[r][c] == 1]
+def perturb_and_refill(problem, board, num_remove=5):
+    eq_cells = problem.removable_cells(board)
     if len(eq_cells) < num_remove:
-        return g
-    for r, c in random.sample(eq_cells, num_remove):
-        g[r][c] = 0
-    return greedy_fill(g)
+        return board
+    for i in random.sample(eq_cells, num_remove):
+        board &= ~(1 << i)
+    return greedy_fill(problem, board)
 
 
-def iterated_local_search(grid, iterations=300, remove_range=(2, 12)):
-    best = count_eq(grid)
-    best_grid = [row[:] for row in grid]
+def iterated_local_search(problem, board, iterations=300, remove_range=(2, 12)):
+    best = count_eq(board)
+    best_board = board
     for _ in range(iterations):
-        g = perturb_and_refill(best_grid, random.randint(*remove_range))
+        g = perturb_and_refill(problem, best_board, random.randint(*remove_range))
         eq = count_eq(g)
         if eq >= best:
             best = eq
-            best_grid = [row[:] for row in g]
-    return best_grid, best
-
-
-def print_grid(grid, title=""):
-    eq = count_eq(grid)
-    valid = is_valid(grid)
-    non_eq = ROWS * COLS - eq
-    people = sum(1 for r in range(ROWS) for c in range(COLS)
-                 if grid[r][c] == 0 and any(grid[nr][nc] == 1 for nr, nc in NEIGHBORS[(r, c)]))
+            best_board = g
+    return best_board, best
+
+
+SA_ITERATIONS_PER_CELL = 100
+
+
+def simulated_annealing(problem, board, iterations=None, t_start=0.5, t_end=0.1, swap_prob=0.9):
+    """
+    模拟退火：在有效布局上做单格移动，每步只用 FeasibilityEngine 做局部增量判断，比 ILS 的"移除+整轮贪心"便宜得多。
+      - 空格 -> 设备（+1）：可行即接受；
+      - 设备 -> 空格（-1）：总是可行，按 exp(-1/T) 接受；
+      - 交换（0）：设备移到 3x3 窗口内的一个空格，可行即接受，用于在同分平台上游走。
+    温度从 t_start 几何降到 t_end，返回途中遇到的最好布局。iterations 默认每个可用格 SA_ITERATIONS_PER_CELL 步。
+    """
+    engine = FeasibilityEngine(problem, board)
+    best_board = board
+    best = current = count_eq(board)
+    movable = [i for i in range(problem.cells)
+               if ((problem.open & ~problem.fixed_device & ~problem.fixed_empty) >> i) & 1]
+    if not movable:
+        return best_board, best
+    if iterations is None:
+        iterations = SA_ITERATIONS_PER_CELL * popcount(problem.open)
+    cooling = (t_end / t_start) ** (1 / max(iterations - 1, 1))
+    t = t_start
+    for _ in range(iterations):
+        i = random.choice(movable)
+        if (engine.board >> i) & 1:
+            ring = problem.ring[i]
+            if ring and random.random() < swap_prob:
+                j = random.choice(ring)
+                cut = engine.cut
+                engine.remove(i)
+                if engine.can_place(j):
+                    engine.place(j)
+                else:
+                    engine.place(i)
+                    engine.cut = cut  # 布局没变，割点仍然有效
+            elif random.random() < math.exp(-1 / t):
+                engine.remove(i)
+                current -= 1
+        elif engine.can_place(i):
+            engine.place(i)
+            current += 1
+            if current > best:
+                best = current
+                best_board = engine.board
+        t *= cooling
+    return best_board, best
+
+
+def compare_local_search(problem, seconds=10, seeds=(0, 1, 2)):
+    """同一贪心起点、同样的墙钟时间下比较 ILS 与模拟退火（退火每轮从当前最优重新升温）"""
+    print(f"  {problem.describe()}，每种方法 {seconds:g} 秒")
+    print(f"  {'种子':>4} {'起点':>6} {'ILS':>6} {'ILS迭代':>9} {'SA':>6} {'SA迭代':>9}")
+    patterns = generate_patterns(problem)
+    for seed in seeds:
+        random.seed(seed)
+        start = max((greedy_fill(problem, board) for board in patterns), key=count_eq)
+        row = [seed, count_eq(start)]
+        for search in SEARCH_ENGINES:
+            random.seed(seed)
+            best_board, best = start, count_eq(start)
+            iterations = 0
+            deadline = _time.time() + seconds
+            while _time.time() < deadline:
+                if search == "sa":
+                    best_board, best = simulated_annealing(problem, best_board)
+                    iterations += SA_ITERATIONS_PER_CELL * popcount(problem.open)
+                else:
+                    best_board, best = iterated_local_search(problem, best_board, iterations=20)
+                    iterations += 20
+            row += [best, iterations]
+        print("  {:>4} {:>6} {:>6} {:>9} {:>6} {:>9}".format(*row))
+
+
+def print_grid(problem, board, title=""):
+    eq = count_eq(board)
+    valid = is_valid(problem, board)
+    usable = popcount(problem.open)
+    non_eq = usable - eq
+    people = popcount(problem.spread(board) & ~board)
+    bits = problem.cell_bits(board)
+    blocked = problem.cell_bits(problem.blocked)
+    people_bits = problem.cell_bits(problem.spread(board) & ~board)
 
     if title:
         print(f"\n  === {title} ===")
-    print(f"  设备: {eq}/{ROWS*COLS} ({eq/(ROWS*COLS):.0%})  "
+    print(f"  设备: {eq}/{usable} ({eq/usable:.0%})  "
           f"有效: {'YES' if valid else 'NO'}  人: {people}  路径: {non_eq - people}")
     print()
-    print("     " + " ".join(f"{c:2d}" for c in range(COLS)))
-    print("    +" + "---" * COLS + "+")
-    for r in range(ROWS):
+    print("     " + " ".join(f"{c:2d}" for c in range(problem.cols)))
+    print("    +" + "---" * problem.cols + "+")
+    for r in range(problem.rows):
         s = f" {r:2d} |"
-        for c in range(COLS):
-            if grid[r][c] == 1:
+        for c in range(problem.cols):
+            i = r * problem.cols + c
+            if bits[i] == "1":
                 s += " E "
+            elif blocked[i] == "1":
+                s += " # "
             else:
-                adj = any(grid[nr][nc] == 1 for nr, nc in NEIGHBORS[(r, c)])
-                s += " P " if adj else " . "
+                s += " P " if people_bits[i] == "1" else " . "
         s += "|"
         print(s)
-    print("    +" + "---" * COLS + "+")
+    print("    +" + "---" * problem.cols + "+")
     return eq
 
 
 # ============================================================
-# 阶段1: 启发式求解
+# 解缓存
 # ============================================================
 
-def heuristic_solve():
-    """用多种模式+贪心+ILS找到好解"""
-    print("  [阶段1] 启发式求解")
-    print("  " + "-" * 50)
+SOLUTION_CACHE_FILE = "grid_solutions.json"
+
+
+class SolutionCache:
+    """
+    按问题定义（GridProblem.key）保存已知最好布局和已证明上界的 JSON 文件：
+      {key: {"rows", "cols", "board": 十六进制位棋盘, "devices", "bound", "optimal", "updated"}}
+    再次求解同一问题时，缓存布局作为启发式起点和 CP-SAT 提示，上下界直接加进模型；已证明最优时不再求解。
+    只有对原问题成立的上界才能写入（legacy 模型固定了根，它的"上界"不是原问题的上界）。
+    """
+
+    def __init__(self, path=SOLUTION_CACHE_FILE):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"  读取解缓存 {path} 失败: {e}")
+
+    def get(self, problem):
+        """返回 (位棋盘, 上界或 None, 是否已证明最优)，没有有效缓存时返回 None"""
+        entry = self.entries.get(problem.key())
+        if entry is None:
+            return None
+        board = int(entry["board"], 16)
+        if not is_valid(problem, board):
+            return None
+        return board, entry.get("bound"), entry.get("optimal", False)
+
+    def record(self, problem, board, bound=None, optimal=False):
+        """合并一次求解结果：保留设备更多的布局和更紧的上界，有变化时写回文件"""
+        if board is None or not is_valid(problem, board):
+            return
+        old = self.entries.get(problem.key(), {})
+        entry = dict(old, rows=problem.rows, cols=problem.cols)
+        entry.pop("updated", None)
+        devices = count_eq(board)
+        if devices > old.get("devices", -1):
+            entry["board"] = format(board, "x")
+            entry["devices"] = devices
+        if optimal:
+            bound = devices
+        if bound is not None and (entry.get("bound") is None or bound < entry["bound"]):
+            entry["bound"] = bound
+        entry["optimal"] = entry.get("bound") is not None and entry["bound"] <= entry["devices"]
+        if entry == {k: v for k, v in old.items() if k != "updated"}:
+            return
+        entry["updated"] = _time.strftime("%Y-%m-%d %H:%M:%S")
+        self.entries[problem.key()] = entry
+        self.save()
+
+    def save(self):
+        temp_file = self.path + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(temp_file, self.path)
 
-    patterns = []
+
+# ============================================================
+# 阶段1: 启发式求解
+# ============================================================
+
+def repair_pattern(problem, grid):
+    """
+    把按规则铺出来的模式套到具体问题上：去掉障碍格和固定留空格上的设备、补上固定设备，
+    再反复去掉没有空邻居的设备。结果有效则返回位棋盘，否则返回 None。
+    """
+    board = (problem.to_board(grid) & problem.open & ~problem.fixed_empty) | problem.fixed_device
+    while True:
+        stuck = board & ~problem.fixed_device & ~problem.spread(problem.open & ~board)
+        if not stuck:
+            break
+        board &= ~stuck
+    return board if is_valid(problem, board) else None
+
+
+def generate_patterns(problem):
+    """
+    按问题尺寸生成初始模式。通道列/通道行的间距随尺寸伸缩，大地图上每隔一段就有一条竖直通道，
+    各种模式都经 repair_pattern 适配障碍和固定格，只保留有效的。
+    """
+    rows, cols = problem.rows, problem.cols
+    # 竖直通道列：两侧和中间，以及大地图上每隔约 12 列一条
+    path_col_sets = [[0], [cols // 2], [cols - 1]]
+    if cols > 16:
+        for spacing in (8, 12):
+            path_col_sets.append(list(range(spacing // 2, cols, spacing)))
+    raw = []
 
     # 模式族: 2行设备 + 1行通道, 不同偏移和通道列
     for offset in range(3):
-        for path_col in [0, COLS//2, COLS-1]:
-            grid = [[0] * COLS for _ in range(ROWS)]
-            for r in range(ROWS):
+        for path_cols in path_col_sets:
+            grid = [[0] * cols for _ in range(rows)]
+            for r in range(rows):
                 if (r - offset) % 3 < 2:
-                    for c in range(COLS):
-                        grid[r][c] = 1
-                    grid[r][path_col] = 0
-            if is_valid(grid):
-                patterns.append(grid)
+                    grid[r] = [1] * cols
+                    for pc in path_cols:
+                        grid[r][pc] = 0
+            raw.append(grid)
 
     # 棋盘模式
     for parity in [0, 1]:
-        grid = [[0] * COLS for _ in range(ROWS)]
-        for r in range(ROWS):
-            for c in range(COLS):
-                if (r + c) % 2 == parity:
-                    grid[r][c] = 1
-        if is_valid(grid):
-            patterns.append(grid)
+        raw.append([[1 if (r + c) % 2 == parity else 0 for c in range(cols)] for r in range(rows)])
 
     # 隔行模式 + 竖直通道
-    for path_col in [0, COLS//2, COLS-1]:
-        grid = [[0] * COLS for _ in range(ROWS)]
-        for r in range(ROWS):
-            if r % 2 == 1:
-                for c in range(COLS):
-                    grid[r][c] = 1
-                grid[r][path_col] = 0
-        if is_valid(grid):
-            patterns.append(grid)
+    for path_cols in path_col_sets:
+        grid = [[0] * cols for _ in range(rows)]
+        for r in range(1, rows, 2):
+            grid[r] = [1] * cols
+            for pc in path_cols:
+                grid[r][pc] = 0
+        raw.append(grid)
 
     # 全1, 不同通道行间距 + 竖直通道
     for spacing in [3, 4]:
         for start_row in range(spacing):
-            for path_col in [0, COLS//2, COLS-1]:
-                grid = [[1] * COLS for _ in range(ROWS)]
-                for r in range(ROWS):
-                    grid[r][path_col] = 0
-                for r in range(start_row, ROWS, spacing):
-                    for c in range(COLS):
-                        grid[r][c] = 0
-                # 修复无邻居设备
-                for _ in range(5):
-                    for r in range(ROWS):
-                        for c in range(COLS):
-                            if grid[r][c] == 1:
-                                if not any(grid[nr][nc] == 0 for nr, nc in NEIGHBORS[(r, c)]):
-                                    grid[r][c] = 0
-                if is_valid(grid):
-                    patterns.append(grid)
+            for path_cols in path_col_sets:
+                grid = [[1] * cols for _ in range(rows)]
+                for r in range(rows):
+                    for pc in path_cols:
+                        grid[r][pc] = 0
+                for r in range(start_row, rows, spacing):
+                    grid[r] = [0] * cols
+                raw.append(grid)
 
+    patterns = []
+    seen = set()
+    for grid in raw:
+        board = repair_pattern(problem, grid)
+        if board is not None and board not in seen:
+            seen.add(board)
+            patterns.append(board)
+    if not patterns and is_valid(problem, problem.fixed_device):
+        patterns.append(problem.fixed_device)  # 障碍太多、规则模式都不适用时从空布局开始
+    return patterns
+
+
+SEARCH_ENGINES = ("ils", "sa")
+
+
+def heuristic_solve(problem, workers=1, budget=60, starts=(), search="ils"):
+    """
+    用多种模式+贪心+ILS找到好解，starts 为额外的起点布局（如解缓存中的已知最好布局）。
+    search="sa" 时顺序搜索阶段改用模拟退火（simulated_annealing）。
+    workers > 1 时贪心之后改用 portfolio_search 多进程并行搜索 budget 秒，否则按原来的顺序 ILS。
+    """
+    print("  [阶段1] 启发式求解")
+    print("  " + "-" * 50)
+
+    patterns = generate_patterns(problem)
     print(f"  生成 {len(patterns)} 个基础模式")
+    extra = [board for board in starts if board not in patterns and is_valid(problem, board)]
+    if extra:
+        patterns.extend(extra)
+        print(f"  加入 {len(extra)} 个缓存布局作为起点")
+    if not patterns:
+        raise ValueError("找不到任何有效的初始布局：请检查障碍是否把可通行区域分隔开，或固定格是否互相矛盾")
 
     # 多次贪心填充
-    best_grid = None
-    best_score = 0
+    best_board = None
+    best_score = -1
     results = []
 
-    for i, grid in enumerate(patterns):
-        g, eq = multi_greedy(grid, trials=15)
-        results.append((eq, [row[:] for row in g]))
+    for i, board in enumerate(patterns):
+        g, eq = multi_greedy(problem, board, trials=15)
+        results.append((eq, g))
         if eq > best_score:
             best_score = eq
-            best_grid = [row[:] for row in g]
+            best_board = g
 
     results.sort(key=lambda x: -x[0])
     print(f"  贪心最优: {best_score}")
 
+    if workers > 1:
+        best_board, best_score = portfolio_search(
+            problem, [board for _, board in results[:workers]], workers=workers, budget=budget)
+        print(f"  启发式最优: {best_score}")
+        return best_board, best_score
+
     # ILS深度搜索前几名
     for i in range(min(5, len(results))):
-        eq, grid = results[i]
-        g, eq2 = iterated_local_search(grid, iterations=500, remove_range=(2, 10))
+        eq, board = results[i]
+        if search == "sa":
+            g, eq2 = simulated_annealing(problem, board)
+        else:
+            g, eq2 = iterated_local_search(problem, board, iterations=500, remove_range=(2, 10))
         if eq2 > best_score:
             best_score = eq2
-            best_grid = [row[:] for row in g]
-            print(f"  ILS改善: {eq} -> {eq2}")
+            best_board = g
+            print(f"  {search.upper()}改善: {eq} -> {eq2}")
 
     # 深度搜索最优解
     for trial in range(20):
-        g, eq = iterated_local_search(best_grid, iterations=300, remove_range=(3, 15))
+        if search == "sa":
+            g, eq = simulated_annealing(problem, best_board)
+        else:
+            g, eq = iterated_local_search(problem, best_board, iterations=300, remove_range=(3, 15))
         if eq > best_score:
             best_score = eq
-            best_grid = [row[:] for row in g]
+            best_board = g
             print(f"  深度搜索改善: {eq}")
 
     print(f"  启发式最优: {best_score}")
-    return best_grid, best_score
+    return best_board, best_score
+
+
+# ============================================================
+# 多进程组合搜索（portfolio）
+# ============================================================
+
+# 各条 ILS 链轮流使用的移除范围：小范围精修、大范围跳出局部最优
+PORTFOLIO_REMOVE_RANGES = [(2, 10), (3, 15), (2, 6), (4, 20)]
+
+_incumbent = None  # 子进程中的共享最优解：(Value 设备数, Array 十六进制位棋盘)，由 _init_portfolio_worker 设置
+
+
+def _init_portfolio_worker(best_score, best_bits):
+    global _incumbent
+    _incumbent = (best_score, best_bits)
+
+
+def _exchange_incumbent(eq, board):
+    """本链更好时发布到共享最优解，返回发布后的共享 (设备数, 位棋盘)"""
+    best_score, best_bits = _incumbent
+    with best_score.get_lock():
+        if eq > best_score.value:
+            best_score.value = eq
+            best_bits.value = format(board, "x").encode()
+            return eq, board
+        return best_score.value, int(best_bits.value, 16)
+
+
+def _portfolio_chain(task):
+    """
+    一条独立的 ILS 链：每 sync_every 次迭代与共享最优解交换一次，
+    落后共享最优 adopt_gap 个及以上设备时改从共享最优继续，到 deadline 为止。
+    """
+    problem, board, seed, remove_range, deadline, sync_every, adopt_gap = task
+    random.seed(seed)
+    best_board, best = board, count_eq(board)
+    iterations = 0
+    while _time.time() < deadline:
+        best_board, best = iterated_local_search(problem, best_board, sync_every, remove_range)
+        iterations += sync_every
+        shared, shared_board = _exchange_incumbent(best, best_board)
+        if shared - best >= adopt_gap:
+            best_board, best = shared_board, shared
+    return best, best_board, iterations
+
+
+def portfolio_search(problem, starts, workers=None, budget=60, seed=None, sync_every=50, adopt_gap=2):
+    """
+    多进程并行的多起点 ILS：workers 条链分别从 starts 中的布局出发（不足时循环使用），
+    使用不同随机种子和移除范围，通过共享内存中的最优解互通有无，墙钟时间 budget 秒后停止。
+    返回 (最优位棋盘, 设备数)。
+    """
+    workers = workers or os.cpu_count() or 1
+    best_board = max(starts, key=count_eq)
+    best_score = multiprocessing.Value("i", count_eq(best_board))
+    best_bits = multiprocessing.Array("c", problem.cells // 4 + 2)
+    best_bits.value = format(best_board, "x").encode()
+    base_seed = random.randrange(2 ** 31) if seed is None else seed
+    t0 = _time.time()
+    deadline = t0 + budget
+    tasks = [
+        (problem, starts[k % len(starts)], base_seed + k,
+         PORTFOLIO_REMOVE_RANGES[k % len(PORTFOLIO_REMOVE_RANGES)], deadline, sync_every, adopt_gap)
+        for k in range(workers)
+    ]
+    print(f"  组合搜索: {workers} 条 ILS 链并行, 限时 {budget:g} 秒")
+    with multiprocessing.Pool(workers, initializer=_init_portfolio_worker, initargs=(best_score, best_bits)) as pool:
+        result = pool.map_async(_portfolio_chain, tasks)
+        reported = best_score.value
+        while not result.ready():
+            result.wait(1)
+            if best_score.value > reported:
+                reported = best_score.value
+                print(f"  组合搜索改善: {reported} ({_time.time() - t0:.0f}秒)")
+        chains = result.get()
+
+    best, best_board, _ = max(chains, key=lambda chain: chain[0])
+    print(f"  共 {sum(chain[2] for chain in chains)} 次 ILS 迭代, "
+          f"各链结果: {', '.join(str(chain[0]) for chain in chains)}")
+    return best_board, best
 
 
 # ============================================================
 # 阶段2: CP-SAT 精确求解（带初始提示）
 # ============================================================
 
-def cpsat_solve(hint_grid=None, time_limit=300):
-    """CP-SAT精确求解，可选初始提示"""
-    install_pkg('ortools')
-    from ortools.sat.python import cp_model
+CPSAT_FORMULATIONS = ("rooted", "legacy")
 
-    print(f"\n  [阶段2] CP-SAT 精确求解 (限时{time_limit}秒)")
-    print("  " + "-" * 50)
 
+def symmetric_flips(problem):
+    """问题在上下翻转（"rows"）/左右翻转（"cols"）下不变时返回对应的翻转，用于对称性破缺"""
+    if problem.entry is not None:
+        return []
+    masks = (problem.blocked, problem.fixed_device, problem.fixed_empty)
+    return [axis for axis in ("rows", "cols") if all(problem.flip(mask, axis) == mask for mask in masks)]
+
+
+def _half_masks(problem, axis):
+    """翻转轴两侧的两半（奇数时不含中间一行/列）"""
+    first = second = 0
+    for i in range(problem.cells):
+        r, c = divmod(i, problem.cols)
+        pos, size = (r, problem.rows) if axis == "rows" else (c, problem.cols)
+        if pos < size // 2:
+            first |= 1 << i
+        elif pos >= size - size // 2:
+            second |= 1 << i
+    return first, second
+
+
+def canonical_board(problem, board, flips):
+    """把布局翻转到满足对称性破缺约束（前一半设备数不少于后一半）的等价布局，用于提示"""
+    for axis in flips:
+        first, second = _half_masks(problem, axis)
+        if popcount(board & first) < popcount(board & second):
+            board = problem.flip(board, axis)
+    return board
+
+
+def _add_legacy_connectivity(model, problem, cells, e, ne):
+    """原模型：每条有向边一个 0..N 的流变量，用 OnlyEnforceIf 关闭设备格上的流；有入口时以入口为根，否则固定第一个可用格为根"""
+    N = len(cells)
+    root = problem.entry if problem.entry is not None else cells[0]
+    model.Add(e[root] == 0)
+
+    f = {}
+    for i in cells:
+        for j in problem.neighbors[i]:
+            f[i, j] = model.NewIntVar(0, N, f'f_{i}_{j}')
+
+    for i in cells:
+        if i == root:
+            continue
+        nbrs = problem.neighbors[i]
+        inflow = sum(f[j, i] for j in nbrs)
+        outflow = sum(f[i, j] for j in nbrs)
+        model.Add(inflow - outflow >= 1).OnlyEnforceIf(ne[i])
+        model.Add(inflow == 0).OnlyEnforceIf(e[i])
+        model.Add(outflow == 0).OnlyEnforceIf(e[i])
+
+    for i in cells:
+        for j in problem.neighbors[i]:
+            model.Add(f[i, j] == 0).OnlyEnforceIf(e[i])
+            model.Add(f[i, j] == 0).OnlyEnforceIf(e[j])
+
+
+def _add_rooted_connectivity(model, problem, cells, e, ne):
+    """
+    单商品流模型：根由布尔变量 root[i] 选出（有入口时固定为入口），根可以发出任意流量，
+    其余每个非设备格消耗 1 个单位；边上的流量用线性容量约束 f <= (N-1)*ne 关闭，不用 OnlyEnforceIf。
+    没有入口时规定根是下标最小的非设备格（对称性破缺：每个解只对应一个根）。
+    """
+    N = len(cells)
+    candidates = [problem.entry] if problem.entry is not None else [
+        i for i in cells if not (problem.fixed_device >> i) & 1]
+    root = {i: model.NewBoolVar(f'root_{i}') for i in candidates}
+    model.AddExactlyOne(root.values())
+    for i, var in root.items():
+        model.AddImplication(var, ne[i])
+
+    if problem.entry is None:
+        # seen[i] = 根在 i 或之前；根之前的格子都必须是设备
+        seen = None
+        for i in cells:
+            current = model.NewBoolVar(f'seen_{i}')
+            model.Add(current == (seen if seen is not None else 0) + root.get(i, 0))
+            model.Add(ne[i] <= current)
+            seen = current
+
+    f = {}
+    for i in cells:
+        for j in problem.neighbors[i]:
+            f[i, j] = model.NewIntVar(0, N - 1, f'f_{i}_{j}')
+            model.Add(f[i, j] <= (N - 1) * ne[i])
+            model.Add(f[i, j] <= (N - 1) * ne[j])
+
+    for i in cells:
+        nbrs = problem.neighbors[i]
+        inflow = sum(f[j, i] for j in nbrs)
+        outflow = sum(f[i, j] for j in nbrs)
+        model.Add(inflow - outflow >= ne[i] - N * root.get(i, 0))
+        # 有效切割：非设备格不止一个时，每个非设备格至少有一个非设备邻居
+        if N > 5:
+            model.Add(ne[i] <= sum(ne[j] for j in nbrs))
+
+
+def build_cpsat_model(problem, formulation="rooted"):
+    """
+    建立 CP-SAT 模型，返回 (model, e, flips)：e 为各可用格的设备变量，flips 为已加入对称性破缺约束的翻转轴。
+    formulation 为 "rooted"（单商品流 + 对称性破缺）或 "legacy"（原网络流模型）。
+    """
+    from ortools.sat.python import cp_model
+
+    if formulation not in CPSAT_FORMULATIONS:
+        raise ValueError(f"未知的 CP-SAT 模型: {formulation}，可选 {', '.join(CPSAT_FORMULATIONS)}")
     model = cp_model.CpModel()
-    N = ROWS * COLS
+    cells = [i for i in range(problem.cells) if (problem.open >> i) & 1]
 
     e = {}
     ne = {}
-    for r in range(ROWS):
-        for c in range(COLS):
-            e[r, c] = model.NewBoolVar(f'e_{r}_{c}')
-            ne[r, c] = model.NewBoolVar(f'ne_{r}_{c}')
-            model.Add(e[r, c] + ne[r, c] == 1)
-
-    model.Maximize(sum(e[r, c] for r in range(ROWS) for c in range(COLS)))
+    for i in cells:
+        r, c = divmod(i, problem.cols)
+        e[i] = model.NewBoolVar(f'e_{r}_{c}')
+        ne[i] = model.NewBoolVar(f'ne_{r}_{c}')
+        model.Add(e[i] + ne[i] == 1)
+        if (problem.fixed_device >> i) & 1:
+            model.Add(e[i] == 1)
+        if (problem.fixed_empty >> i) & 1:
+            model.Add(e[i] == 0)
+
+    model.Maximize(sum(e[i] for i in cells))
 
     # 约束1: 每个设备至少有一个非设备邻居
-    for r in range(ROWS):
-        for c in range(COLS):
-            nbrs = NEIGHBORS[(r, c)]
-            model.Add(e[r, c] <= sum(ne[nr, nc] for nr, nc in nbrs))
+    for i in cells:
+        model.Add(e[i] <= sum(ne[j] for j in problem.neighbors[i]))
+
+    # 约束2: 连通性
+    flips = []
+    if formulation == "legacy":
+        _add_legacy_connectivity(model, problem, cells, e, ne)
+    else:
+        _add_rooted_connectivity(model, problem, cells, e, ne)
+        # 镜像对称：只保留前一半设备数不少于后一半的解（上下、左右两个方向相互独立）
+        flips = symmetric_flips(problem)
+        for axis in flips:
+            first, second = _half_masks(problem, axis)
+            model.Add(sum(e[i] for i in cells if (first >> i) & 1)
+                      >= sum(e[i] for i in cells if (second >> i) & 1))
+    return model, e, flips
+
+
+def cpsat_solve(problem, hint_board=None, time_limit=300, formulation="rooted", lower_bound=None, upper_bound=None):
+    """CP-SAT精确求解，可选初始提示和已知的设备数上下界（下界必须有可行解达到）"""
+    install_pkg('ortools')
+    from ortools.sat.python import cp_model
 
-    # 约束2: 连通性（网络流）
-    model.Add(e[0, 0] == 0)
+    print(f"\n  [阶段2] CP-SAT 精确求解 (模型 {formulation}, 限时{time_limit}秒)")
+    print("  " + "-" * 50)
 
-    f = {}
-    for r in range(ROWS):
-        for c in range(COLS):
-            for nr, nc in NEIGHBORS[(r, c)]:
-                f[r, c, nr, nc] = model.NewIntVar(0, N, f'f_{r}_{c}_{nr}_{nc}')
-
-    for r in range(ROWS):
-        for c in range(COLS):
-            if r == 0 and c == 0:
-                continue
-            nbrs = NEIGHBORS[(r, c)]
-            inflow = sum(f[nr, nc, r, c] for nr, nc in nbrs)
-            outflow = sum(f[r, c, nr, nc] for nr, nc in nbrs)
-            model.Add(inflow - outflow >= 1).OnlyEnforceIf(ne[r, c])
-            model.Add(inflow == 0).OnlyEnforceIf(e[r, c])
-            model.Add(outflow == 0).OnlyEnforceIf(e[r, c])
-
-    for r in range(ROWS):
-        for c in range(COLS):
-            for nr, nc in NEIGHBORS[(r, c)]:
-                model.Add(f[r, c, nr, nc] == 0).OnlyEnforceIf(e[r, c])
-                model.Add(f[r, c, nr, nc] == 0).OnlyEnforceIf(e[nr, nc])
+    model, e, flips = build_cpsat_model(problem, formulation)
+    if lower_bound is not None:
+        model.Add(sum(e.values()) >= lower_bound)
+    if upper_bound is not None:
+        model.Add(sum(e.values()) <= upper_bound)
+        print(f"  已知上界: {upper_bound}")
 
     # 提供初始解提示
-    if hint_grid:
-        for r in range(ROWS):
-            for c in range(COLS):
-                model.AddHint(e[r, c], hint_grid[r][c])
-        print(f"  提供了启发式解作为初始提示 (设备={count_eq(hint_grid)})")
+    if hint_board is not None:
+        hint = canonical_board(problem, hint_board, flips)
+        for i, var in e.items():
+            model.AddHint(var, (hint >> i) & 1)
+        print(f"  提供了启发式解作为初始提示 (设备={count_eq(hint_board)})")
 
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = time_limit
@@ -335,8 +940,8 @@ def cpsat_solve(hint_grid=None, time_limit=300):
     status = solver.Solve(model)
 
     if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-        grid = [[solver.Value(e[r, c]) for c in range(COLS)] for r in range(ROWS)]
-        eq = count_eq(grid)
+        board = sum(1 << i for i, var in e.items() if solver.Value(var))
+        eq = count_eq(board)
         status_str = "OPTIMAL" if status == cp_model.OPTIMAL else "FEASIBLE"
         bound = int(solver.BestObjectiveBound())
         print(f"  状态: {status_str}")
@@ -345,22 +950,319 @@ def cpsat_solve(hint_grid=None, time_limit=300):
             print(f"  >>> 已证明最优! <<<")
         else:
             print(f"  最优解在 [{eq}, {bound}] 之间")
-        return grid, eq, bound, status_str
+        return board, eq, bound, status_str
     else:
         print(f"  求解失败")
         return None, 0, 0, "FAILED"
 
 
+CPSAT_COMPARE_SIZES = [(5, 5), (6, 6), (6, 7), (7, 7), (7, 8)]
+
+
+def compare_cpsat_models(sizes=CPSAT_COMPARE_SIZES, time_limit=60):
+    """不带提示地用两种模型分别求解若干小尺寸，比较证明最优所需的时间"""
+    install_pkg('ortools')
+    from ortools.sat.python import cp_model
+
+    print(f"  {'尺寸':>6} {'模型':>8} {'状态':>9} {'设备':>5} {'上界':>5} {'耗时(s)':>8}")
+    for rows, cols in sizes:
+        problem = GridProblem(rows, cols)
+        for formulation in CPSAT_FORMULATIONS:
+            model, e, _ = build_cpsat_model(problem, formulation)
+            solver = cp_model.CpSolver()
+            solver.parameters.max_time_in_seconds = time_limit
+            solver.parameters.num_workers = 8
+            status = solver.Solve(model)
+            found = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+            eq = int(solver.ObjectiveValue()) if found else 0
+            bound = int(solver.BestObjectiveBound()) if found else 0
+            print(f"  {rows:>2}x{cols:<3} {formulation:>8} {solver.StatusName(status):>9} {eq:>5} {bound:>5} "
+                  f"{solver.WallTime():>8.2f}")
+
+
+# ============================================================
+# 分解求解：重叠窗口 + 大邻域搜索（LNS）
+# ============================================================
+
+_window_problem = None  # 子进程中的问题定义，由 _init_window_worker 设置
+
+
+def _init_window_worker(problem):
+    global _window_problem
+    _window_problem = problem
+
+
+def window_rects(problem, size, overlap):
+    """把方格切成 size x size、相互重叠 overlap 行/列的窗口，返回 [((行序号, 列序号), (r0, c0, r1, c1))]"""
+    step = max(size - overlap, 1)
+
+    def starts(n):
+        if n <= size:
+            return [0]
+        return list(range(0, n - size, step)) + [n - size]
+
+    return [((ti, tj), (r0, c0, min(r0 + size, problem.rows), min(c0 + size, problem.cols)))
+            for ti, r0 in enumerate(starts(problem.rows))
+            for tj, c0 in enumerate(starts(problem.cols))]
+
+
+def window_batches(rects, margin=1):
+    """
+    把窗口分成可以并行求解的批次：同一批中任意两个窗口之间至少隔 margin 格（不重叠也不相邻），
+    按窗口顺序贪心放入第一个不冲突的批次。末尾窗口的起点被推到 n - size，不能只按行/列序号奇偶分批。
+    """
+    def conflict(a, b):
+        return (a[0] < b[2] + margin and b[0] < a[2] + margin
+                and a[1] < b[3] + margin and b[1] < a[3] + margin)
+
+    batches = []
+    for _, rect in rects:
+        for batch in batches:
+            if not any(conflict(rect, other) for other in batch):
+                batch.append(rect)
+                break
+        else:
+            batches.append([rect])
+    return batches
+
+
+def _free_components(problem, free):
+    """free 中各连通分量的掩码"""
+    comps = []
+    while free:
+        reach = free & -free
+        while True:
+            grown = (reach | problem.spread(reach)) & free
+            if grown == reach:
+                break
+            reach = grown
+        comps.append(reach)
+        free &= ~reach
+    return comps
+
+
+def _solve_window(task):
+    """
+    固定窗口外的布局，用 CP-SAT 重新优化窗口内的格子。返回改进后的窗口内设备位，无改进时返回 None。
+    窗口外的每个非设备连通分量缩成一个始终非设备的超级节点（与窗口内相邻格子连边），
+    连通性要求窗口内的非设备格和所有超级节点连成一体，这样窗口模型的可行解就是整个布局的可行解。
+    """
+    from ortools.sat.python import cp_model
+
+    board, (r0, c0, r1, c1), time_limit, seed, threads = task
+    problem = _window_problem
+    window = [r * problem.cols + c for r in range(r0, r1) for c in range(c0, c1)
+              if (problem.open >> (r * problem.cols + c)) & 1]
+    wmask = sum(1 << i for i in window)
+    outside_free = problem.open & ~board & ~wmask
+    comps = _free_components(problem, outside_free)
+    halo = problem.spread(wmask)
+    if not comps or any(not comp & halo for comp in comps):
+        return None  # 窗口外没有人走的区域，或有分量只能经由窗口以外连通：跳过这个窗口
+
+    model = cp_model.CpModel()
+    e = {}
+    for i in window:
+        e[i] = model.NewBoolVar(f'e_{i}')
+        if (problem.fixed_device >> i) & 1:
+            model.Add(e[i] == 1)
+        if (problem.fixed_empty >> i) & 1:
+            model.Add(e[i] == 0)
+    current = popcount(board & wmask)
+    model.Add(sum(e.values()) >= current)
+    model.Maximize(sum(e.values()))
+
+    # 约束1: 窗口内的设备、以及与窗口相邻的窗口外设备，都至少有一个非设备邻居
+    halo_devices = [d for d, bit in enumerate(problem.cell_bits(halo & board & ~wmask)) if bit == "1"]
+    for i in window + halo_devices:
+        if problem.neighbor_mask[i] & outside_free:
+            continue
+        inside = [j for j in problem.neighbors[i] if j in e]
+        if i in e:
+            model.Add(e[i] <= sum(1 - e[j] for j in inside))
+        else:
+            model.Add(sum(1 - e[j] for j in inside) >= 1)
+
+    # 约束2: 以第一个超级节点为根的单商品流
+    nodes = window + [("comp", k) for k in range(len(comps))]
+    N = len(nodes)
+    edges = [(i, j) for i in window for j in problem.neighbors[i] if j in e]
+    for i in window:
+        for k, comp in enumerate(comps):
+            if problem.neighbor_mask[i] & comp:
+                edges += [(i, ("comp", k)), (("comp", k), i)]
+    f = {}
+    for a, b in edges:
+        f[a, b] = model.NewIntVar(0, N - 1, f'f_{a}_{b}')
+        for node in (a, b):
+            if node in e:
+                model.Add(f[a, b] <= (N - 1) * (1 - e[node]))
+    inflow = {node: [] for node in nodes}
+    outflow = {node: [] for node in nodes}
+    for a, b in edges:
+        outflow[a].append(f[a, b])
+        inflow[b].append(f[a, b])
+    for node in nodes:
+        if node == ("comp", 0):
+            continue
+        demand = 1 - e[node] if node in e else 1
+        model.Add(sum(inflow[node]) - sum(outflow[node]) >= demand)
+
+    # 完整的提示：当前布局，以及从根出发的 BFS 生成树上的流量（树边流量 = 子树中的节点数）
+    for i in window:
+        model.AddHint(e[i], (board >> i) & 1)
+    root = ("comp", 0)
+    parent = {root: None}
+    order = [root]
+    adjacent = {node: [] for node in nodes}
+    for a, b in edges:
+        adjacent[a].append(b)
+    for node in order:
+        for nxt in adjacent[node]:
+            if nxt not in parent and (nxt not in e or not (board >> nxt) & 1):
+                parent[nxt] = node
+                order.append(nxt)
+    subtree = dict.fromkeys(order, 1)
+    for node in reversed(order[1:]):
+        subtree[parent[node]] += subtree[node]
+    for (a, b), var in f.items():
+        model.AddHint(var, subtree[b] if parent.get(b) == a else 0)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    solver.parameters.num_workers = threads
+    solver.parameters.random_seed = seed
+    status = solver.Solve(model)
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE) or solver.ObjectiveValue() <= current:
+        return None
+    return wmask, sum(1 << i for i in window if solver.Value(e[i]))
+
+
+def decomposition_solve(problem, board, window=12, overlap=4, time_per_window=3, workers=None, budget=300,
+                        max_rounds=20, seed=0):
+    """
+    大地图的分解求解：把方格切成重叠窗口，固定窗口外的布局逐个用 CP-SAT 重新优化窗口，
+    一轮中所有窗口都没有改进、达到 max_rounds 或用完 budget 秒时停止。
+    互不重叠且至少隔一格的一批窗口（见 window_batches）在进程池中并行求解（窗口少于进程数时每个窗口多开 CP-SAT 线程），结果按顺序合并，
+    合并后用 is_valid 再检查一次（同批窗口各自假设其他窗口不变）。返回 (位棋盘, 设备数)。
+    """
+    rects = window_rects(problem, window, overlap)
+    if len(rects) == 1:
+        print("  窗口覆盖整个方格，改用整体 CP-SAT")
+        result, eq, _, _ = cpsat_solve(problem, hint_board=board, time_limit=budget)
+        return (result, eq) if result is not None and eq >= count_eq(board) else (board, count_eq(board))
+
+    workers = workers or os.cpu_count() or 1
+    batches = window_batches(rects)
+    print(f"\n  [阶段2] 分解求解: {len(rects)} 个 {window}x{window} 窗口 (重叠 {overlap}, 分 {len(batches)} 批), "
+          f"{workers} 个进程, 每个窗口限时 {time_per_window:g} 秒, 总限时 {budget:g} 秒")
+    print("  " + "-" * 50)
+
+    t0 = _time.time()
+    deadline = t0 + budget
+    best = count_eq(board)
+    with multiprocessing.Pool(workers, initializer=_init_window_worker, initargs=(problem,)) as pool:
+        for round_no in range(1, max_rounds + 1):
+            start = best
+            for batch in batches:
+                remaining = deadline - _time.time()
+                if remaining <= 1:
+                    break
+                threads = max(1, workers // len(batch))  # 一批窗口比进程少时，多出的核给每个窗口的 CP-SAT
+                tasks = [(board, rect, min(time_per_window, remaining), seed + round_no, threads) for rect in batch]
+                for result in pool.map(_solve_window, tasks):
+                    if result is None:
+                        continue
+                    wmask, bits = result
+                    candidate = (board & ~wmask) | bits
+                    if count_eq(candidate) > best and is_valid(problem, candidate):
+                        board, best = candidate, count_eq(candidate)
+            print(f"  第 {round_no} 轮: {start} -> {best} ({_time.time() - t0:.0f}秒)")
+            if best == start or _time.time() >= deadline - 1:
+                break
+    return board, best
+
+
+# ============================================================
+# 规模基准
+# ============================================================
+
+BENCHMARK_SIZES = [(10, 11), (20, 20), (30, 40), (40, 60)]
+
+
+def benchmark(sizes=BENCHMARK_SIZES, ils_iterations=50, seed=0):
+    """不同尺寸下各阶段的耗时：生成模式、一次贪心填充、ILS 每次迭代"""
+    print(f"  {'尺寸':>8} {'格子':>6} {'模式':>5} {'生成(s)':>8} {'贪心(s)':>8} {'ILS/次(ms)':>11} {'设备':>6}")
+    for rows, cols in sizes:
+        random.seed(seed)
+        problem = GridProblem(rows, cols)
+        t0 = _time.perf_counter()
+        patterns = generate_patterns(problem)
+        t1 = _time.perf_counter()
+        board = greedy_fill(problem, patterns[0])
+        t2 = _time.perf_counter()
+        board, eq = iterated_local_search(problem, board, iterations=ils_iterations)
+        t3 = _time.perf_counter()
+        print(f"  {rows:>3}x{cols:<4} {problem.cells:>6} {len(patterns):>5} {t1 - t0:>8.3f} {t2 - t1:>8.3f} "
+              f"{(t3 - t2) / ils_iterations * 1000:>11.1f} {eq:>6}")
+
+
 # ============================================================
 # 主函数
 # ============================================================
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="方格设备摆放优化器")
+    parser.add_argument("--rows", type=int, default=ROWS, help=f"行数，默认 {ROWS}")
+    parser.add_argument("--cols", type=int, default=COLS, help=f"列数，默认 {COLS}")
+    parser.add_argument("--map", help="文本地图文件（. 自由 # 障碍 E 固定设备 P 固定留空 S 入口），给定时忽略 --rows/--cols")
+    parser.add_argument("--time-limit", type=float, default=300, help="CP-SAT 限时（秒），默认 300")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="启发式阶段并行的 ILS 链数（进程数），默认 1 为顺序搜索；0 表示使用全部 CPU")
+    parser.add_argument("--budget", type=float, default=60, help="并行搜索的墙钟时间（秒），默认 60，仅 --workers 不为 1 时有效")
+    parser.add_argument("--search", choices=SEARCH_ENGINES, default="ils",
+                        help="顺序启发式阶段的局部搜索：ils 迭代局部搜索（默认），sa 模拟退火")
+    parser.add_argument("--compare-search", type=float, metavar="SECONDS",
+                        help="在当前问题上用同样时间比较 ILS 与模拟退火后退出")
+    parser.add_argument("--no-cpsat", action="store_true", help="只运行启发式阶段")
+    parser.add_argument("--cpsat-model", choices=CPSAT_FORMULATIONS, default="rooted",
+                        help="CP-SAT 连通性模型：rooted 单商品流+对称性破缺（默认），legacy 原网络流模型")
+    parser.add_argument("--decompose", action="store_true",
+                        help="阶段2改用分解求解（重叠窗口 LNS），适合大地图；--time-limit 为总限时")
+    parser.add_argument("--window", type=int, default=12, help="分解求解的窗口边长，默认 12")
+    parser.add_argument("--overlap", type=int, default=4, help="相邻窗口重叠的行/列数，默认 4")
+    parser.add_argument("--window-time", type=float, default=3, help="每个窗口的 CP-SAT 限时（秒），默认 3")
+    parser.add_argument("--cache", default=SOLUTION_CACHE_FILE, help=f"解缓存文件，默认 {SOLUTION_CACHE_FILE}")
+    parser.add_argument("--no-cache", action="store_true", help="不读取也不写入解缓存")
+    parser.add_argument("--force", action="store_true", help="缓存中已有证明最优的解时仍重新求解")
+    parser.add_argument("--compare-cpsat", action="store_true", help="比较两种 CP-SAT 模型在小尺寸上证明最优的时间后退出")
+    parser.add_argument("--benchmark", action="store_true", help="输出不同尺寸下的运行时间后退出")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+    if args.benchmark:
+        benchmark()
+        return
+    if args.compare_cpsat:
+        compare_cpsat_models(time_limit=args.time_limit)
+        return
+    if args.map:
+        with open(args.map, encoding="utf-8") as f:
+            problem = GridProblem.from_text(f.read())
+    else:
+        problem = GridProblem(args.rows, args.cols)
+
+    if args.compare_search:
+        compare_local_search(problem, seconds=args.compare_search)
+        return
+
     print()
     print("=" * 60)
-    print("  10x11 方格设备摆放优化器")
+    print(f"  {problem.rows}x{problem.cols} 方格设备摆放优化器")
     print("=" * 60)
-    print(f"  格子: {ROWS} x {COLS} = {ROWS*COLS}")
+    print(f"  格子: {problem.describe()}")
     print(f"  约束:")
     print(f"    1. 每个设备必须与至少一个人相邻(上下左右)")
     print(f"    2. 所有非设备格必须连通(人能走过去)")
@@ -370,30 +1272,61 @@ def main():
 
     t0 = _time.time()
 
-    # 阶段1: 启发式
-    heuristic_grid, heuristic_score = heuristic_solve()
+    cache = None if args.no_cache else SolutionCache(args.cache)
+    cached = cache.get(problem) if cache else None
+    known_bound = None
+    if cached:
+        cached_board, known_bound, cached_optimal = cached
+        print(f"  解缓存: 已知 {count_eq(cached_board)} 个设备"
+              + (f", 上界 {known_bound}" if known_bound is not None else "")
+              + (" (已证明最优)" if cached_optimal else ""))
+
+    if cached and cached_optimal and not args.force:
+        final_board = cached_board
+        final_score = count_eq(cached_board)
+        bound, status, method = final_score, "OPTIMAL", "解缓存"
+    else:
+        # 阶段1: 启发式（缓存布局作为额外起点）
+        workers = args.workers if args.workers > 0 else os.cpu_count() or 1
+        heuristic_board, heuristic_score = heuristic_solve(
+            problem, workers=workers, budget=args.budget, starts=[cached_board] if cached else (),
+            search=args.search)
+
+        # 阶段2: CP-SAT (带提示)；只有 rooted 模型的解空间与原问题一致，才能加入已知上下界、写回上界
+        cpsat_board, cpsat_score, bound, status = None, 0, 0, "SKIPPED"
+        exact = args.cpsat_model == "rooted"
+        if args.decompose and not args.no_cpsat:
+            cpsat_board, cpsat_score = decomposition_solve(
+                problem, heuristic_board, window=args.window, overlap=args.overlap,
+                time_per_window=args.window_time, workers=workers, budget=args.time_limit)
+            status = "LNS"
+        elif not args.no_cpsat:
+            cpsat_board, cpsat_score, bound, status = cpsat_solve(
+                problem, hint_board=heuristic_board, time_limit=args.time_limit, formulation=args.cpsat_model,
+                lower_bound=heuristic_score if exact else None, upper_bound=known_bound if exact else None,
+            )
+
+        # 最终结果
+        if cpsat_board is not None and cpsat_score >= heuristic_score:
+            final_board = cpsat_board
+            final_score = cpsat_score
+            method = "分解求解 (LNS)" if status == "LNS" else f"CP-SAT ({status})"
+        else:
+            final_board = heuristic_board
+            final_score = heuristic_score
+            method = "启发式"
 
-    # 阶段2: CP-SAT (带提示)
-    cpsat_grid, cpsat_score, bound, status = cpsat_solve(
-        hint_grid=heuristic_grid, time_limit=300
-    )
+        if cache:
+            proven = exact and status in ("OPTIMAL", "FEASIBLE")
+            cache.record(problem, final_board, bound=bound if proven else None,
+                         optimal=exact and status == "OPTIMAL")
 
     elapsed = _time.time() - t0
 
-    # 最终结果
-    if cpsat_grid and cpsat_score >= heuristic_score:
-        final_grid = cpsat_grid
-        final_score = cpsat_score
-        method = f"CP-SAT ({status})"
-    else:
-        final_grid = heuristic_grid
-        final_score = heuristic_score
-        method = "启发式"
-
     print(f"\n{'=' * 60}")
     print(f"  最终结果 (方法: {method})")
     print(f"{'=' * 60}")
-    print_grid(final_grid)
+    print_grid(problem, final_board)
 
     if status == "FEASIBLE":
         print(f"\n  注: CP-SAT上界={bound}, 最优解在[{final_score}, {bound}]之间")
@@ -401,8 +1334,8 @@ def main():
         print(f"\n  已证明 {final_score} 是最优解!")
 
     print(f"\n  原始数据 (1=设备, 0=非设备):")
-    for r in range(ROWS):
-        print(f"    {final_grid[r]}")
+    for row in problem.to_grid(final_board):
+        print(f"    {row}")
 
     print(f"\n  总耗时: {elapsed:.1f}秒")
     print()
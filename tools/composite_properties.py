@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+
+@dataclass(frozen=True)
+class Component:
+    name: str
+    density_g_cm3: float
+    cp_j_g_k: float
+    density_std_g_cm3: float = 0.0
+    cp_std_j_g_k: float = 0.0
+
+
+@dataclass(frozen=True)
+class CompositeSeries:
+    volume_fraction: np.ndarray
+    diffusivity_mm2_s: np.ndarray
+    diffusivity_std_mm2_s: np.ndarray
+    density_g_cm3: np.ndarray
+    cp_j_g_k: np.ndarray
+    thermal_conductivity_w_m_k: np.ndarray
+    thermal_conductivity_std_w_m_k: np.ndarray
+    method: str
+
+
+def composite_density(phi: ArrayLike, filler_density: ArrayLike, matrix_density: ArrayLike) -> np.ndarray:
+    phi = np.asarray(phi, dtype=float)
+    return phi * filler_density + (1.0 - phi) * matrix_density
+
+
+def filler_mass_fraction(phi: ArrayLike, filler_density: ArrayLike, matrix_density: ArrayLike) -> np.ndarray:
+    phi = np.asarray(phi, dtype=float)
+    return phi * filler_density / composite_density(phi, filler_density, matrix_density)
+
+
+def composite_cp(
+    phi: ArrayLike,
+    filler_density: ArrayLike,
+    matrix_density: ArrayLike,
+    filler_cp: ArrayLike,
+    matrix_cp: ArrayLike,
+) -> np.ndarray:
+    """Mass-weighted rule of mixtures."""
+    mass_fraction = filler_mass_fraction(phi, filler_density, matrix_density)
+    return mass_fraction * filler_cp + (1.0 - mass_fraction) * matrix_cp
+
+
+def thermal_conductivity(alpha_mm2_s: ArrayLike, density_g_cm3: ArrayLike, cp_j_g_k: ArrayLike) -> np.ndarray:
+    # mm^2/s * g/cm^3 * J/g/K -> (1e-6 m^2/s) * (1e3 kg/m^3) * (1e3 J/kg/K) = W/m/K
+    return np.asarray(alpha_mm2_s, dtype=float) * density_g_cm3 * cp_j_g_k
+
+
+def _linear_std(
+    phi: np.ndarray,
+    phi_std: np.ndarray,
+    alpha: np.ndarray,
+    alpha_std: np.ndarray,
+    filler: Component,
+    matrix: Component,
+) -> np.ndarray:
+    # k = alpha * (phi * rho_f * cp_f + (1 - phi) * rho_m * cp_m), first-order propagation
+    # assuming independent inputs (see evaluate_series for the error model).
+    volumetric_cp = phi * filler.density_g_cm3 * filler.cp_j_g_k + (1.0 - phi) * matrix.density_g_cm3 * matrix.cp_j_g_k
+    terms = (
+        volumetric_cp * alpha_std,
+        alpha * (filler.density_g_cm3 * filler.cp_j_g_k - matrix.density_g_cm3 * matrix.cp_j_g_k) * phi_std,
+        alpha * phi * filler.cp_j_g_k * filler.density_std_g_cm3,
+        alpha * phi * filler.density_g_cm3 * filler.cp_std_j_g_k,
+        alpha * (1.0 - phi) * matrix.cp_j_g_k * matrix.density_std_g_cm3,
+        alpha * (1.0 - phi) * matrix.density_g_cm3 * matrix.cp_std_j_g_k,
+    )
+    return np.sqrt(sum(np.square(term) for term in terms))
+
+
+def _monte_carlo_std(
+    phi: np.ndarray,
+    phi_std: np.ndarray,
+    alpha: np.ndarray,
+    alpha_std: np.ndarray,
+    filler: Component,
+    matrix: Component,
+    n_samples: int,
+    seed: int | None,
+) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    shape = (n_samples, phi.size)
+
+    def draw(mean: ArrayLike, std: ArrayLike, size: tuple[int, ...]) -> np.ndarray:
+        return rng.normal(mean, std, size=size)
+
+    phi_draw = np.clip(draw(phi, phi_std, shape), 0.0, 1.0)
+    alpha_draw = draw(alpha, alpha_std, shape)
+    # component properties are drawn independently for every sample, as in _linear_std
+    rho_f = draw(filler.density_g_cm3, filler.density_std_g_cm3, shape)
+    rho_m = draw(matrix.density_g_cm3, matrix.density_std_g_cm3, shape)
+    cp_f = draw(filler.cp_j_g_k, filler.cp_std_j_g_k, shape)
+    cp_m = draw(matrix.cp_j_g_k, matrix.cp_std_j_g_k, shape)
+
+    density = composite_density(phi_draw, rho_f, rho_m)
+    cp = composite_cp(phi_draw, rho_f, rho_m, cp_f, cp_m)
+    return thermal_conductivity(alpha_draw, density, cp).std(axis=0, ddof=1)
+
+
+def evaluate_series(
+    volume_fraction: ArrayLike,
+    diffusivity_mm2_s: ArrayLike,
+    diffusivity_std_mm2_s: ArrayLike,
+    filler: Component,
+    matrix: Component,
+    volume_fraction_std: ArrayLike = 0.0,
+    monte_carlo_samples: int = 0,
+    seed: int | None = None,
+) -> CompositeSeries:
+    """Evaluate density, Cp and k for a whole filler/matrix series in one call.
+
+    Uncertainty is propagated to first order by default; with ``monte_carlo_samples``
+    >= 2 the std is taken from that many normal draws of every input instead.
+    Both methods use the same error model: every input, including the component
+    density and Cp, is an independent normal error for each sample of the series.
+    """
+    if monte_carlo_samples < 0 or monte_carlo_samples == 1:
+        raise ValueError("monte_carlo_samples must be 0 (linear propagation) or at least 2")
+    phi, phi_std, alpha, alpha_std = (
+        np.ravel(array).astype(float)
+        for array in np.broadcast_arrays(
+            volume_fraction, volume_fraction_std, diffusivity_mm2_s, diffusivity_std_mm2_s
+        )
+    )
+
+    density = composite_density(phi, filler.density_g_cm3, matrix.density_g_cm3)
+    cp = composite_cp(phi, filler.density_g_cm3, matrix.density_g_cm3, filler.cp_j_g_k, matrix.cp_j_g_k)
+    conductivity = thermal_conductivity(alpha, density, cp)
+
+    if monte_carlo_samples > 0:
+        conductivity_std = _monte_carlo_std(
+            phi, phi_std, alpha, alpha_std, filler, matrix, monte_carlo_samples, seed
+        )
+        method = f"monte_carlo[{monte_carlo_samples}]"
+    else:
+        conductivity_std = _linear_std(phi, phi_std, alpha, alpha_std, filler, matrix)
+        method = "linear"
+
+    return CompositeSeries(
+        volume_fraction=phi,
+        diffusivity_mm2_s=alpha,
+        diffusivity_std_mm2_s=alpha_std,
+        density_g_cm3=density,
+        cp_j_g_k=cp,
+        thermal_conductivity_w_m_k=conductivity,
+        thermal_conductivity_std_w_m_k=conductivity_std,
+        method=method,
+    )
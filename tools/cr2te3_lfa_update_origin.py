@@ -2,16 +2,20 @@ from __future__ import annotations
 
 import argparse
 import csv
+import io
 import shutil
 import tempfile
 import zipfile
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Iterable, List, Sequence
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
 import xml.etree.ElementTree as ET
 
 import originpro as op
 
+from composite_properties import Component, evaluate_series
+
 
 ROOM_TEMPERATURE_C = 25.0
 CR2TE3_CP_J_G_K = 0.256
@@ -41,20 +45,6 @@ def _copy_if_needed(path: Path) -> Path:
         return copied
 
 
-def _parse_shared_strings(archive: zipfile.ZipFile) -> List[str]:
-    try:
-        xml_bytes = archive.read("xl/sharedStrings.xml")
-    except KeyError:
-        return []
-    root = ET.fromstring(xml_bytes)
-    ns = {"a": root.tag.split("}")[0].strip("{")}
-    values: List[str] = []
-    for si in root.findall("a:si", ns):
-        text_parts = [node.text or "" for node in si.findall(".//a:t", ns)]
-        values.append("".join(text_parts))
-    return values
-
-
 def _sheet_path_by_name(archive: zipfile.ZipFile, sheet_name: str) -> str:
     workbook_root = ET.fromstring(archive.read("xl/workbook.xml"))
     ns = {"a": workbook_root.tag.split("}")[0].strip("{")}
@@ -80,28 +70,96 @@ def _sheet_path_by_name(archive: zipfile.ZipFile, sheet_name: str) -> str:
     return target
 
 
-def _read_sheet_values(xlsx_path: Path, sheet_name: str) -> Dict[str, str]:
-    actual_path = _copy_if_needed(xlsx_path)
-    with zipfile.ZipFile(actual_path) as archive:
-        shared_strings = _parse_shared_strings(archive)
-        sheet_path = _sheet_path_by_name(archive, sheet_name)
-        root = ET.fromstring(archive.read(sheet_path))
-        ns = {"a": root.tag.split("}")[0].strip("{")}
-        values: Dict[str, str] = {}
-        for cell in root.findall(".//a:c", ns):
-            ref = cell.attrib.get("r")
-            if not ref:
-                continue
-            value_node = cell.find("a:v", ns)
-            text = value_node.text if value_node is not None else ""
-            if cell.attrib.get("t") == "s" and text:
-                text = shared_strings[int(text)]
-            values[ref] = text or ""
-        return values
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+class _WorkbookCells:
+    """Streams cells out of an xlsx on demand; the archive is read once per path."""
+
+    def __init__(self, xlsx_path: Path) -> None:
+        self._xlsx_path = xlsx_path
+        actual_path = _copy_if_needed(xlsx_path)
+        self._archive = zipfile.ZipFile(io.BytesIO(actual_path.read_bytes()))
+        self._sheet_paths: Dict[str, str] = {}
+        # sheet name -> cell ref -> value, None marks a ref already known to be absent
+        self._cells: Dict[str, Dict[str, Optional[str]]] = {}
+        self._shared_strings: List[str] = []
+        self._shared_string_iter: Optional[Iterator[str]] = None
+
+    def read(self, sheet_name: str, refs: Iterable[str]) -> Dict[str, str]:
+        refs = list(refs)
+        cached = self._cells.setdefault(sheet_name, {})
+        missing = {ref for ref in refs if ref not in cached}
+        if missing:
+            cached.update(self._scan_sheet(sheet_name, missing))
+        return {ref: cached[ref] for ref in refs if cached[ref] is not None}
+
+    def _sheet_path(self, sheet_name: str) -> str:
+        if sheet_name not in self._sheet_paths:
+            self._sheet_paths[sheet_name] = _sheet_path_by_name(self._archive, sheet_name)
+        return self._sheet_paths[sheet_name]
+
+    def _scan_sheet(self, sheet_name: str, wanted: set[str]) -> Dict[str, Optional[str]]:
+        found: Dict[str, Optional[str]] = {ref: None for ref in wanted}
+        remaining = set(wanted)
+        with self._archive.open(self._sheet_path(sheet_name)) as handle:
+            for _, elem in ET.iterparse(handle, events=("end",)):
+                tag = _local_name(elem.tag)
+                if tag == "c":
+                    ref = elem.attrib.get("r")
+                    if ref in remaining:
+                        value_node = next(
+                            (child for child in elem if _local_name(child.tag) == "v"), None
+                        )
+                        text = value_node.text if value_node is not None else ""
+                        if elem.attrib.get("t") == "s" and text:
+                            text = self._shared_string(int(text))
+                        found[ref] = text or ""
+                        remaining.discard(ref)
+                        if not remaining:
+                            break
+                elif tag == "row":
+                    elem.clear()
+        return found
+
+    def _shared_string(self, index: int) -> str:
+        if self._shared_string_iter is None:
+            self._shared_string_iter = self._iter_shared_strings()
+        while len(self._shared_strings) <= index:
+            text = next(self._shared_string_iter, None)
+            if text is None:
+                raise ValueError(
+                    f"{self._xlsx_path}: shared string index {index} out of range "
+                    f"(sharedStrings.xml has {len(self._shared_strings)} entries)"
+                )
+            self._shared_strings.append(text)
+        return self._shared_strings[index]
+
+    def _iter_shared_strings(self) -> Iterator[str]:
+        try:
+            handle = self._archive.open("xl/sharedStrings.xml")
+        except KeyError:
+            return
+        with handle:
+            for _, elem in ET.iterparse(handle, events=("end",)):
+                if _local_name(elem.tag) == "si":
+                    yield "".join(
+                        node.text or "" for node in elem.iter() if _local_name(node.tag) == "t"
+                    )
+                    elem.clear()
+
+
+@lru_cache(maxsize=None)
+def _workbook_cells(xlsx_path: Path) -> _WorkbookCells:
+    return _WorkbookCells(xlsx_path)
+
+
+def _read_cells(xlsx_path: Path, sheet_name: str, refs: Iterable[str]) -> Dict[str, str]:
+    return _workbook_cells(xlsx_path.resolve()).read(sheet_name, refs)
 
 
 def _read_actual_volume_fractions(xlsx_path: Path) -> Dict[int, float]:
-    sheet_values = _read_sheet_values(xlsx_path, "Sheet2")
     row_to_sample = {
         9: 1,
         10: 2,
@@ -110,6 +168,7 @@ def _read_actual_volume_fractions(xlsx_path: Path) -> Dict[int, float]:
         13: 5,
         14: 6,
     }
+    sheet_values = _read_cells(xlsx_path, "Sheet2", (f"E{row}" for row in row_to_sample))
     result: Dict[int, float] = {}
     for row, sample_number in row_to_sample.items():
         key = f"E{row}"
@@ -120,7 +179,7 @@ def _read_actual_volume_fractions(xlsx_path: Path) -> Dict[int, float]:
 
 
 def _read_component_densities(xlsx_path: Path) -> tuple[float, float]:
-    sheet_values = _read_sheet_values(xlsx_path, "Sheet2")
+    sheet_values = _read_cells(xlsx_path, "Sheet2", ("B1", "B2"))
     filler_density = float(sheet_values["B1"])
     matrix_density = float(sheet_values["B2"])
     return filler_density, matrix_density
@@ -131,57 +190,54 @@ def _load_diffusivity_rows(csv_path: Path) -> List[Dict[str, str]]:
         return list(csv.DictReader(handle))
 
 
-def _mass_fraction(phi: float, filler_density: float, composite_density: float) -> float:
-    return phi * filler_density / composite_density
-
-
-def _composite_density(phi: float, filler_density: float, matrix_density: float) -> float:
-    return phi * filler_density + (1.0 - phi) * matrix_density
-
-
-def _composite_cp(phi: float, filler_density: float, matrix_density: float) -> float:
-    density = _composite_density(phi, filler_density, matrix_density)
-    filler_mass_fraction = _mass_fraction(phi, filler_density, density)
-    return filler_mass_fraction * CR2TE3_CP_J_G_K + (1.0 - filler_mass_fraction) * PDMS_CP_J_G_K
-
-
 def compute_results(
     diffusivity_csv: Path,
     vf_workbook: Path,
+    density_rel_std: float = 0.0,
+    cp_rel_std: float = 0.0,
+    monte_carlo_samples: int = 0,
 ) -> List[SampleResult]:
     volume_fractions = _read_actual_volume_fractions(vf_workbook)
     filler_density, matrix_density = _read_component_densities(vf_workbook)
-    results: List[SampleResult] = []
-
-    for row in _load_diffusivity_rows(diffusivity_csv):
-        sample_number = int(row["sample_number"])
-        phi = volume_fractions[sample_number]
-        diffusivity_mm2_s = float(row["mean_diffusivity_mm2_s"])
-        diffusivity_std_mm2_s = float(row["stddev_diffusivity_mm2_s"])
-        density = _composite_density(phi, filler_density, matrix_density)
-        cp = _composite_cp(phi, filler_density, matrix_density)
-
-        alpha_m2_s = diffusivity_mm2_s * 1e-6
-        alpha_std_m2_s = diffusivity_std_mm2_s * 1e-6
-        density_kg_m3 = density * 1000.0
-        cp_j_kg_k = cp * 1000.0
-        thermal_conductivity = alpha_m2_s * density_kg_m3 * cp_j_kg_k
-        thermal_conductivity_std = alpha_std_m2_s * density_kg_m3 * cp_j_kg_k
-
-        results.append(
-            SampleResult(
-                sample_number=sample_number,
-                volume_fraction=phi,
-                diffusivity_mm2_s=diffusivity_mm2_s,
-                diffusivity_std_mm2_s=diffusivity_std_mm2_s,
-                density_g_cm3=density,
-                cp_j_g_k=cp,
-                thermal_conductivity_w_m_k=thermal_conductivity,
-                thermal_conductivity_std_w_m_k=thermal_conductivity_std,
-            )
-        )
+    filler = Component(
+        "Cr2Te3",
+        filler_density,
+        CR2TE3_CP_J_G_K,
+        density_std_g_cm3=filler_density * density_rel_std,
+        cp_std_j_g_k=CR2TE3_CP_J_G_K * cp_rel_std,
+    )
+    matrix = Component(
+        "RTV615/PDMS",
+        matrix_density,
+        PDMS_CP_J_G_K,
+        density_std_g_cm3=matrix_density * density_rel_std,
+        cp_std_j_g_k=PDMS_CP_J_G_K * cp_rel_std,
+    )
+
+    rows = _load_diffusivity_rows(diffusivity_csv)
+    sample_numbers = [int(row["sample_number"]) for row in rows]
+    series = evaluate_series(
+        [volume_fractions[number] for number in sample_numbers],
+        [float(row["mean_diffusivity_mm2_s"]) for row in rows],
+        [float(row["stddev_diffusivity_mm2_s"]) for row in rows],
+        filler,
+        matrix,
+        monte_carlo_samples=monte_carlo_samples,
+    )
 
-    return results
+    return [
+        SampleResult(
+            sample_number=sample_number,
+            volume_fraction=float(series.volume_fraction[index]),
+            diffusivity_mm2_s=float(series.diffusivity_mm2_s[index]),
+            diffusivity_std_mm2_s=float(series.diffusivity_std_mm2_s[index]),
+            density_g_cm3=float(series.density_g_cm3[index]),
+            cp_j_g_k=float(series.cp_j_g_k[index]),
+            thermal_conductivity_w_m_k=float(series.thermal_conductivity_w_m_k[index]),
+            thermal_conductivity_std_w_m_k=float(series.thermal_conductivity_std_w_m_k[index]),
+        )
+        for index, sample_number in enumerate(sample_numbers)
+    ]
 
 
 def export_results_csv(results: Sequence[SampleResult], output_csv: Path) -> None:
@@ -215,7 +271,11 @@ def export_results_csv(results: Sequence[SampleResult], output_csv: Path) -> Non
             )
 
 
-def update_origin_project(origin_path: Path, results: Sequence[SampleResult]) -> None:
+def update_origin_project(
+    origin_path: Path,
+    results: Sequence[SampleResult],
+    std_comment: str = "Propagated from diffusivity std dev only",
+) -> None:
     op.set_show(False)
     op.open(str(origin_path), readonly=False, asksave=False)
     try:
@@ -276,7 +336,7 @@ def update_origin_project(origin_path: Path, results: Sequence[SampleResult]) ->
             [item.thermal_conductivity_std_w_m_k for item in results],
             lname="Thermal Conductivity Std Dev",
             units="W/m/K",
-            comments="Propagated from diffusivity std dev only",
+            comments=std_comment,
             axis="E",
         )
 
@@ -344,7 +404,28 @@ def main() -> None:
         default=None,
         help="Optional output path. If provided, copy the Origin project and modify the copy.",
     )
+    parser.add_argument(
+        "--density-rel-std",
+        type=float,
+        default=0.0,
+        help="Relative std of both component densities, propagated into k_std.",
+    )
+    parser.add_argument(
+        "--cp-rel-std",
+        type=float,
+        default=0.0,
+        help="Relative std of both component Cp values, propagated into k_std.",
+    )
+    parser.add_argument(
+        "--monte-carlo",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Estimate k_std from N Monte Carlo draws instead of first-order propagation.",
+    )
     args = parser.parse_args()
+    if args.monte_carlo < 0 or args.monte_carlo == 1:
+        parser.error("--monte-carlo needs at least 2 draws (0 uses first-order propagation)")
 
     origin_target = args.origin_project
     if args.origin_out:
@@ -352,9 +433,21 @@ def main() -> None:
         shutil.copy2(args.origin_project, args.origin_out)
         origin_target = args.origin_out
 
-    results = compute_results(args.diffusivity_csv, args.vf_workbook)
+    results = compute_results(
+        args.diffusivity_csv,
+        args.vf_workbook,
+        density_rel_std=args.density_rel_std,
+        cp_rel_std=args.cp_rel_std,
+        monte_carlo_samples=args.monte_carlo,
+    )
     export_results_csv(results, args.output_csv)
-    update_origin_project(origin_target, results)
+    if args.density_rel_std or args.cp_rel_std:
+        std_comment = "Propagated from diffusivity, density and Cp std dev"
+    else:
+        std_comment = "Propagated from diffusivity std dev only"
+    if args.monte_carlo:
+        std_comment += f" ({args.monte_carlo} Monte Carlo draws)"
+    update_origin_project(origin_target, results, std_comment=std_comment)
     print_summary(results)
     print(f"Updated Origin project: {origin_target}")
     print(f"Exported CSV: {args.output_csv}")
@@ -0,0 +1,250 @@
+import os
+import sqlite3
+import sys
+import threading
+
+from copy_scheduler import COPY_BUFFER_SIZE, TEMP_SUFFIX, copy_file, temp_path
+
+STORE_DB_NAME = "objects.sqlite3"
+LINK_MODES = ("auto", "reflink", "hardlink")
+DEFAULT_MIN_SIZE = 64 * 1024  # 小于该大小的文件不做去重，链接开销不划算
+FICLONE = 0x40049409  # Linux ioctl：在支持的文件系统（Btrfs、XFS）上创建写时复制副本
+
+
+def reflink(source, dest):
+    """创建写时复制副本（reflink），不支持时抛出 OSError"""
+    if not sys.platform.startswith("linux"):
+        raise OSError("当前平台不支持 reflink")
+    import fcntl
+
+    with open(source, "rb") as fsrc, open(dest, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dest)
+            raise
+
+
+class ContentStore:
+    """
+    内容寻址的去重存储：
+      store_root/objects/<哈希前两位>/<哈希> 保存每种内容的一份实体，样品/仪器目录中的文件
+      以 reflink（写时复制）或硬链接的形式引用它，相同内容只占一份磁盘空间。
+    同步时对每个待复制文件：
+      1. 存储中有同样大小的对象时才读取 U 盘文件计算哈希，命中则直接链接，不再写入内容；
+      2. 否则正常复制，复制完成后经 HashIndex 取得数据库侧哈希（同时写入哈希索引），
+         再以该文件创建对象，供以后去重。
+    注意：硬链接的各个引用共享同一份数据，原地修改其中一个会影响全部引用（包括对象本身）；
+    程序自身的覆盖都是"写临时文件再替换"，不会改动共享数据。因此每次链接前都重新计算对象的哈希，
+    与记录不符（被原地修改过）的对象作废，不会再被链接到新的位置。需要严格的写时复制语义时把 link_mode 设为 reflink。
+    store_root 必须与数据库在同一文件系统上（硬链接和 reflink 都不能跨卷）。
+    """
+
+    def __init__(self, store_root, hash_index, hash_func, algorithm, link_mode="auto",
+                 min_size=DEFAULT_MIN_SIZE):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"未知的链接方式: {link_mode}，可选 {', '.join(LINK_MODES)}")
+        self.store_root = store_root
+        self.hash_index = hash_index
+        self.hash_func = hash_func
+        self.algorithm = algorithm
+        self.link_mode = link_mode
+        self.min_size = min_size
+        self.linked_files = 0
+        self.linked_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(store_root, "objects"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(store_root, STORE_DB_NAME), check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS objects (
+                digest TEXT NOT NULL,
+                algorithm TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                method TEXT NOT NULL,
+                PRIMARY KEY (digest, algorithm)
+            );
+            CREATE INDEX IF NOT EXISTS idx_objects_size ON objects(size, algorithm);
+            """
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, config, repo_root, hash_index, hash_func, algorithm):
+        """config.json 中设置了 dedup_store（相对路径相对于数据库根目录）时返回 ContentStore，否则返回 None"""
+        store_root = config.get("dedup_store")
+        if not store_root:
+            return None
+        return cls(
+            os.path.join(repo_root, store_root),
+            hash_index,
+            hash_func,
+            algorithm,
+            link_mode=config.get("dedup_link", "auto"),
+            min_size=int(float(config.get("dedup_min_kb", DEFAULT_MIN_SIZE / 1024)) * 1024),
+        )
+
+    def object_path(self, digest):
+        return os.path.join(self.store_root, "objects", digest[:2], digest)
+
+    def _has_size(self, size):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM objects WHERE size = ? AND algorithm = ? LIMIT 1", (size, self.algorithm)
+            ).fetchone() is not None
+
+    def _find(self, digest, size):
+        """
+        返回仍然存在且内容与 digest 一致的对象路径。硬链接对象可能经数据库中的某个引用被原地修改，
+        大小一致时仍重新计算对象的哈希（读取本地磁盘，不读 U 盘）；失效的记录和对象文件顺便删除。
+        """
+        obj = self.object_path(digest)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size FROM objects WHERE digest = ? AND algorithm = ?", (digest, self.algorithm)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            valid = os.stat(obj).st_size == size == row[0] and self.hash_func(obj) == digest
+        except OSError:
+            valid = False
+        if valid:
+            return obj
+        print(f"去重对象已失效（被删除或修改过），不再使用: {obj}")
+        try:
+            os.remove(obj)  # 只删除对象自身的目录项，引用它的数据库文件保持不变
+        except OSError:
+            pass
+        with self._lock:
+            self._conn.execute("DELETE FROM objects WHERE digest = ? AND algorithm = ?", (digest, self.algorithm))
+            self._conn.commit()
+        return None
+
+    def _clone(self, source, dest):
+        """按 link_mode 创建 source 的 reflink 或硬链接 dest（dest 不能已存在），返回使用的方式"""
+        if self.link_mode in ("auto", "reflink"):
+            try:
+                reflink(source, dest)
+                return "reflink"
+            except OSError:
+                if self.link_mode == "reflink":
+                    raise
+        os.link(source, dest)
+        return "hardlink"
+
+    def _link(self, obj, dest):
+        """把 dest 原子地替换为引用 obj 的 reflink 或硬链接，返回使用的方式"""
+        temp_file = temp_path(dest)
+        if os.path.lexists(temp_file):
+            os.remove(temp_file)
+        method = self._clone(obj, temp_file)
+        os.replace(temp_file, dest)
+        return method
+
+    def add(self, file_path, digest=None):
+        """把数据库中的文件登记进存储：对象不存在时以该文件创建对象，已存在则把文件改为引用该对象"""
+        try:
+            size = os.stat(file_path).st_size
+        except OSError as e:
+            print(f"获取 {file_path} 状态时出错: {e}")
+            return None
+        if size < self.min_size:
+            return None
+        if digest is None:
+            digest = self.hash_index.get_hash(file_path, self.hash_func, self.algorithm)
+            if digest is None:
+                return None
+        obj = self._find(digest, size)
+        if obj is None:
+            obj = self.object_path(digest)
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            if os.path.lexists(obj):
+                os.remove(obj)  # 记录已失效的残留对象
+            try:
+                method = self._clone(file_path, obj)
+            except OSError as e:
+                print(f"无法登记到去重存储: {file_path}: {e}")
+                return None
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO objects (digest, algorithm, size, method) VALUES (?, ?, ?, ?)",
+                    (digest, self.algorithm, size, method))
+                self._conn.commit()
+        elif not os.path.samefile(obj, file_path):
+            self._link(obj, file_path)
+            self.hash_index.forget(file_path)
+            with self._lock:
+                self.linked_files += 1
+                self.linked_bytes += size
+        return obj
+
+    def copy_or_link(self, source, dest, buffer_size=COPY_BUFFER_SIZE):
+        """
+        CopyScheduler 的复制函数：能去重时链接到已有对象并返回 None，否则复制并登记，返回复制的字节数。
+        """
+        size = os.stat(source).st_size
+        if size >= self.min_size and self._has_size(size):
+            digest = self.hash_func(source)
+            obj = self._find(digest, size) if digest else None
+            if obj is not None:
+                method = self._link(obj, dest)
+                with self._lock:
+                    self.linked_files += 1
+                    self.linked_bytes += size
+                print(f"去重（{method}）:\n  {source}\n  -> {dest}")
+                return None
+        copied = copy_file(source, dest, buffer_size)
+        self.add(dest)
+        return copied
+
+    def deduplicate_tree(self, root):
+        """把 root 下已有的文件全部登记进存储，内容重复的文件改为引用同一对象，返回节省的字节数"""
+        before = self.linked_bytes
+        store_root = os.path.abspath(self.store_root)
+        for folder, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(folder, d)) != store_root]
+            for file in files:
+                if file.endswith(TEMP_SUFFIX):
+                    continue
+                self.add(os.path.join(folder, file))
+        return self.linked_bytes - before
+
+    def collect_garbage(self):
+        """
+        删除已没有任何目录引用的硬链接对象（链接数为 1），返回删除的对象数。
+        reflink 对象与引用它的文件互相独立，无法据链接数判断，不做清理。
+        """
+        removed = 0
+        with self._lock:
+            rows = self._conn.execute("SELECT digest FROM objects WHERE algorithm = ? AND method = 'hardlink'",
+                                      (self.algorithm,)).fetchall()
+        for (digest,) in rows:
+            obj = self.object_path(digest)
+            try:
+                if os.stat(obj).st_nlink > 1:
+                    continue
+                os.remove(obj)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"删除对象 {obj} 失败: {e}")
+                continue
+            with self._lock:
+                self._conn.execute("DELETE FROM objects WHERE digest = ? AND algorithm = ?", (digest, self.algorithm))
+            removed += 1
+        with self._lock:
+            self._conn.commit()
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,369 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEVICE_PROFILE_FILE = "device_profiles.json"
+JOURNAL_FILE = "copy_journal.sqlite3"
+TEMP_SUFFIX = ".usbsync-part"  # 复制中的临时文件后缀，完成后原子重命名为目标文件
+COPY_BUFFER_SIZE = 8 * 1024 * 1024  # 复制缓冲区 8 MB
+DEFAULT_READ_WORKERS = 2  # U 盘并发读取数（USB 2.0 上过多并发读反而更慢）
+DEFAULT_WRITE_WORKERS = 4  # 数据库（本地磁盘）并发写入数，同时也是并发复制数的上限
+MAX_READ_WORKERS = 16
+TUNE_INTERVAL = 2.0  # 自适应调节的测速窗口（秒）
+
+
+#############################################
+# 单文件复制
+#############################################
+def _copy_range(src_fd, dst_fd, size, buffer_size):
+    """Linux 下优先用 copy_file_range / sendfile 在内核中复制，返回已复制字节数"""
+    copied = 0
+    for name in ("copy_file_range", "sendfile"):
+        func = getattr(os, name, None)
+        if func is None:
+            continue
+        try:
+            while copied < size:
+                if name == "copy_file_range":
+                    n = func(src_fd, dst_fd, min(buffer_size, size - copied))
+                else:
+                    n = func(dst_fd, src_fd, copied, min(buffer_size, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            return copied
+        except OSError:
+            if copied:
+                raise
+    return None
+
+
+def temp_path(dest):
+    return dest + TEMP_SUFFIX
+
+
+def copy_file(source, dest, buffer_size=COPY_BUFFER_SIZE):
+    """
+    大缓冲区复制文件内容并保留元数据（等价于 shutil.copy2），返回复制的字节数。
+    Linux 上走 copy_file_range/sendfile 零拷贝，其它平台用复用缓冲区的 readinto 循环。
+    内容先写入同目录下的临时文件并 fsync，再用 os.replace 原子替换目标文件：
+    中途拔出 U 盘或程序崩溃时，目标位置要么是旧文件、要么是完整的新文件，不会留下截断的文件。
+    """
+    temp_file = temp_path(dest)
+    try:
+        with open(source, "rb", buffering=0) as fsrc, open(temp_file, "wb", buffering=0) as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            copied = None
+            if sys.platform.startswith("linux"):
+                copied = _copy_range(fsrc.fileno(), fdst.fileno(), size, buffer_size)
+            if copied is None:
+                copied = 0
+                buffer = bytearray(buffer_size)
+                view = memoryview(buffer)
+                while True:
+                    n = fsrc.readinto(buffer)
+                    if not n:
+                        break
+                    fdst.write(view[:n])
+                    copied += n
+            if copied != size:
+                raise OSError(f"复制不完整：{copied} / {size} 字节")
+            os.fsync(fdst.fileno())
+        shutil.copystat(source, temp_file)
+        os.replace(temp_file, dest)
+    except BaseException:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
+    return copied
+
+
+#############################################
+# 并发上限可动态调整的信号量
+#############################################
+class AdjustableLimiter:
+    def __init__(self, limit):
+        self._limit = max(1, limit)
+        self._active = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def set_limit(self, limit):
+        with self._cond:
+            self._limit = max(1, limit)
+            self._cond.notify_all()
+
+    def __enter__(self):
+        with self._cond:
+            while self._active >= self._limit:
+                self._cond.wait()
+            self._active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+
+#############################################
+# 设备速度档案
+#############################################
+def device_key(usb_root):
+    """U 盘路径加卷设备号作为设备标识（Windows 上 st_dev 为卷序列号），换盘后不会误用旧档案"""
+    try:
+        return f"{os.path.normcase(os.path.abspath(usb_root))}|{os.stat(usb_root).st_dev}"
+    except OSError:
+        return os.path.normcase(os.path.abspath(usb_root))
+
+
+def load_device_profiles():
+    if os.path.exists(DEVICE_PROFILE_FILE):
+        try:
+            with open(DEVICE_PROFILE_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print("加载设备速度档案失败:", e)
+    return {}
+
+
+def save_device_profile(key, profile):
+    profiles = load_device_profiles()
+    profiles[key] = profile
+    try:
+        with open(DEVICE_PROFILE_FILE, "w", encoding="utf-8") as f:
+            json.dump(profiles, f, indent=4, ensure_ascii=False)
+    except Exception as e:
+        print("保存设备速度档案失败:", e)
+
+
+#############################################
+# 复制调度器
+#############################################
+class CopyScheduler:
+    """
+    限流的复制调度器：
+      - 每个复制任务在整个复制过程中占用一个槽，一个任务同时读 U 盘、写数据库，
+        因此并发复制数（读并发）不超过 write_workers，超过的 read_workers / max_read_workers 按 write_workers 截断；
+      - adaptive=True 时每 TUNE_INTERVAL 秒测一次吞吐量，在 1 到上限之间按爬山法增减读并发：
+        提高并发后吞吐量明显上升就继续提高，下降则退回；
+      - report() 给出本次会话的复制字节数、耗时、平均 MB/s 和最终读并发。
+    """
+
+    def __init__(self, read_workers=DEFAULT_READ_WORKERS, write_workers=DEFAULT_WRITE_WORKERS,
+                 buffer_size=COPY_BUFFER_SIZE, adaptive=True, max_read_workers=MAX_READ_WORKERS, store=None):
+        self.buffer_size = buffer_size
+        self.store = store  # ContentStore：设置后能去重的文件直接链接到已有内容
+        self.adaptive = adaptive
+        # 读并发的实际上限：复制任务同时占用读写两端，超过 write_workers 的读并发不会生效
+        self.max_read_workers = max(1, min(max(max_read_workers, read_workers), write_workers))
+        self._limiter = AdjustableLimiter(min(read_workers, self.max_read_workers))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_read_workers,
+                                            thread_name_prefix="copy")
+        self._lock = threading.Lock()
+        self._started = None
+        self._bytes = 0
+        self._files = 0
+        self._failed = 0
+        # 自适应调节状态
+        self._window_start = None
+        self._window_bytes = 0
+        self._last_rate = None
+        self._direction = 1
+
+    @classmethod
+    def from_config(cls, config, profile=None, store=None):
+        """从 config.json 读取 read_workers、write_workers、copy_buffer_mb、adaptive_workers，
+        设备档案中学到的读并发优先"""
+        profile = profile or {}
+        return cls(
+            read_workers=int(profile.get("read_workers", config.get("read_workers", DEFAULT_READ_WORKERS))),
+            write_workers=int(config.get("write_workers", DEFAULT_WRITE_WORKERS)),
+            buffer_size=int(float(config.get("copy_buffer_mb", COPY_BUFFER_SIZE / 1024 ** 2)) * 1024 ** 2),
+            adaptive=bool(config.get("adaptive_workers", True)),
+            max_read_workers=int(config.get("max_read_workers", MAX_READ_WORKERS)),
+            store=store,
+        )
+
+    @property
+    def read_workers(self):
+        return self._limiter.limit
+
+    def submit(self, source, dest):
+        """提交一个复制任务，返回 Future（结果为是否成功）"""
+        with self._lock:
+            if self._started is None:
+                self._started = self._window_start = time.time()
+        return self._executor.submit(self._copy, source, dest)
+
+    def _copy(self, source, dest):
+        try:
+            with self._limiter:
+                if self.store is not None:
+                    copied = self.store.copy_or_link(source, dest, self.buffer_size)
+                else:
+                    copied = copy_file(source, dest, self.buffer_size)
+            if copied is None:
+                copied = 0  # 已去重链接，没有实际复制内容
+            else:
+                print(f"Copied:\n  {source}\n  -> {dest}")
+        except Exception as e:
+            print(f"Error copying {source} -> {dest}: {e}")
+            with self._lock:
+                self._failed += 1
+            return False
+        with self._lock:
+            self._bytes += copied
+            self._files += 1
+            self._window_bytes += copied
+            if self.adaptive:
+                self._maybe_tune()
+        return True
+
+    def _maybe_tune(self):
+        now = time.time()
+        elapsed = now - self._window_start
+        if elapsed < TUNE_INTERVAL:
+            return
+        rate = self._window_bytes / elapsed
+        if self._last_rate is not None and rate < self._last_rate * 0.95:
+            self._direction = -self._direction  # 吞吐量下降：换个方向
+        new_limit = min(max(1, self.read_workers + self._direction), self.max_read_workers)
+        if new_limit != self.read_workers:
+            print(f"吞吐量 {rate / 1024 ** 2:.1f} MB/s，读并发调整为 {new_limit}")
+            self._limiter.set_limit(new_limit)
+        self._last_rate = rate
+        self._window_start = now
+        self._window_bytes = 0
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def report(self):
+        with self._lock:
+            elapsed = time.time() - self._started if self._started else 0.0
+            mb = self._bytes / 1024 ** 2
+            return {
+                "files": self._files,
+                "failed": self._failed,
+                "bytes": self._bytes,
+                "seconds": elapsed,
+                "mb_s": mb / elapsed if elapsed > 0 else 0.0,
+                "read_workers": self.read_workers,
+                "linked_files": self.store.linked_files if self.store is not None else 0,
+                "linked_bytes": self.store.linked_bytes if self.store is not None else 0,
+            }
+
+
+#############################################
+# 复制日志（断点续传）
+#############################################
+class CopyJournal:
+    """
+    正在执行的复制任务日志（SQLite）：
+      执行计划前把全部待复制条目（含最终目标路径）写入日志，每个文件复制完成后立即标记完成；
+      整次同步正常结束后清空。程序崩溃或 U 盘被拔出后，日志中仍有未完成条目，
+      下次启动时可以直接从这些条目继续复制，无需重新扫描和比较。
+    可在复制线程的回调中并发调用，内部用锁串行化 SQLite 访问。
+    """
+
+    def __init__(self, db_path=JOURNAL_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS session (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                item TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                dest TEXT NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        self._conn.commit()
+
+    def begin(self, info, copies):
+        """
+        开始新的复制会话：info 为 {repo_root, usb_root, started} 等会话信息，
+        copies 为 [(计划条目, 实际文件名, 实际目标路径)]。返回与 copies 顺序一致的条目 id 列表。
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM session")
+            self._conn.execute("DELETE FROM entries")
+            self._conn.executemany("INSERT INTO session (key, value) VALUES (?, ?)",
+                                   [(key, str(value)) for key, value in info.items()])
+            ids = []
+            for item, file_name, dest in copies:
+                cursor = self._conn.execute(
+                    "INSERT INTO entries (item, file_name, dest) VALUES (?, ?, ?)",
+                    (json.dumps(item, ensure_ascii=False), file_name, dest),
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def info(self):
+        """返回未完成会话的信息（含 pending 剩余条目数），没有未完成条目时返回 None"""
+        with self._lock:
+            pending = self._conn.execute("SELECT COUNT(*) FROM entries WHERE done = 0").fetchone()[0]
+            if not pending:
+                return None
+            info = dict(self._conn.execute("SELECT key, value FROM session").fetchall())
+        info["pending"] = pending
+        return info
+
+    def pending(self):
+        """返回 [(条目 id, 计划条目, 实际文件名, 实际目标路径)]"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, item, file_name, dest FROM entries WHERE done = 0 ORDER BY id").fetchall()
+        return [(entry_id, json.loads(item), file_name, dest) for entry_id, item, file_name, dest in rows]
+
+    def mark_done(self, entry_id):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE entries SET done = 1 WHERE id = ?", (entry_id,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM session")
+            self._conn.execute("DELETE FROM entries")
+
+    def discard(self):
+        """放弃未完成的会话：删除遗留的临时文件并清空日志"""
+        for _, _, _, dest in self.pending():
+            try:
+                os.remove(temp_path(dest))
+            except OSError:
+                pass
+        self.clear()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,202 @@
+import os
+import sqlite3
+import threading
+
+HASH_INDEX_FILE = "hash_index.sqlite3"
+
+
+class HashIndex:
+    """
+    数据库（仓库）侧文件哈希的持久化索引：
+      以文件路径为键，保存 (size, mtime_ns, inode) 与对应的哈希值。
+      stat 信息与记录一致时直接复用哈希，不再读取文件内容；
+      不一致（文件被修改、替换）时重新计算并写回。
+    可在线程池中并发调用，内部用锁串行化 SQLite 访问。
+    """
+
+    COMMIT_EVERY = 200  # 累计多少次写入后提交一次，减少磁盘同步次数
+
+    def __init__(self, db_path=HASH_INDEX_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                algorithm TEXT NOT NULL,
+                digest TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.normcase(os.path.abspath(file_path))
+
+    def lookup(self, file_path, stat_result, algorithm):
+        """stat 信息与索引一致时返回缓存的哈希，否则返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, inode, algorithm, digest FROM file_hashes WHERE path = ?",
+                (self._key(file_path),),
+            ).fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, inode, cached_algorithm, digest = row
+        if (size, mtime_ns, inode, cached_algorithm) == (
+                stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, algorithm):
+            return digest
+        return None
+
+    def store(self, file_path, stat_result, algorithm, digest):
+        """写入（或覆盖）一条哈希记录"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, inode, algorithm, digest) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(file_path), stat_result.st_size, stat_result.st_mtime_ns,
+                 stat_result.st_ino, algorithm, digest),
+            )
+            self._pending += 1
+            if self._pending >= self.COMMIT_EVERY:
+                self._conn.commit()
+                self._pending = 0
+
+    def get_hash(self, file_path, hash_func, algorithm):
+        """
+        返回文件哈希：命中索引直接返回，否则调用 hash_func(file_path) 计算并写入索引。
+        计算前后各取一次 stat，若期间文件被改动则不写入索引。
+        """
+        try:
+            stat_before = os.stat(file_path)
+        except OSError as e:
+            print(f"获取 {file_path} 状态时出错: {e}")
+            return None
+        digest = self.lookup(file_path, stat_before, algorithm)
+        if digest is not None:
+            return digest
+        digest = hash_func(file_path)
+        if digest is None:
+            return None
+        try:
+            stat_after = os.stat(file_path)
+        except OSError:
+            return digest
+        if (stat_after.st_size, stat_after.st_mtime_ns) == (stat_before.st_size, stat_before.st_mtime_ns):
+            self.store(file_path, stat_after, algorithm, digest)
+        return digest
+
+    def forget(self, file_path):
+        """删除某个文件的索引记录（文件被覆盖或删除时调用）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM file_hashes WHERE path = ?", (self._key(file_path),))
+            self._pending += 1
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+SNAPSHOT_FILE = "usb_snapshot.sqlite3"
+
+
+class UsbSnapshot:
+    """
+    上次同步完成时 U 盘文件与数据库文件的对应快照：
+      以 (设备标识, 文件相对 U 盘根目录的路径) 为键，保存 U 盘文件的 (size, mtime_ns)、
+      当时对应的数据库路径以及数据库文件的 (size, mtime_ns)。
+    再次同步时仍会遍历 U 盘目录树并 stat 两侧文件；两侧 stat 信息都与快照一致、目标路径相同的文件
+    直接记为一致，不再做内容比较（两侧修改时间不一致时 files_identical 需要读取内容计算哈希）。
+    任一侧被修改过的文件按正常流程比较。
+    """
+
+    def __init__(self, device, db_path=SNAPSHOT_FILE):
+        self.device = device
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(usb_files)")]
+        if columns and "dest_size" not in columns:
+            self._conn.execute("DROP TABLE usb_files")  # 旧版快照没有数据库侧 stat，丢弃后重新建立
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS usb_files (
+                device TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                dest TEXT NOT NULL,
+                dest_size INTEGER NOT NULL,
+                dest_mtime_ns INTEGER NOT NULL,
+                PRIMARY KEY (device, path)
+            )
+            """
+        )
+        self._conn.commit()
+        self._entries = {
+            path: (size, mtime_ns, dest, dest_size, dest_mtime_ns)
+            for path, size, mtime_ns, dest, dest_size, dest_mtime_ns in self._conn.execute(
+                "SELECT path, size, mtime_ns, dest, dest_size, dest_mtime_ns FROM usb_files WHERE device = ?",
+                (device,))
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_unchanged(self, rel_path, stat_result, dest_file):
+        """U 盘文件和数据库文件的 stat 信息都与快照记录一致时返回 True"""
+        entry = self._entries.get(rel_path)
+        if entry is None:
+            return False
+        size, mtime_ns, dest, dest_size, dest_mtime_ns = entry
+        if (size, mtime_ns, dest) != (stat_result.st_size, stat_result.st_mtime_ns, dest_file):
+            return False
+        try:
+            stat_dest = os.stat(dest_file)
+        except OSError:
+            return False
+        return (dest_size, dest_mtime_ns) == (stat_dest.st_size, stat_dest.st_mtime_ns)
+
+    def replace_tree(self, prefixes, entries):
+        """
+        用本次同步结果替换 prefixes（样品目录的相对路径）之下的全部快照记录。
+        entries 为 [(相对路径, size, mtime_ns, 数据库路径, 数据库文件 size, 数据库文件 mtime_ns)]，
+        只应包含已确认与数据库一致的文件。
+        """
+        prefixes = tuple(prefixes)
+        stale = [
+            (self.device, path) for path in self._entries
+            if any(path == prefix or path.startswith(prefix + os.sep) for prefix in prefixes)
+        ]
+        with self._conn:
+            self._conn.executemany("DELETE FROM usb_files WHERE device = ? AND path = ?", stale)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO usb_files (device, path, size, mtime_ns, dest, dest_size, dest_mtime_ns) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(self.device, *entry) for entry in entries],
+            )
+        for _, path in stale:
+            del self._entries[path]
+        for path, *entry in entries:
+            self._entries[path] = tuple(entry)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,148 @@
+import json
+import os
+import sqlite3
+
+HISTORY_DB_FILE = "sync_history.sqlite3"
+LEGACY_HISTORY_FILE = "sync_history.json"
+
+
+class HistoryStore:
+    """
+    只追加的同步历史库（SQLite）：
+      sessions 表每次同步一行，events 表每个复制事件一行，
+      按 时间 / 样品 / 仪器 建索引，写入一次同步只插入新行，不再重写整个历史文件。
+    查询按层级（同步 -> 样品 -> 仪器 -> 批次 -> 文件）分别进行，供界面展开节点时按需加载。
+    首次打开时若存在旧的 sync_history.json，会自动导入一次（原文件保留不动）。
+    """
+
+    def __init__(self, db_path=HISTORY_DB_FILE, legacy_file=LEGACY_HISTORY_FILE):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL REFERENCES sessions(id),
+                sample TEXT NOT NULL,
+                instrument TEXT NOT NULL,
+                grp TEXT NOT NULL,
+                file TEXT NOT NULL,
+                dest TEXT NOT NULL,
+                action TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_timestamp ON sessions(timestamp);
+            CREATE INDEX IF NOT EXISTS idx_events_tree ON events(session_id, sample, instrument, grp);
+            CREATE INDEX IF NOT EXISTS idx_events_sample ON events(sample, session_id);
+            CREATE INDEX IF NOT EXISTS idx_events_instrument ON events(instrument, session_id);
+            """
+        )
+        self._conn.commit()
+        if legacy_file:
+            self._import_legacy(legacy_file)
+
+    def _import_legacy(self, legacy_file):
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone():
+            return
+        if os.path.exists(legacy_file):
+            try:
+                with open(legacy_file, "r", encoding="utf-8") as f:
+                    history = json.load(f)
+            except Exception as e:
+                print("导入旧同步记录失败:", e)
+                return
+            for session in sorted(history, key=lambda x: x.get("timestamp", "")):
+                self.append_session(session.get("timestamp", "未知时间"), session.get("records", {}), commit=False)
+            print(f"已从 {legacy_file} 导入 {len(history)} 条同步记录。")
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_imported', '1')")
+        self._conn.commit()
+
+    def append_session(self, timestamp, session_record, commit=True):
+        """追加一次同步：session_record 为 record_event 生成的 {样品: {仪器: {批次: [事件]}}}"""
+        cursor = self._conn.execute("INSERT INTO sessions (timestamp) VALUES (?)", (timestamp,))
+        session_id = cursor.lastrowid
+        self._conn.executemany(
+            "INSERT INTO events (session_id, sample, instrument, grp, file, dest, action) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (session_id, sample, instrument, group,
+                 event.get("file", ""), event.get("dest", ""), event.get("action", ""))
+                for sample, inst_dict in session_record.items()
+                for instrument, group_dict in inst_dict.items()
+                for group, files in group_dict.items()
+                for event in files
+            ],
+        )
+        if commit:
+            self._conn.commit()
+        return session_id
+
+    @staticmethod
+    def _filters(sample=None, instrument=None):
+        clauses, params = [], []
+        if sample:
+            clauses.append("sample = ?")
+            params.append(sample)
+        if instrument:
+            clauses.append("instrument = ?")
+            params.append(instrument)
+        return clauses, params
+
+    def sessions(self, sample=None, instrument=None, since=None, until=None):
+        """按时间倒序返回 [(session_id, timestamp, 文件数)]，可按样品、仪器、起止日期筛选"""
+        clauses, params = self._filters(sample, instrument)
+        if since:
+            clauses.append("s.timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("s.timestamp <= ?")
+            params.append(until + " 99")  # 只给日期时包含当天
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._conn.execute(
+            f"SELECT s.id, s.timestamp, COUNT(e.id) FROM sessions s JOIN events e ON e.session_id = s.id "
+            f"{where} GROUP BY s.id ORDER BY s.timestamp DESC, s.id DESC",
+            params,
+        ).fetchall()
+
+    def samples(self, session_id, sample=None, instrument=None):
+        clauses, params = self._filters(sample, instrument)
+        return self._distinct("sample", session_id, clauses, params)
+
+    def instruments(self, session_id, sample, instrument=None):
+        clauses, params = self._filters(sample, instrument)
+        return self._distinct("instrument", session_id, clauses, params)
+
+    def groups(self, session_id, sample, instrument):
+        clauses, params = self._filters(sample, instrument)
+        return self._distinct("grp", session_id, clauses, params)
+
+    def _distinct(self, column, session_id, clauses, params):
+        where = " AND ".join(["session_id = ?"] + clauses)
+        rows = self._conn.execute(
+            f"SELECT {column} FROM events WHERE {where} GROUP BY {column} ORDER BY MIN(id)",
+            [session_id] + params,
+        )
+        return [row[0] for row in rows]
+
+    def files(self, session_id, sample, instrument, group):
+        """返回 [(文件名, 操作, 目标路径)]"""
+        return self._conn.execute(
+            "SELECT file, action, dest FROM events "
+            "WHERE session_id = ? AND sample = ? AND instrument = ? AND grp = ? ORDER BY id",
+            (session_id, sample, instrument, group),
+        ).fetchall()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
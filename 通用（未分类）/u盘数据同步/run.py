@@ -1,242 +1,26 @@
 import os
 import shutil
-import json
-import hashlib
+import queue
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
-from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
 from PIL import Image, ImageTk
-import time
 
-CONFIG_FILE = "config.json"
-HISTORY_FILE = "sync_history.json"
-IGNORE_FILE = "ignore_samples.json"
-ICON_SIZE = (16, 16)  # 图标大小
-
-
-############################################
-# 同步记录相关辅助函数（历史记录）
-############################################
-def load_sync_history():
-    """加载历史同步记录，返回记录列表"""
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print("加载同步记录失败:", e)
-    return []
-
-
-def save_sync_history(history):
-    """将同步记录列表保存到 HISTORY_FILE 中"""
-    try:
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=4, ensure_ascii=False)
-    except Exception as e:
-        print("保存同步记录失败:", e)
-
-
-def record_event(session_record, sample, instrument, rel_path, file_name, dest_file, action):
-    """
-    将复制事件记录到本次同步记录中。
-    根据文件相对路径的第一层（若为"."则归为 "root"）作为批次。
-    """
-    group = "root" if rel_path == "." else rel_path.split(os.sep)[0]
-    session_record.setdefault(sample, {}).setdefault(instrument, {}).setdefault(group, [])
-    session_record[sample][instrument][group].append({
-        "file": file_name,
-        "dest": dest_file,
-        "action": action
-    })
-
-
-#############################################
-# 配置文件辅助函数
-#############################################
-def load_config():
-    """加载配置文件（JSON格式），若存在则返回字典，否则返回空字典"""
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print("加载配置失败:", e)
-    return {}
-
-
-def save_config(config):
-    """保存配置字典到文件"""
-    try:
-        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-    except Exception as e:
-        print("保存配置失败:", e)
+from copy_scheduler import CopyJournal
+from history_store import HistoryStore
+from sync_engine import (
+    ACTION_LABELS,
+    CONFLICT_RULES,
+    KIND_LABELS,
+    SyncEngine,
+    load_config,
+    save_config,
+    load_ignore_list,
+    save_ignore_list,
+)
 
-
-#############################################
-# 忽略列表管理（针对新样品）
-#############################################
-def load_ignore_list():
-    """加载忽略的新样品列表（格式："instrument::sample"），返回列表"""
-    if os.path.exists(IGNORE_FILE):
-        try:
-            with open(IGNORE_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print("加载忽略列表失败:", e)
-    return []
-
-
-def save_ignore_list(ignore_list):
-    """保存忽略列表到文件"""
-    try:
-        with open(IGNORE_FILE, "w", encoding="utf-8") as f:
-            json.dump(ignore_list, f, indent=4, ensure_ascii=False)
-    except Exception as e:
-        print("保存忽略列表失败:", e)
-
-
-#############################################
-# 文件操作辅助函数
-#############################################
-def get_file_stat(file_path):
-    """获取指定文件的状态（大小、修改时间等）"""
-    try:
-        return os.stat(file_path)
-    except Exception as e:
-        print(f"获取 {file_path} 状态时出错: {e}")
-        return None
-
-
-def get_file_hash(file_path, chunk_size=8192):
-    """
-    计算文件的 SHA256 哈希值，采用分块读取降低内存占用
-    """
-    hash_sha256 = hashlib.sha256()
-    try:
-        with open(file_path, 'rb') as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                hash_sha256.update(chunk)
-        return hash_sha256.hexdigest()
-    except Exception as e:
-        print(f"计算哈希出错: {file_path}, 错误: {e}")
-        return None
-
-
-def files_identical(source_file, dest_file, executor, chunk_size=8192):
-    """
-    判断两个文件是否相同：
-      1. 并行获取两个文件的 os.stat 属性（大小、修改时间）。
-      2. 如果大小不同，则返回 False；若大小相同且取整后修改时间相同，则认为一致；
-      3. 否则并行计算 SHA256 哈希值后比较内容。
-    """
-    future_source_stat = executor.submit(get_file_stat, source_file)
-    future_dest_stat = executor.submit(get_file_stat, dest_file)
-    stat_source = future_source_stat.result()
-    stat_dest = future_dest_stat.result()
-    if stat_source is None or stat_dest is None:
-        return False
-    if stat_source.st_size != stat_dest.st_size:
-        return False
-    if int(stat_source.st_mtime) == int(stat_dest.st_mtime):
-        return True
-    future_source_hash = executor.submit(get_file_hash, source_file, chunk_size)
-    future_dest_hash = executor.submit(get_file_hash, dest_file, chunk_size)
-    hash_source = future_source_hash.result()
-    hash_dest = future_dest_hash.result()
-    if hash_source is None or hash_dest is None:
-        return False
-    return hash_source == hash_dest
-
-
-def copy_file_task(source, dest):
-    """复制文件（保留元数据），并打印日志"""
-    try:
-        shutil.copy2(source, dest)
-        print(f"Copied:\n  {source}\n  -> {dest}")
-    except Exception as e:
-        print(f"Error copying {source} -> {dest}: {e}")
-
-
-def prompt_user_dialog(parent, file_name, src_file, dest_file):
-    """
-    当目标文件存在且内容不一致时，弹出对话框供用户选择操作【覆盖】、【跳过】或【重命名】。
-    """
-    dialog = tk.Toplevel(parent)
-    dialog.title("文件冲突")
-    msg = f"目标文件已存在：\n{dest_file}\n\n来源文件：\n{src_file}\n\n请选择操作："
-    label = tk.Label(dialog, text=msg, justify=tk.LEFT)
-    label.pack(padx=10, pady=10)
-    result = tk.StringVar()
-
-    def choose(option):
-        result.set(option)
-        dialog.destroy()
-
-    btn_frame = tk.Frame(dialog)
-    btn_frame.pack(pady=10)
-    btn_overwrite = tk.Button(btn_frame, text="覆盖", command=lambda: choose("o"))
-    btn_overwrite.pack(side=tk.LEFT, padx=5)
-    btn_skip = tk.Button(btn_frame, text="跳过", command=lambda: choose("s"))
-    btn_skip.pack(side=tk.LEFT, padx=5)
-    btn_rename = tk.Button(btn_frame, text="重命名", command=lambda: choose("r"))
-    btn_rename.pack(side=tk.LEFT, padx=5)
-    dialog.grab_set()
-    parent.wait_window(dialog)
-    return result.get()
-
-
-def sync_directories(source_dir, dest_dir, parent_window, executor, session_record, sample, instrument):
-    """
-    遍历 source_dir 下所有文件及子目录，
-    将文件复制到目标目录 dest_dir（保持目录结构），
-    并记录实际复制操作到 session_record 中（包括新复制、覆盖、重命名）。
-    """
-    for root, dirs, files in os.walk(source_dir):
-        rel_path = os.path.relpath(root, source_dir)
-        target_dir = os.path.join(dest_dir, rel_path)
-        try:
-            os.makedirs(target_dir, exist_ok=True)
-        except Exception as e:
-            print(f"无法创建目录 {target_dir}: {e}")
-            continue
-        for file in files:
-            source_file = os.path.join(root, file)
-            dest_file = os.path.join(target_dir, file)
-            if not os.path.exists(dest_file):
-                print(f"Scheduling copy:\n  {source_file} -> {dest_file}")
-                executor.submit(copy_file_task, source_file, dest_file)
-                record_event(session_record, sample, instrument, rel_path, file, dest_file, "新复制")
-            else:
-                if files_identical(source_file, dest_file, executor):
-                    print(f"文件一致，跳过:\n  {source_file}")
-                else:
-                    action = prompt_user_dialog(parent_window, file, source_file, dest_file)
-                    if action == "o":
-                        print(f"Scheduling overwrite:\n  {source_file} -> {dest_file}")
-                        executor.submit(copy_file_task, source_file, dest_file)
-                        record_event(session_record, sample, instrument, rel_path, file, dest_file, "覆盖")
-                    elif action == "s":
-                        print(f"跳过文件:\n  {source_file}")
-                    elif action == "r":
-                        base, ext = os.path.splitext(file)
-                        count = 1
-                        new_name = f"{base} - copy{count}{ext}"
-                        new_dest_file = os.path.join(target_dir, new_name)
-                        while os.path.exists(new_dest_file):
-                            count += 1
-                            new_name = f"{base} - copy{count}{ext}"
-                            new_dest_file = os.path.join(target_dir, new_name)
-                        print(f"Scheduling rename copy:\n  {source_file} -> {new_dest_file}")
-                        executor.submit(copy_file_task, source_file, new_dest_file)
-                        record_event(session_record, sample, instrument, rel_path, new_name, new_dest_file,
-                                     "重命名复制")
+ICON_SIZE = (16, 16)  # 图标大小
+POLL_INTERVAL_MS = 100  # 界面读取同步引擎事件队列的间隔
 
 
 ################################################
@@ -269,6 +53,7 @@ class SyncApp(tk.Tk):
             self.openIndicator = None
 
         self.new_samples_window = None  # 保存新样品窗口引用
+        self.engine = None  # 当前（或最近一次）运行的同步引擎
         self.create_widgets()
 
     def create_widgets(self):
@@ -288,8 +73,11 @@ class SyncApp(tk.Tk):
         btn_browse_usb = tk.Button(self, text="浏览", command=self.select_usb)
         btn_browse_usb.grid(row=1, column=2, padx=10, pady=10)
 
-        btn_sync = tk.Button(self, text="开始同步", command=self.start_sync)
-        btn_sync.grid(row=2, column=1, padx=10, pady=20)
+        self.btn_sync = tk.Button(self, text="开始同步", command=self.start_sync)
+        self.btn_sync.grid(row=2, column=1, padx=10, pady=20)
+
+        btn_preview = tk.Button(self, text="预览同步计划", command=lambda: self.start_sync(dry_run=True))
+        btn_preview.grid(row=2, column=0, padx=10, pady=20)
 
         btn_view_history = tk.Button(self, text="查看同步记录", command=self.show_sync_history)
         btn_view_history.grid(row=2, column=2, padx=10, pady=20)
@@ -317,19 +105,15 @@ class SyncApp(tk.Tk):
             save_config(self.config_data)
             self.status_label.config(text="U盘路径已更新")
 
-    def start_sync(self):
+    def start_sync(self, dry_run=False):
         """
-        同步流程：
-          1. 扫描数据库根目录下已有的样品（不新建）。
-             对样品名称进行大小写不敏感匹配，建立 sample_mapping。
-          2. 根据每个样品文件夹下的子目录确定有效仪器集合（均转换为 lower-case）。
-          3. 遍历 USB 根目录，仅处理名称（lower-case）在 db_instruments_set 内的文件夹。
-          4. 对于每个 USB 仪器文件夹，其中子目录作为样品：
-             - 如果样品（lower-case）存在于数据库，则同步数据到 “样品/仪器” 目录，使用 sample_mapping 得到正确的样品名称，
-               同时对仪器目录也进行大小写不敏感匹配（若已存在则使用数据库已有名称，否则创建新目录）。
-             - 如果样品不存在，则记录为新样品供后续处理。
-          5. 清理忽略列表：如果忽略记录中对应的 USB 文件夹不存在，则删除该记录。
-          6. 同步过程采用多线程处理，并将实际复制操作记录到同步历史中。
+        同步流程（具体规则见 sync_engine.discover_targets 与 SyncEngine）：
+          1. 在后台线程中扫描数据库与 U 盘，确定同步目标与新样品；
+          2. 已存在的文件在线程池中并行比较，生成完整的同步计划，界面保持响应；
+          3. 在计划窗口中查看新文件/冲突数量、大小与预计耗时，批量处理冲突后确认执行；
+             dry_run=True 时只预览计划，不复制任何文件；
+          4. 完成后写入同步历史，并弹出新样品处理窗口。
+        上次同步在复制中途中断（复制日志中仍有未完成文件）时，先询问是否直接继续上次的复制。
         """
         if not self.repo_root:
             messagebox.showwarning("警告", "请先选择数据库路径")
@@ -337,116 +121,154 @@ class SyncApp(tk.Tk):
         if not self.usb_root:
             messagebox.showwarning("警告", "请先选择U盘路径")
             return
+        if self.engine is not None and self.engine.is_running():
+            messagebox.showinfo("提示", "同步正在进行中")
+            return
 
-        self.status_label.config(text="同步进行中...")
+        resume = False
+        if not dry_run:
+            with CopyJournal() as journal:
+                info = journal.info()
+                if info is not None:
+                    resume = messagebox.askyesno(
+                        "继续同步",
+                        f"上次同步（{info.get('started', '未知时间')}）在复制过程中中断，"
+                        f"还有 {info['pending']} 个文件未完成。\n"
+                        f"是否直接继续上次的复制？选择【否】将放弃上次剩余的文件并重新扫描。")
+                    if not resume:
+                        journal.discard()
 
-        # 获取数据库中的样品，并建立大小写不敏感映射
-        db_samples = [name for name in os.listdir(self.repo_root)
-                      if os.path.isdir(os.path.join(self.repo_root, name))]
-        sample_mapping = {s.lower(): s for s in db_samples}
-        db_samples_set = set(sample_mapping.keys())
+        self.status_label.config(text="同步进行中...")
+        self.btn_sync.config(state=tk.DISABLED)
+        engine = SyncEngine(self.repo_root, self.usb_root, self.config_data, dry_run=dry_run, resume=resume)
+        self.run_engine(engine, self.on_sync_finished)
 
-        # 根据每个样品文件夹下的子目录确定有效仪器集合（lower-case）
-        db_instruments_set = set()
-        for sample in db_samples:
-            sample_path = os.path.join(self.repo_root, sample)
+    def on_sync_finished(self, result):
+        self.btn_sync.config(state=tk.NORMAL)
+        if result is None:
+            return
+        if result["dry_run"]:
+            self.status_label.config(text=f"计划预览：{result['plan'].describe(self.engine.throughput_mb_s)}")
+            return
+        if result["cancelled"]:
+            self.status_label.config(text="同步已取消")
+            return
+        report = result["copy_report"] or {}
+        self.status_label.config(
+            text=f"同步完成：复制 {result['copied']} 个文件，失败 {result['failed']} 个，"
+                 f"用时 {result['elapsed']:.1f} s，复制速度 {report.get('mb_s', 0.0):.1f} MB/s")
+        if result["new_samples"]:
+            self.show_new_samples_window(result["new_samples"])
+
+    def run_engine(self, engine, on_finished):
+        """启动同步引擎，并定时从事件队列读取进度；结束时调用 on_finished(结果字典或 None)"""
+        self.engine = engine
+        engine.start()
+        self.after(POLL_INTERVAL_MS, self.poll_engine, engine, on_finished)
+
+    def poll_engine(self, engine, on_finished):
+        while True:
             try:
-                for item in os.listdir(sample_path):
-                    if os.path.isdir(os.path.join(sample_path, item)):
-                        db_instruments_set.add(item.lower())
-            except Exception as e:
-                print(f"读取 {sample_path} 内子目录出错: {e}")
-
-        # 清理忽略列表：保留当前 USB 上仍存在的 "instrument::sample" 记录（以 lower-case 形式）
-        usb_ignore_keys = set()
-        if os.path.isdir(self.usb_root):
-            for instrument in os.listdir(self.usb_root):
-                instrument_path = os.path.join(self.usb_root, instrument)
-                if not os.path.isdir(instrument_path):
-                    continue
-                if instrument.lower() not in db_instruments_set:
-                    continue
-                try:
-                    for sample in os.listdir(instrument_path):
-                        sample_path = os.path.join(instrument_path, sample)
-                        if os.path.isdir(sample_path):
-                            usb_ignore_keys.add(f"{instrument.lower()}::{sample.lower()}")
-                except Exception as e:
-                    print(f"读取 {instrument_path} 内部时出错: {e}")
-        ignore_list = load_ignore_list()
-        new_ignore_list = [key for key in ignore_list if key in usb_ignore_keys]
-        if set(ignore_list) != set(new_ignore_list):
-            save_ignore_list(new_ignore_list)
-            ignore_list = new_ignore_list
-
-        new_samples = []  # 保存新样品记录
-        current_sync_record = {}
-
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            # 遍历 USB 根目录中，仅处理名称（lower-case）在 db_instruments_set 内的文件夹
-            for instrument in os.listdir(self.usb_root):
-                instrument_path = os.path.join(self.usb_root, instrument)
-                if not os.path.isdir(instrument_path):
-                    continue
-                if instrument.lower() not in db_instruments_set:
-                    print(f"USB 文件夹 {instrument} 不在有效仪器列表中，忽略。")
-                    continue
-                try:
-                    samples_in_instrument = os.listdir(instrument_path)
-                except PermissionError:
-                    print(f"权限不足，无法访问 {instrument_path}，跳过。")
-                    continue
-                print(f"处理仪器文件夹: {instrument}")
-                for sample in samples_in_instrument:
-                    sample_usb_folder = os.path.join(instrument_path, sample)
-                    if not os.path.isdir(sample_usb_folder):
-                        continue
-                    if sample.lower() in db_samples_set:
-                        # 样品存在于数据库中：采用正确的样品名称
-                        db_sample = sample_mapping[sample.lower()]
-                        dest_sample_folder = os.path.join(self.repo_root, db_sample)
-                        # 对仪器目录做大小写不敏感检查
-                        dest_instruments = {}
-                        try:
-                            for item in os.listdir(dest_sample_folder):
-                                if os.path.isdir(os.path.join(dest_sample_folder, item)):
-                                    dest_instruments[item.lower()] = item
-                        except Exception as e:
-                            print(f"读取 {dest_sample_folder} 内仪器目录时出错: {e}")
-                        if instrument.lower() in dest_instruments:
-                            dest_instrument_folder = os.path.join(dest_sample_folder,
-                                                                  dest_instruments[instrument.lower()])
-                        else:
-                            dest_instrument_folder = os.path.join(dest_sample_folder, instrument)
-                        if not os.path.exists(dest_instrument_folder):
-                            print(f"目标仪器文件夹不存在，自动创建：{dest_instrument_folder}")
-                            os.makedirs(dest_instrument_folder, exist_ok=True)
-                        print(f"同步：USB [{sample_usb_folder}] -> 数据库 [{dest_instrument_folder}]")
-                        sync_directories(sample_usb_folder, dest_instrument_folder, self, executor, current_sync_record,
-                                         db_sample, instrument)
-                    else:
-                        # 新样品：记录为新样品（key 用 lower-case）
-                        key = f"{instrument.lower()}::{sample.lower()}"
-                        if key in ignore_list:
-                            print(f"新样品 {sample} 来自 {instrument} 已忽略，跳过。")
-                        else:
-                            print(f"发现新样品：{sample} 来自 {instrument}")
-                            new_samples.append({
-                                "instrument": instrument,
-                                "sample": sample,
-                                "usb_path": sample_usb_folder
-                            })
-
-        self.status_label.config(text="同步完成")
-        if current_sync_record:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            session_entry = {"timestamp": timestamp, "records": current_sync_record}
-            history = load_sync_history()
-            history.append(session_entry)
-            save_sync_history(history)
-            print("同步记录已更新。")
-        if new_samples:
-            self.show_new_samples_window(new_samples)
+                event = engine.events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == "status":
+                self.status_label.config(text=event[1])
+            elif kind == "progress":
+                self.status_label.config(text=f"同步进行中... {event[1]}/{event[2]}")
+            elif kind == "plan":
+                plan = event[1]
+                # 有待复制文件或需要决定的冲突时让用户确认；冲突默认跳过，不能不经确认直接执行
+                if engine.dry_run or plan.pending() or plan.conflicts():
+                    self.show_plan_window(engine, plan)
+                else:
+                    engine.execute_plan()
+            elif kind == "error":
+                self.status_label.config(text="同步失败")
+                messagebox.showerror("错误", f"同步失败：{event[1]}")
+                on_finished(None)
+                return
+            elif kind == "done":
+                on_finished(event[1])
+                return
+        self.after(POLL_INTERVAL_MS, self.poll_engine, engine, on_finished)
+
+    def show_plan_window(self, engine, plan):
+        """
+        显示同步计划：顶部是新文件/一致/冲突数量、待复制大小与预计耗时，
+        下方列出所有需要处理的文件。冲突可多选后逐条设置【覆盖】、【跳过】或【重命名】，
+        也可按规则批量处理（如"U 盘较新则覆盖"、"全部重命名"），确认后引擎一次性执行；
+        dry-run 时只读展示。直接关闭窗口等同于取消本次同步。
+        """
+        top = tk.Toplevel(self)
+        top.title("同步计划（预览）" if engine.dry_run else "同步计划")
+        top.geometry("1000x520")
+
+        summary_label = tk.Label(top, justify=tk.LEFT, anchor="w")
+        summary_label.pack(fill=tk.X, padx=10, pady=(10, 0))
+
+        frame = tk.Frame(top)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        cols = ("类型", "操作", "样品", "仪器", "大小(KB)", "目标文件", "来源文件")
+        tree = ttk.Treeview(frame, columns=cols, show="headings", selectmode="extended")
+        for col, width in zip(cols, (60, 60, 100, 80, 70, 300, 300)):
+            tree.heading(col, text=col)
+            tree.column(col, width=width, anchor="w")
+        vsb = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=vsb.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # 冲突排在最前面，一致的文件不列出
+        shown = plan.conflicts() + plan.by_kind("new")
+        for index, item in enumerate(shown):
+            tree.insert("", "end", iid=str(index), values=(
+                KIND_LABELS[item["kind"]], ACTION_LABELS[item["action"]], item["sample"], item["instrument"],
+                f"{item['size'] / 1024:.1f}", item["dest"], item["source"]))
+
+        def refresh():
+            for index, item in enumerate(shown):
+                if item["kind"] == "conflict":
+                    tree.set(str(index), "操作", ACTION_LABELS[item["action"]])
+            summary_label.config(text=plan.describe(engine.throughput_mb_s))
+
+        def set_action(action):
+            for iid in tree.selection():
+                item = shown[int(iid)]
+                if item["kind"] == "conflict":
+                    item["action"] = action
+            refresh()
+
+        def apply_rule(rule):
+            plan.apply_rule(rule)
+            refresh()
+
+        def confirm():
+            top.destroy()
+            engine.execute_plan()
+
+        def on_close():
+            top.destroy()
+            engine.cancel()
+
+        btn_frame = tk.Frame(top)
+        btn_frame.pack(pady=(0, 10))
+        if engine.dry_run:
+            tk.Button(btn_frame, text="关闭", command=top.destroy).pack(side=tk.LEFT, padx=5)
+        else:
+            for action in ("o", "s", "r"):
+                tk.Button(btn_frame, text=f"所选{ACTION_LABELS[action]}",
+                          command=lambda a=action: set_action(a)).pack(side=tk.LEFT, padx=5)
+            for rule, text in CONFLICT_RULES.items():
+                tk.Button(btn_frame, text=text, command=lambda r=rule: apply_rule(r)).pack(side=tk.LEFT, padx=5)
+            tk.Button(btn_frame, text="执行同步", command=confirm).pack(side=tk.LEFT, padx=20)
+            tk.Button(btn_frame, text="取消", command=on_close).pack(side=tk.LEFT, padx=5)
+            top.protocol("WM_DELETE_WINDOW", on_close)
+
+        refresh()
+        top.transient(self)
+        top.grab_set()
 
     def show_new_samples_window(self, new_samples):
         """
@@ -503,7 +325,7 @@ class SyncApp(tk.Tk):
 
         def create_selected():
             selected = tree.selection()
-            new_session_record = {}
+            targets = []
             for item in selected:
                 values = tree.item(item, "values")
                 if not values:
@@ -523,18 +345,18 @@ class SyncApp(tk.Tk):
                     except Exception as e:
                         messagebox.showerror("错误", f"无法创建仪器文件夹 {instrument}：{e}")
                         continue
-                with ThreadPoolExecutor(max_workers=4) as executor:
-                    sync_directories(usb_path, dest_instrument_folder, self, executor, new_session_record, sample,
-                                     instrument)
-                messagebox.showinfo("新样品", f"已在数据库中新建 {sample} 下的 {instrument} 文件夹，并同步数据")
+                targets.append((usb_path, dest_instrument_folder, sample, instrument))
                 tree.delete(item)
-            if new_session_record:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                session_entry = {"timestamp": timestamp, "records": new_session_record}
-                history = load_sync_history()
-                history.append(session_entry)
-                save_sync_history(history)
-                print("新样品同步记录已更新。")
+            if not targets:
+                return
+
+            def on_finished(result):
+                if result is not None and not result["cancelled"]:
+                    names = "、".join(f"{sample}/{instrument}" for _, _, sample, instrument in targets)
+                    messagebox.showinfo("新样品", f"已在数据库中新建并同步：{names}")
+
+            engine = SyncEngine(self.repo_root, self.usb_root, self.config_data, targets=targets, max_workers=4)
+            self.run_engine(engine, on_finished)
 
         def ignore_selected():
             selected = tree.selection()
@@ -564,13 +386,12 @@ class SyncApp(tk.Tk):
         self.wait_window(top)
 
     def show_sync_history(self):
-        history = load_sync_history()
-        if not history:
+        history = HistoryStore()
+        if not history.sessions():
+            history.close()
             messagebox.showinfo("同步记录", "没有同步记录。")
             return
 
-        sorted_history = sorted(history, key=lambda x: x.get("timestamp", ""), reverse=True)
-
         # 自定义样式，去掉默认 indicator
         style = ttk.Style(self)
         style.theme_use("clam")
@@ -589,6 +410,21 @@ class SyncApp(tk.Tk):
         hist_window.title("同步记录")
         hist_window.geometry("800x600")
 
+        def on_close():
+            history.close()
+            hist_window.destroy()
+
+        hist_window.protocol("WM_DELETE_WINDOW", on_close)
+
+        # 筛选栏：按样品、仪器、日期（YYYY-MM-DD）查询，均走数据库索引
+        filter_frame = tk.Frame(hist_window)
+        filter_frame.pack(fill=tk.X, padx=5, pady=5)
+        filter_vars = {}
+        for label, key in (("样品", "sample"), ("仪器", "instrument"), ("起始日期", "since"), ("截止日期", "until")):
+            tk.Label(filter_frame, text=label).pack(side=tk.LEFT)
+            filter_vars[key] = tk.StringVar()
+            tk.Entry(filter_frame, textvariable=filter_vars[key], width=12).pack(side=tk.LEFT, padx=(2, 8))
+
         # 使用两列：名称（#0）、action、dest；这里去掉 "folder" 列
         tree = ttk.Treeview(hist_window, style="Custom.Treeview")
         tree.pack(fill=tk.BOTH, expand=True)
@@ -669,6 +505,8 @@ class SyncApp(tk.Tk):
 
             if tree.get_children(item_id):
                 new_state = not tree.item(item_id, "open")
+                if new_state:
+                    populate(item_id)
                 tree.item(item_id, open=new_state)
                 tree.after_idle(
                     lambda: tree.item(item_id, image=self.openIndicator if new_state else self.closedIndicator))
@@ -676,25 +514,58 @@ class SyncApp(tk.Tk):
 
         tree.bind("<ButtonRelease-1>", on_single_click)
 
-        # 构建树形结构
-        for session in sorted_history:
-            ts = session.get("timestamp", "未知时间")
-            session_node = tree.insert("", "end", text=ts, image=self.openIndicator, open=True)
-            records = session.get("records", {})
-            for sample, inst_dict in records.items():
-                sample_node = tree.insert(session_node, "end", text=sample, image=self.openIndicator, open=True,
-                                          values=("", ""))
-                for instrument, group_dict in inst_dict.items():
-                    inst_node = tree.insert(sample_node, "end", text=instrument, image=self.openIndicator, open=True,
-                                            values=("", ""))
-                    for group, files in group_dict.items():
-                        group_node = tree.insert(inst_node, "end", text=group, image=self.openIndicator, open=True,
-                                                 values=("", ""))
-                        for file_event in files:
-                            file_name = file_event.get("file", "")
-                            action = file_event.get("action", "")
-                            dest = file_event.get("dest", "")
-                            tree.insert(group_node, "end", text=file_name, values=(action, dest))
+        # 懒加载树形结构：先只插入同步节点，展开某个节点时才从数据库查询其子节点
+        node_keys = {}  # 节点 id -> (session_id, sample, instrument, group)，未加载子节点的节点带占位子节点
+
+        def add_node(parent, text, key):
+            node = tree.insert(parent, "end", text=text, image=self.closedIndicator, open=False, values=("", ""))
+            tree.insert(node, "end", text="加载中...")
+            node_keys[node] = key
+            return node
+
+        def populate(node):
+            key = node_keys.pop(node, None)
+            if key is None:
+                return
+            tree.delete(*tree.get_children(node))
+            session_id, sample, instrument, group = key
+            sample_filter = filter_vars["sample"].get().strip() or None
+            instrument_filter = filter_vars["instrument"].get().strip() or None
+            if sample is None:
+                for name in history.samples(session_id, sample_filter, instrument_filter):
+                    add_node(node, name, (session_id, name, None, None))
+            elif instrument is None:
+                for name in history.instruments(session_id, sample, instrument_filter):
+                    add_node(node, name, (session_id, sample, name, None))
+            elif group is None:
+                for name in history.groups(session_id, sample, instrument):
+                    add_node(node, name, (session_id, sample, instrument, name))
+            else:
+                for file_name, action, dest in history.files(session_id, sample, instrument, group):
+                    tree.insert(node, "end", text=file_name, values=(action, dest))
+
+        def on_tree_open(event):
+            item_id = tree.focus()
+            populate(item_id)
+            tree.item(item_id, image=self.openIndicator)
+
+        tree.bind("<<TreeviewOpen>>", on_tree_open)
+
+        def load_sessions():
+            tree.delete(*tree.get_children(""))
+            node_keys.clear()
+            sessions = history.sessions(
+                sample=filter_vars["sample"].get().strip() or None,
+                instrument=filter_vars["instrument"].get().strip() or None,
+                since=filter_vars["since"].get().strip() or None,
+                until=filter_vars["until"].get().strip() or None,
+            )
+            for session_id, timestamp, file_count in sessions:
+                add_node("", f"{timestamp}（{file_count} 个文件）", (session_id, None, None, None))
+
+        tk.Button(filter_frame, text="筛选", command=load_sessions).pack(side=tk.LEFT)
+        load_sessions()
+
         vsb = ttk.Scrollbar(hist_window, orient="vertical", command=tree.yview)
         vsb.pack(side='right', fill='y')
         tree.configure(yscrollcommand=vsb.set)
@@ -0,0 +1,227 @@
+"""
+U 盘数据同步的命令行入口（无界面），供实验室电脑无人值守地导入数据。
+
+配置文件沿用 config.json 的格式，可用的键：
+  repo_root        数据库根目录
+  usb_root         U 盘根目录（监视模式下由卷标自动确定，可不填）
+  conflict_rule    冲突处理规则：overwrite_newer / overwrite_all / rename_all / skip_all（默认 skip_all）
+  ignore_samples   额外忽略的新样品列表，格式同 ignore_samples.json（"instrument::sample"）
+  dedup_store      去重存储目录（相对路径相对于 repo_root），设置后相同内容的文件只存一份；
+                   dedup_link 为 auto / reflink / hardlink，dedup_min_kb 为参与去重的最小文件大小
+                   （硬链接的文件共享数据，原地修改一个会改动所有相同内容的文件；链接前会校验对象哈希）
+  watch            监视模式参数：{"volume_label": "卷标", "mount_dir": "挂载目录",
+                                  "usb_subdir": "卷内数据子目录", "interval": 轮询间隔秒数}
+
+用法示例：
+  python sync_cli.py --config config.json
+  python sync_cli.py --config lab.json --dry-run
+  python sync_cli.py --config lab.json --watch --label LFA_DATA --mount-dir /media/lab
+  python sync_cli.py --config lab.json --dedup-existing
+"""
+import argparse
+import os
+import string
+import sys
+import time
+
+from content_store import ContentStore
+from copy_scheduler import CopyJournal
+from file_index import HASH_INDEX_FILE, HashIndex
+from sync_engine import (
+    CONFIG_FILE,
+    CONFLICT_RULES,
+    SyncEngine,
+    compare_options_from_config,
+    get_file_hash,
+    load_config,
+)
+
+DEFAULT_CONFLICT_RULE = "skip_all"  # 无人值守时默认不覆盖数据库中已有的文件
+DEFAULT_WATCH_INTERVAL = 5.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="U 盘数据同步（命令行 / 监视模式）")
+    parser.add_argument("--config", default=CONFIG_FILE, help=f"配置文件路径，默认 {CONFIG_FILE}")
+    parser.add_argument("--repo", help="覆盖配置中的 repo_root")
+    parser.add_argument("--usb", help="覆盖配置中的 usb_root")
+    parser.add_argument("--conflict", choices=sorted(CONFLICT_RULES),
+                        help=f"覆盖配置中的 conflict_rule，默认 {DEFAULT_CONFLICT_RULE}")
+    parser.add_argument("--dry-run", action="store_true", help="只输出同步计划，不复制任何文件")
+    parser.add_argument("--watch", action="store_true", help="监视模式：检测到指定卷标的 U 盘插入后自动同步")
+    parser.add_argument("--label", help="监视的 U 盘卷标（覆盖 watch.volume_label）")
+    parser.add_argument("--mount-dir", help="U 盘挂载目录，如 /media/用户名（覆盖 watch.mount_dir；Windows 可不填）")
+    parser.add_argument("--interval", type=float, help=f"轮询间隔（秒），默认 {DEFAULT_WATCH_INTERVAL}")
+    parser.add_argument("--dedup-existing", action="store_true",
+                        help="把数据库中已有的文件登记进去重存储（dedup_store），重复内容改为链接，并清理无引用的对象")
+    return parser.parse_args()
+
+
+#############################################
+# 同步执行
+#############################################
+def run_sync(repo_root, usb_root, config, conflict_rule, dry_run=False):
+    """
+    在当前线程中执行一次完整同步：复制日志中有上次中断的未完成文件时先继续复制，
+    再扫描生成计划、按 conflict_rule 统一处理冲突后执行。返回结果字典。
+    """
+    if not dry_run:
+        with CopyJournal() as journal:
+            info = journal.info()
+        if info is not None:
+            print(f"检测到上次中断的同步（{info.get('started', '未知时间')}），继续复制剩余 {info['pending']} 个文件。")
+            run_engine(SyncEngine(repo_root, usb_root, config, resume=True), conflict_rule)
+
+    return run_engine(SyncEngine(repo_root, usb_root, config, dry_run=dry_run), conflict_rule)
+
+
+def run_engine(engine, conflict_rule):
+    """启动引擎并阻塞读取事件队列，计划阶段自动应用冲突规则并确认执行"""
+    engine.start()
+    while True:
+        event = engine.events.get()
+        kind = event[0]
+        if kind == "plan":
+            plan = event[1]
+            plan.apply_rule(conflict_rule)
+            if not engine.dry_run:
+                print(f"按规则【{CONFLICT_RULES[conflict_rule]}】处理冲突：{plan.describe(engine.throughput_mb_s)}")
+                engine.execute_plan()
+        elif kind == "error":
+            raise RuntimeError(event[1])
+        elif kind == "done":
+            return event[1]
+
+
+def report(result):
+    if result["dry_run"]:
+        plan = result["plan"]
+        for item in plan.items:
+            if item["kind"] != "identical":
+                print(f"  [{item['kind']}/{item['action']}] {item['source']} -> {item['dest']}")
+        return
+    print(f"同步完成：复制 {result['copied']} 个文件，失败 {result['failed']} 个，用时 {result['elapsed']:.1f} s")
+    for sample in result["new_samples"]:
+        print(f"  新样品（需在界面中创建或忽略）：{sample['sample']} 来自 {sample['instrument']}")
+
+
+def deduplicate_existing(repo_root, config):
+    store_config = dict(config, dedup_store=config.get("dedup_store") or ".content_store")
+    compare_options = compare_options_from_config(config)
+    with HashIndex(HASH_INDEX_FILE) as hash_index:
+        store = ContentStore.from_config(
+            store_config, repo_root, hash_index,
+            lambda path: get_file_hash(path, compare_options["chunk_size"], compare_options["algorithm"]),
+            compare_options["algorithm"],
+        )
+        try:
+            print(f"正在登记 {repo_root} 中的文件到去重存储 {store.store_root} ...")
+            saved = store.deduplicate_tree(repo_root)
+            removed = store.collect_garbage()
+        finally:
+            store.close()
+    print(f"去重完成：{store.linked_files} 个文件改为链接，节省 {saved / 1024 ** 2:.1f} MB，清理无引用对象 {removed} 个")
+
+
+#############################################
+# 监视模式
+#############################################
+def windows_volume_label(drive):
+    """返回 Windows 盘符（如 "E:\\"）的卷标，取不到时返回 None"""
+    import ctypes
+
+    buffer = ctypes.create_unicode_buffer(261)
+    ok = ctypes.windll.kernel32.GetVolumeInformationW(
+        ctypes.c_wchar_p(drive), buffer, len(buffer), None, None, None, None, 0)
+    return buffer.value if ok else None
+
+
+def find_volume(label, mount_dir=None):
+    """
+    查找卷标为 label 的已挂载 U 盘，返回其根目录，未插入时返回 None：
+      - 给定 mount_dir 时，轮询该目录下名为 label 的子目录（Linux 的 /media/用户名、macOS 的 /Volumes）；
+      - 未给定且在 Windows 上时，逐个检查盘符的卷标。
+    卷标比较不区分大小写。
+    """
+    if mount_dir:
+        try:
+            with os.scandir(mount_dir) as entries:
+                for entry in entries:
+                    if entry.name.lower() == label.lower() and entry.is_dir():
+                        return entry.path
+        except OSError:
+            pass
+        return None
+    if sys.platform == "win32":
+        for letter in string.ascii_uppercase:
+            drive = f"{letter}:\\"
+            if os.path.exists(drive) and (windows_volume_label(drive) or "").lower() == label.lower():
+                return drive
+    return None
+
+
+def watch(repo_root, config, conflict_rule, label, mount_dir, usb_subdir, interval):
+    """
+    每 interval 秒检查一次 U 盘是否插入：新插入时自动同步一次，
+    同步后等到 U 盘拔出再进入下一轮，避免对同一次插入重复同步。Ctrl+C 退出。
+    """
+    print(f"监视模式：等待卷标为 {label} 的 U 盘插入（每 {interval:g} s 检查一次，Ctrl+C 退出）...")
+    synced_volume = None
+    while True:
+        volume = find_volume(label, mount_dir)
+        if volume is None:
+            if synced_volume is not None:
+                print(f"U 盘 {synced_volume} 已拔出，继续等待...")
+            synced_volume = None
+        elif volume != synced_volume:
+            usb_root = os.path.join(volume, usb_subdir) if usb_subdir else volume
+            print(f"检测到 U 盘：{volume}，开始同步 {usb_root}")
+            try:
+                report(run_sync(repo_root, usb_root, config, conflict_rule))
+            except Exception as e:
+                print(f"同步失败: {e}")
+            synced_volume = volume
+        time.sleep(interval)
+
+
+def main():
+    args = parse_args()
+    config = load_config(args.config)
+    if not config and not os.path.exists(args.config):
+        print(f"配置文件 {args.config} 不存在，只使用命令行参数。")
+    repo_root = args.repo or config.get("repo_root")
+    if not repo_root:
+        raise SystemExit("未指定数据库路径（repo_root 或 --repo）")
+    conflict_rule = args.conflict or config.get("conflict_rule", DEFAULT_CONFLICT_RULE)
+    if conflict_rule not in CONFLICT_RULES:
+        raise SystemExit(f"未知的冲突处理规则: {conflict_rule}，可选 {', '.join(CONFLICT_RULES)}")
+
+    if args.dedup_existing:
+        deduplicate_existing(repo_root, config)
+        return 0
+
+    if args.watch:
+        watch_config = config.get("watch", {})
+        label = args.label or watch_config.get("volume_label")
+        if not label:
+            raise SystemExit("监视模式需要指定卷标（watch.volume_label 或 --label）")
+        mount_dir = args.mount_dir or watch_config.get("mount_dir")
+        if not mount_dir and sys.platform != "win32":
+            raise SystemExit("非 Windows 系统的监视模式需要指定挂载目录（watch.mount_dir 或 --mount-dir）")
+        interval = args.interval or float(watch_config.get("interval", DEFAULT_WATCH_INTERVAL))
+        try:
+            watch(repo_root, config, conflict_rule, label, mount_dir, watch_config.get("usb_subdir", ""), interval)
+        except KeyboardInterrupt:
+            print("监视已停止。")
+        return 0
+
+    usb_root = args.usb or config.get("usb_root")
+    if not usb_root or not os.path.isdir(usb_root):
+        raise SystemExit(f"U 盘路径不可用: {usb_root}")
+    result = run_sync(repo_root, usb_root, config, conflict_rule, dry_run=args.dry_run)
+    report(result)
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
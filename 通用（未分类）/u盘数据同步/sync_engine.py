@@ -0,0 +1,797 @@
+import os
+import json
+import contextlib
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from history_store import HistoryStore
+from content_store import ContentStore
+from file_index import HashIndex, HASH_INDEX_FILE, SNAPSHOT_FILE, UsbSnapshot
+from copy_scheduler import JOURNAL_FILE, CopyJournal, CopyScheduler, device_key, load_device_profiles, save_device_profile
+
+try:
+    import xxhash  # 可选：更快的非加密哈希
+except ImportError:
+    xxhash = None
+
+CONFIG_FILE = "config.json"
+IGNORE_FILE = "ignore_samples.json"
+HASH_ALGORITHM = "blake2b"  # 内容比较用的哈希算法，可在 config.json 的 hash_algorithm 中修改
+HASH_CHUNK_SIZE = 4 * 1024 * 1024  # 全量哈希每次读取 4 MB
+SAMPLE_BLOCK_SIZE = 64 * 1024  # 抽样哈希读取首尾各 64 KB
+
+
+############################################
+# 同步记录相关辅助函数（历史记录保存在 HistoryStore 中）
+############################################
+def record_event(session_record, sample, instrument, rel_path, file_name, dest_file, action):
+    """
+    将复制事件记录到本次同步记录中。
+    根据文件相对路径的第一层（若为"."则归为 "root"）作为批次。
+    """
+    group = "root" if rel_path == "." else rel_path.split(os.sep)[0]
+    session_record.setdefault(sample, {}).setdefault(instrument, {}).setdefault(group, [])
+    session_record[sample][instrument][group].append({
+        "file": file_name,
+        "dest": dest_file,
+        "action": action
+    })
+
+
+#############################################
+# 配置文件辅助函数
+#############################################
+def load_config(config_file=CONFIG_FILE):
+    """加载配置文件（JSON格式），若存在则返回字典，否则返回空字典"""
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print("加载配置失败:", e)
+    return {}
+
+
+def save_config(config):
+    """保存配置字典到文件"""
+    try:
+        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=4, ensure_ascii=False)
+    except Exception as e:
+        print("保存配置失败:", e)
+
+
+#############################################
+# 忽略列表管理（针对新样品）
+#############################################
+def load_ignore_list():
+    """加载忽略的新样品列表（格式："instrument::sample"），返回列表"""
+    if os.path.exists(IGNORE_FILE):
+        try:
+            with open(IGNORE_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print("加载忽略列表失败:", e)
+    return []
+
+
+def save_ignore_list(ignore_list):
+    """保存忽略列表到文件"""
+    try:
+        with open(IGNORE_FILE, "w", encoding="utf-8") as f:
+            json.dump(ignore_list, f, indent=4, ensure_ascii=False)
+    except Exception as e:
+        print("保存忽略列表失败:", e)
+
+
+#############################################
+# 文件操作辅助函数
+#############################################
+def get_file_stat(file_path):
+    """获取指定文件的状态（大小、修改时间等）"""
+    try:
+        return os.stat(file_path)
+    except Exception as e:
+        print(f"获取 {file_path} 状态时出错: {e}")
+        return None
+
+
+def new_hasher(algorithm=HASH_ALGORITHM):
+    """
+    按名称创建哈希对象：hashlib 支持的算法（如 blake2b、sha256），
+    或安装了 xxhash 包时的 xxh64 / xxh3_64 / xxh3_128。
+    """
+    if algorithm.startswith("xxh"):
+        if xxhash is None:
+            raise ValueError(f"使用 {algorithm} 需要安装 xxhash 包")
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def get_file_hash(file_path, chunk_size=HASH_CHUNK_SIZE, algorithm=HASH_ALGORITHM):
+    """
+    计算文件的哈希值（默认 BLAKE2b），采用大块 readinto 复用同一缓冲区，
+    既降低内存占用又能跑满磁盘带宽
+    """
+    hasher = new_hasher(algorithm)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    try:
+        with open(file_path, 'rb', buffering=0) as f:
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                hasher.update(view[:n])
+        return hasher.hexdigest()
+    except Exception as e:
+        print(f"计算哈希出错: {file_path}, 错误: {e}")
+        return None
+
+
+def get_sample_hash(file_path, sample_size=SAMPLE_BLOCK_SIZE, algorithm=HASH_ALGORITHM):
+    """
+    只读取文件首尾各 sample_size 字节计算抽样哈希，用于快速排除内容不同的文件。
+    文件不超过 2 * sample_size 时等价于对全文件取哈希。
+    """
+    hasher = new_hasher(algorithm)
+    try:
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            hasher.update(f.read(sample_size))
+            if size > 2 * sample_size:
+                f.seek(size - sample_size)
+                hasher.update(f.read(sample_size))
+            elif size > sample_size:
+                hasher.update(f.read())
+        return hasher.hexdigest()
+    except Exception as e:
+        print(f"计算抽样哈希出错: {file_path}, 错误: {e}")
+        return None
+
+
+def files_identical(source_file, dest_file, hash_index=None, chunk_size=HASH_CHUNK_SIZE,
+                    algorithm=HASH_ALGORITHM, sample_size=SAMPLE_BLOCK_SIZE):
+    """
+    分级判断两个文件是否相同，每一级能下结论就立即返回：
+      1. 比较 os.stat 属性，大小不同返回 False；大小相同且取整后修改时间相同，则认为一致。
+      2. 比较首尾各 sample_size 字节的抽样哈希，不同则返回 False；
+         文件不超过 2 * sample_size 时抽样即全量，相同直接返回 True。
+      3. 否则用快速哈希（默认 BLAKE2b，chunk_size 大块读取）比较全文件内容。
+         提供 hash_index 时，数据库侧（dest_file）的哈希优先从持久化索引中取，
+         只有 U 盘侧文件需要实际读取。
+    整个判断在调用线程内串行完成，不再向线程池提交子任务并阻塞等待；
+    多个文件之间的并行由 SyncEngine 把每次比较作为一个独立任务提交到线程池实现。
+    """
+    stat_source = get_file_stat(source_file)
+    stat_dest = get_file_stat(dest_file)
+    if stat_source is None or stat_dest is None:
+        return False
+    if stat_source.st_size != stat_dest.st_size:
+        return False
+    if int(stat_source.st_mtime) == int(stat_dest.st_mtime):
+        return True
+
+    sample_source = get_sample_hash(source_file, sample_size, algorithm)
+    sample_dest = get_sample_hash(dest_file, sample_size, algorithm)
+    if sample_source is None or sample_dest is None or sample_source != sample_dest:
+        return False
+    if stat_source.st_size <= 2 * sample_size:
+        return True
+
+    hash_source = get_file_hash(source_file, chunk_size, algorithm)
+    if hash_source is None:
+        return False
+    if hash_index is not None:
+        hash_dest = hash_index.get_hash(dest_file, lambda path: get_file_hash(path, chunk_size, algorithm), algorithm)
+    else:
+        hash_dest = get_file_hash(dest_file, chunk_size, algorithm)
+    return hash_dest is not None and hash_source == hash_dest
+
+
+def compare_options_from_config(config):
+    """从配置字典读取文件比较参数（hash_algorithm、hash_chunk_mb、sample_block_kb）"""
+    algorithm = config.get("hash_algorithm", HASH_ALGORITHM)
+    try:
+        new_hasher(algorithm)
+    except ValueError as e:
+        print(f"哈希算法 {algorithm} 不可用（{e}），改用 {HASH_ALGORITHM}")
+        algorithm = HASH_ALGORITHM
+    return {
+        "algorithm": algorithm,
+        "chunk_size": int(float(config.get("hash_chunk_mb", HASH_CHUNK_SIZE / 1024 ** 2)) * 1024 ** 2),
+        "sample_size": int(float(config.get("sample_block_kb", SAMPLE_BLOCK_SIZE / 1024)) * 1024),
+    }
+
+
+def unique_rename_path(target_dir, file_name):
+    """生成 "名称 - copyN.扩展名" 形式、在 target_dir 中尚不存在的路径"""
+    base, ext = os.path.splitext(file_name)
+    count = 1
+    new_name = f"{base} - copy{count}{ext}"
+    new_dest_file = os.path.join(target_dir, new_name)
+    while os.path.exists(new_dest_file):
+        count += 1
+        new_name = f"{base} - copy{count}{ext}"
+        new_dest_file = os.path.join(target_dir, new_name)
+    return new_name, new_dest_file
+
+
+#############################################
+# 目录扫描
+#############################################
+def list_subdirs(path):
+    """用 os.scandir 一次列出 path 下的子目录，返回 {名称: 完整路径}"""
+    subdirs = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirs[entry.name] = entry.path
+    return subdirs
+
+
+def scan_tree(top):
+    """
+    基于 os.scandir 的自顶向下遍历，作用同 os.walk，但直接给出文件的 DirEntry：
+    每个目录产出 (相对 top 的路径, [文件 DirEntry])，根目录的相对路径为 "."。
+    DirEntry.stat() 在 Windows 上由目录列举结果直接提供，不再额外访问 U 盘。
+    """
+    stack = ["."]
+    while stack:
+        rel_path = stack.pop()
+        folder = top if rel_path == "." else os.path.join(top, rel_path)
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            subdirs.append(entry.name)
+                        else:
+                            files.append(entry)
+                    except OSError as e:
+                        print(f"读取 {entry.path} 时出错: {e}")
+        except OSError as e:
+            print(f"读取 {folder} 时出错: {e}")
+            continue
+        yield rel_path, files
+        for name in reversed(subdirs):
+            stack.append(name if rel_path == "." else os.path.join(rel_path, name))
+
+
+#############################################
+# 同步目标发现
+#############################################
+def discover_targets(repo_root, usb_root, extra_ignore=()):
+    """
+    扫描数据库与 U 盘，确定需要同步的 (U盘样品目录, 数据库仪器目录, 样品名, 仪器名) 列表：
+      1. 扫描数据库根目录下已有的样品（不新建），对样品名称进行大小写不敏感匹配。
+      2. 根据每个样品文件夹下的子目录确定有效仪器集合（均转换为 lower-case）。
+      3. 遍历 USB 根目录，仅处理名称（lower-case）在有效仪器集合内的文件夹，
+         其中子目录作为样品：已存在于数据库的样品加入同步目标（仪器目录大小写不敏感匹配，
+         不存在的仪器目录在实际复制时由 prepare_copies 创建），不存在的记录为新样品。
+      4. 清理忽略列表：如果忽略记录中对应的 USB 文件夹不存在，则删除该记录。
+    extra_ignore 为额外忽略的 "instrument::sample"（如配置文件中的 ignore_samples），不参与清理。
+    数据库和 U 盘的前两层目录各只用 os.scandir 列举一次，结果在上述各步骤间复用。
+    只读扫描，不在数据库中创建目录（预览计划、试运行或取消时数据库保持不变）。
+    返回 (targets, new_samples)。
+    """
+    # 以 "." 开头的目录（如去重存储 .content_store）不是样品
+    db_samples = {name: path for name, path in list_subdirs(repo_root).items() if not name.startswith(".")}
+    sample_mapping = {s.lower(): s for s in db_samples}
+
+    # 每个数据库样品下的仪器目录：{样品: {仪器 lower-case: 仪器目录名}}
+    db_sample_instruments = {}
+    db_instruments_set = set()
+    for sample, sample_path in db_samples.items():
+        try:
+            instruments = {item.lower(): item for item in list_subdirs(sample_path)}
+        except OSError as e:
+            print(f"读取 {sample_path} 内子目录出错: {e}")
+            instruments = {}
+        db_sample_instruments[sample] = instruments
+        db_instruments_set.update(instruments)
+
+    # U 盘上有效仪器文件夹及其样品子目录：[(仪器, 仪器路径, {样品: 样品路径})]
+    usb_instruments = []
+    for instrument, instrument_path in list_subdirs(usb_root).items():
+        if instrument.lower() not in db_instruments_set:
+            print(f"USB 文件夹 {instrument} 不在有效仪器列表中，忽略。")
+            continue
+        try:
+            usb_instruments.append((instrument, instrument_path, list_subdirs(instrument_path)))
+        except PermissionError:
+            print(f"权限不足，无法访问 {instrument_path}，跳过。")
+        except OSError as e:
+            print(f"读取 {instrument_path} 内部时出错: {e}")
+
+    # 清理忽略列表：保留当前 USB 上仍存在的 "instrument::sample" 记录（以 lower-case 形式）
+    usb_ignore_keys = {
+        f"{instrument.lower()}::{sample.lower()}"
+        for instrument, _, samples in usb_instruments
+        for sample in samples
+    }
+    ignore_list = load_ignore_list()
+    new_ignore_list = [key for key in ignore_list if key in usb_ignore_keys]
+    if set(ignore_list) != set(new_ignore_list):
+        save_ignore_list(new_ignore_list)
+        ignore_list = new_ignore_list
+    ignore_list = set(ignore_list) | {key.lower() for key in extra_ignore}
+
+    targets = []
+    new_samples = []
+    for instrument, instrument_path, samples in usb_instruments:
+        print(f"处理仪器文件夹: {instrument}")
+        for sample, sample_usb_folder in samples.items():
+            if sample.lower() in sample_mapping:
+                # 样品存在于数据库中：采用正确的样品名称，仪器目录做大小写不敏感检查
+                db_sample = sample_mapping[sample.lower()]
+                dest_sample_folder = os.path.join(repo_root, db_sample)
+                dest_instruments = db_sample_instruments[db_sample]
+                if instrument.lower() in dest_instruments:
+                    dest_instrument_folder = os.path.join(dest_sample_folder,
+                                                          dest_instruments[instrument.lower()])
+                else:
+                    dest_instrument_folder = os.path.join(dest_sample_folder, instrument)
+                if not os.path.exists(dest_instrument_folder):
+                    print(f"目标仪器文件夹不存在，复制时将自动创建：{dest_instrument_folder}")
+                targets.append((sample_usb_folder, dest_instrument_folder, db_sample, instrument))
+            else:
+                key = f"{instrument.lower()}::{sample.lower()}"
+                if key in ignore_list:
+                    print(f"新样品 {sample} 来自 {instrument} 已忽略，跳过。")
+                else:
+                    print(f"发现新样品：{sample} 来自 {instrument}")
+                    new_samples.append({
+                        "instrument": instrument,
+                        "sample": sample,
+                        "usb_path": sample_usb_folder
+                    })
+    return targets, new_samples
+
+
+#############################################
+# 同步计划
+#############################################
+ACTION_LABELS = {"c": "新复制", "o": "覆盖", "s": "跳过", "r": "重命名"}
+HISTORY_ACTIONS = {"c": "新复制", "o": "覆盖", "r": "重命名复制"}  # 写入同步历史的操作名称
+KIND_LABELS = {"new": "新文件", "identical": "一致", "conflict": "冲突"}
+CONFLICT_RULES = {
+    "overwrite_newer": "U 盘较新则覆盖，否则跳过",
+    "overwrite_all": "全部覆盖",
+    "rename_all": "全部重命名",
+    "skip_all": "全部跳过",
+}
+DEFAULT_THROUGHPUT_MB_S = 30.0  # 估算耗时用的默认复制速度（约为 USB 2.0 实际速度）
+PROFILE_MIN_BYTES = 64 * 1024 * 1024  # 本次复制量超过该值才更新设备速度档案，避免小文件测速失真
+
+
+class SyncPlan:
+    """
+    一次同步的完整计划（dry-run 结果），每个条目是一个字典：
+      kind: "new" / "identical" / "conflict"
+      action: "c"（新复制）/ "o"（覆盖）/ "s"（跳过）/ "r"（重命名）
+      以及 file、source、dest、target_dir、rel_path、sample、instrument、size、source_mtime、
+      source_mtime_ns、dest_mtime。
+    冲突条目默认跳过，可用 apply_rule 批量设置或逐条修改 action 后再执行。
+    """
+
+    def __init__(self, items=None, new_samples=None, unchanged=0):
+        self.items = items or []
+        self.new_samples = new_samples or []
+        self.unchanged = unchanged  # 其中依据 U 盘快照判定为未变化、未做比较的文件数
+
+    def by_kind(self, kind):
+        return [item for item in self.items if item["kind"] == kind]
+
+    def conflicts(self):
+        return self.by_kind("conflict")
+
+    def pending(self):
+        """需要实际复制的条目"""
+        return [item for item in self.items if item["action"] in ("c", "o", "r")]
+
+    def apply_rule(self, rule, items=None):
+        """对冲突条目（或给定的条目子集）批量应用 CONFLICT_RULES 中的规则"""
+        if rule not in CONFLICT_RULES:
+            raise ValueError(f"未知的冲突处理规则: {rule}")
+        for item in items if items is not None else self.conflicts():
+            if item["kind"] != "conflict":
+                continue
+            if rule == "overwrite_newer":
+                item["action"] = "o" if item["source_mtime"] > item["dest_mtime"] else "s"
+            else:
+                item["action"] = {"overwrite_all": "o", "rename_all": "r", "skip_all": "s"}[rule]
+
+    def summary(self, throughput_mb_s=DEFAULT_THROUGHPUT_MB_S):
+        counts = {kind: 0 for kind in KIND_LABELS}
+        actions = {action: 0 for action in ACTION_LABELS}
+        for item in self.items:
+            counts[item["kind"]] += 1
+            if item["kind"] != "identical":
+                actions[item["action"]] += 1
+        total_bytes = sum(item["size"] for item in self.pending())
+        return {
+            "counts": counts,
+            "actions": actions,
+            "bytes": total_bytes,
+            "estimated_seconds": total_bytes / (throughput_mb_s * 1024 ** 2) if throughput_mb_s > 0 else 0.0,
+        }
+
+    def describe(self, throughput_mb_s=DEFAULT_THROUGHPUT_MB_S):
+        info = self.summary(throughput_mb_s)
+        counts, actions = info["counts"], info["actions"]
+        return (f"新文件 {counts['new']} 个，一致 {counts['identical']} 个，冲突 {counts['conflict']} 个"
+                f"（覆盖 {actions['o']}，重命名 {actions['r']}，跳过 {actions['s']}）；"
+                f"待复制 {info['bytes'] / 1024 ** 2:.1f} MB，预计 {info['estimated_seconds']:.0f} s"
+                + (f"（{self.unchanged} 个文件与上次快照一致，未重新比较）" if self.unchanged else ""))
+
+
+def make_plan_item(kind, file_name, source_file, dest_file, target_dir, rel_path, sample, instrument,
+                   stat_source=None, stat_dest=None):
+    """stat_source / stat_dest 已知时直接使用（如来自 DirEntry.stat()），不再重复 stat"""
+    if stat_source is None:
+        stat_source = get_file_stat(source_file)
+    if stat_dest is None and kind == "conflict":
+        stat_dest = get_file_stat(dest_file)
+    return {
+        "kind": kind,
+        "action": "c" if kind == "new" else "s",
+        "file": file_name,
+        "source": source_file,
+        "dest": dest_file,
+        "target_dir": target_dir,
+        "rel_path": rel_path,
+        "sample": sample,
+        "instrument": instrument,
+        "size": stat_source.st_size if stat_source else 0,
+        "source_mtime": stat_source.st_mtime if stat_source else 0.0,
+        "source_mtime_ns": stat_source.st_mtime_ns if stat_source else 0,
+        "dest_mtime": stat_dest.st_mtime if stat_dest else 0.0,
+    }
+
+
+#############################################
+# 后台同步引擎
+#############################################
+class SyncEngine:
+    """
+    在后台线程中完成整棵目录树的同步，不占用 Tk 主线程，分两个阶段：
+      1. 计划：遍历目录树，目标已存在的文件提交到线程池并行比较（不复制任何文件），
+         得到包含新文件/一致/冲突及大小、预计耗时的 SyncPlan，通过 ("plan", plan) 事件交给界面；
+      2. 执行：界面按规则或逐条处理冲突后调用 execute_plan()，引擎把所有复制任务一次性提交到线程池。
+         执行时每个文件先写临时文件再原子重命名，待复制条目及完成情况记入复制日志（CopyJournal）。
+    dry_run=True 时只生成计划，不等待也不执行；
+    resume=True 时跳过计划阶段，直接继续复制日志中上次中断时未完成的文件。
+    事件格式：
+      ("status", 文本) / ("progress", 已完成, 总数) / ("plan", SyncPlan) /
+      ("done", 结果字典) / ("error", 错误信息)
+    """
+
+    def __init__(self, repo_root, usb_root, config=None, targets=None, max_workers=8, events=None,
+                 dry_run=False, resume=False):
+        self.repo_root = repo_root
+        self.usb_root = usb_root
+        self.config = config or {}
+        self.targets = targets  # 为 None 时由 discover_targets 自动发现
+        self.max_workers = max_workers
+        self.events = events if events is not None else queue.Queue()
+        self.dry_run = dry_run
+        self.resume = resume  # True 时从复制日志继续上次中断的同步
+        # 设备档案中有上次实测的速度时，用它估算耗时并作为读并发的起点
+        self.device_key = device_key(usb_root) if usb_root else None
+        self.device_profile = load_device_profiles().get(self.device_key, {}) if self.device_key else {}
+        self.throughput_mb_s = float(self.device_profile.get(
+            "mb_s", self.config.get("estimated_mb_s", DEFAULT_THROUGHPUT_MB_S)))
+        self.copy_report = None
+        self._thread = None
+        self._cancel = threading.Event()
+        self._approved = threading.Event()
+        self._lock = threading.Lock()
+        self._done_tasks = 0
+        self._total_tasks = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="SyncEngine", daemon=True)
+        self._thread.start()
+        return self
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def cancel(self):
+        self._cancel.set()
+        self._approved.set()
+
+    def execute_plan(self):
+        """界面线程调用：确认（可能已修改过 action 的）计划，开始执行"""
+        self._approved.set()
+
+    def _emit(self, *event):
+        self.events.put(event)
+
+    def _reset_progress(self):
+        with self._lock:
+            self._done_tasks = 0
+            self._total_tasks = 0
+
+    def _task_done(self, _future=None):
+        with self._lock:
+            self._done_tasks += 1
+            done, total = self._done_tasks, self._total_tasks
+        self._emit("progress", done, total)
+
+    def _track(self, future):
+        with self._lock:
+            self._total_tasks += 1
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _submit(self, executor, func, *args, **kwargs):
+        return self._track(executor.submit(func, *args, **kwargs))
+
+    def _run(self):
+        try:
+            self._emit("done", self._sync())
+        except Exception as e:
+            print(f"同步失败: {e}")
+            self._emit("error", str(e))
+
+    def build_plan(self, targets, executor, hash_index, compare_options, snapshot=None):
+        """
+        遍历所有同步目标，生成 SyncPlan；比较任务并行执行，不复制任何文件。
+        提供 snapshot（UsbSnapshot）时，两侧 stat 信息都与上次同步快照一致的文件直接记为一致，
+        不提交比较任务。
+        """
+        items = []
+        comparisons = []  # (future, 条目)
+        unchanged = 0
+        for source_dir, dest_dir, sample, instrument in targets:
+            if self._cancel.is_set():
+                break
+            print(f"计划：USB [{source_dir}] -> 数据库 [{dest_dir}]")
+            self._emit("status", f"正在扫描 {sample} / {instrument} ...")
+            for rel_path, entries in scan_tree(source_dir):
+                if self._cancel.is_set():
+                    break
+                target_dir = os.path.join(dest_dir, rel_path)
+                for entry in entries:
+                    file = entry.name
+                    source_file = entry.path
+                    dest_file = os.path.join(target_dir, file)
+                    try:
+                        stat_source = entry.stat()
+                    except OSError as e:
+                        print(f"获取 {source_file} 状态时出错: {e}")
+                        continue
+                    if snapshot is not None and snapshot.is_unchanged(
+                            os.path.relpath(source_file, self.usb_root), stat_source, dest_file):
+                        unchanged += 1
+                        items.append(make_plan_item("identical", file, source_file, dest_file, target_dir,
+                                                    rel_path, sample, instrument, stat_source))
+                    elif not os.path.exists(dest_file):
+                        items.append(make_plan_item("new", file, source_file, dest_file, target_dir, rel_path,
+                                                    sample, instrument, stat_source))
+                    else:
+                        item = make_plan_item("conflict", file, source_file, dest_file, target_dir, rel_path,
+                                              sample, instrument, stat_source)
+                        future = self._submit(executor, files_identical, source_file, dest_file,
+                                              hash_index, **compare_options)
+                        comparisons.append((future, item))
+                        items.append(item)
+
+        if unchanged:
+            print(f"U 盘快照中未变化的文件 {unchanged} 个，跳过比较。")
+        self._emit("status", "正在比较已存在的文件...")
+        for future, item in comparisons:
+            if future.result():
+                item["kind"] = "identical"
+        return SyncPlan(items, unchanged=unchanged)
+
+    def prepare_copies(self, plan, hash_index):
+        """确定每个待复制条目的实际目标（重命名在此时选定文件名），返回 [(条目, 实际文件名, 实际目标路径)]"""
+        copies = []
+        created_dirs = set()
+        for item in plan.pending():
+            if item["target_dir"] not in created_dirs:
+                try:
+                    os.makedirs(item["target_dir"], exist_ok=True)
+                except Exception as e:
+                    print(f"无法创建目录 {item['target_dir']}: {e}")
+                    continue
+                created_dirs.add(item["target_dir"])
+            file_name, dest_file = item["file"], item["dest"]
+            if item["action"] == "r":
+                file_name, dest_file = unique_rename_path(item["target_dir"], item["file"])
+            elif item["action"] == "o":
+                hash_index.forget(dest_file)
+            copies.append((item, file_name, dest_file))
+        return copies
+
+    def run_copies(self, copies, entry_ids, scheduler, journal):
+        """
+        把全部复制任务一次性交给 CopyScheduler，每个文件复制成功后立即在日志中标记完成。
+        返回 (本次同步记录, 失败数, 成功的条目列表)。
+        """
+        futures = []
+        for (item, file_name, dest_file), entry_id in zip(copies, entry_ids):
+            if self._cancel.is_set():
+                break
+            print(f"Scheduling {ACTION_LABELS[item['action']]}:\n  {item['source']} -> {dest_file}")
+            future = scheduler.submit(item["source"], dest_file)
+            future.add_done_callback(
+                lambda f, entry_id=entry_id: journal.mark_done(entry_id) if f.result() else None)
+            futures.append((self._track(future), item, file_name, dest_file))
+
+        session_record = {}
+        failed = 0
+        synced = []
+        for future, item, file_name, dest_file in futures:
+            if future.result():
+                synced.append(item)
+                record_event(session_record, item["sample"], item["instrument"], item["rel_path"],
+                             file_name, dest_file, HISTORY_ACTIONS[item["action"]])
+            else:
+                failed += 1
+        return session_record, failed, synced
+
+    def _copy_with_journal(self, copies, journal, entry_ids, hash_index):
+        """
+        执行复制并输出测速报告；全部成功且未取消时清空日志，否则保留未完成条目以便下次继续。
+        config.json 设置了 dedup_store 时经 ContentStore 去重。
+        """
+        self._reset_progress()
+        self._emit("status", "正在复制...")
+        compare_options = compare_options_from_config(self.config)
+        store = ContentStore.from_config(
+            self.config, self.repo_root, hash_index,
+            lambda path: get_file_hash(path, compare_options["chunk_size"], compare_options["algorithm"]),
+            compare_options["algorithm"],
+        )
+        with contextlib.closing(store) if store is not None else contextlib.nullcontext(), \
+                CopyScheduler.from_config(self.config, self.device_profile, store) as scheduler:
+            session_record, failed, synced = self.run_copies(copies, entry_ids, scheduler, journal)
+        self.copy_report = scheduler.report()
+        self._save_copy_report()
+        if self._cancel.is_set() or failed:
+            print("复制未全部完成，未完成的文件已记入复制日志，下次同步时可继续。")
+        else:
+            journal.clear()
+        return session_record, failed, synced
+
+    def _sync(self):
+        if self.resume:
+            return self._resume()
+        started = time.time()
+        new_samples = []
+        if self.targets is None:
+            self._emit("status", "正在扫描数据库与 U 盘...")
+            targets, new_samples = discover_targets(self.repo_root, self.usb_root,
+                                                    self.config.get("ignore_samples", []))
+        else:
+            targets = self.targets
+
+        compare_options = compare_options_from_config(self.config)
+        session_record = {}
+        failed = 0
+        synced = []
+
+        with HashIndex(HASH_INDEX_FILE) as hash_index, self._open_snapshot() as snapshot, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            plan = self.build_plan(targets, executor, hash_index, compare_options, snapshot)
+            plan.new_samples = new_samples
+            print(plan.describe(self.throughput_mb_s))
+            self._emit("status", plan.describe(self.throughput_mb_s))
+            self._emit("plan", plan)
+
+            if not self.dry_run and not self._cancel.is_set():
+                self._approved.wait()
+            if not self.dry_run and not self._cancel.is_set():
+                copies = self.prepare_copies(plan, hash_index)
+                with CopyJournal(JOURNAL_FILE) as journal:
+                    entry_ids = journal.begin(self._journal_info(), copies)
+                    session_record, failed, synced = self._copy_with_journal(copies, journal, entry_ids, hash_index)
+                for item in synced:
+                    item["synced"] = True
+                if snapshot is not None and not self._cancel.is_set():
+                    self._update_snapshot(snapshot, targets, plan)
+            for item in plan.conflicts():
+                if item["action"] == "s":
+                    print(f"跳过文件:\n  {item['source']}")
+
+        self._append_history(session_record)
+        return self._result(started, plan, len(synced), failed, new_samples, session_record)
+
+    def _resume(self):
+        """从复制日志继续上次中断的同步：不扫描、不比较，只复制日志中未完成的文件"""
+        started = time.time()
+        with CopyJournal(JOURNAL_FILE) as journal, HashIndex(HASH_INDEX_FILE) as hash_index:
+            entries = journal.pending()
+            print(f"继续上次中断的同步，剩余 {len(entries)} 个文件。")
+            copies, entry_ids, failed = [], [], 0
+            for entry_id, item, file_name, dest_file in entries:
+                # U 盘上的文件在中断后被修改过，则日志中的决定已不可靠，交给下次完整同步处理
+                stat_source = get_file_stat(item["source"])
+                if stat_source is None or (stat_source.st_size, stat_source.st_mtime_ns) != (
+                        item["size"], item["source_mtime_ns"]):
+                    print(f"文件已变化或不存在，需重新同步:\n  {item['source']}")
+                    journal.mark_done(entry_id)
+                    failed += 1
+                    continue
+                copies.append((item, file_name, dest_file))
+                entry_ids.append(entry_id)
+            session_record, copy_failed, synced = self._copy_with_journal(copies, journal, entry_ids, hash_index)
+        plan = SyncPlan([item for item, _, _ in copies])
+        self._append_history(session_record)
+        return self._result(started, plan, len(synced), failed + copy_failed, [], session_record)
+
+    def _journal_info(self):
+        return {
+            "repo_root": self.repo_root,
+            "usb_root": self.usb_root,
+            "started": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def _append_history(self, session_record):
+        if session_record:
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            with HistoryStore() as history:
+                history.append_session(timestamp, session_record)
+            print("同步记录已更新。")
+
+    def _result(self, started, plan, copied, failed, new_samples, session_record):
+        return {
+            "cancelled": self._cancel.is_set(),
+            "dry_run": self.dry_run,
+            "plan": plan,
+            "copied": copied,
+            "failed": failed,
+            "conflicts": len(plan.conflicts()),
+            "new_samples": new_samples,
+            "records": session_record,
+            "elapsed": time.time() - started,
+            "copy_report": self.copy_report,
+        }
+
+    def _open_snapshot(self):
+        """config.json 中 use_snapshot 为 false 时不使用 U 盘快照"""
+        if self.config.get("use_snapshot", True) and self.device_key:
+            return UsbSnapshot(self.device_key, SNAPSHOT_FILE)
+        return contextlib.nullcontext()
+
+    def _update_snapshot(self, snapshot, targets, plan):
+        """
+        把已确认与数据库一致的文件（一致的和本次复制或覆盖成功的）连同数据库文件当前的 stat 写入 U 盘快照；
+        跳过、失败和重命名复制的不记录（重命名时 dest 处仍是原来的数据库文件）。
+        """
+        entries = []
+        for item in plan.items:
+            if item["kind"] != "identical" and not (item.get("synced") and item["action"] != "r"):
+                continue
+            stat_dest = get_file_stat(item["dest"])
+            if stat_dest is None:
+                continue
+            entries.append((os.path.relpath(item["source"], self.usb_root), item["size"], item["source_mtime_ns"],
+                            item["dest"], stat_dest.st_size, stat_dest.st_mtime_ns))
+        prefixes = [os.path.relpath(source_dir, self.usb_root) for source_dir, _, _, _ in targets]
+        snapshot.replace_tree(prefixes, entries)
+        print(f"U 盘快照已更新（{len(entries)} 个文件）。")
+
+    def _save_copy_report(self):
+        report = self.copy_report
+        print(f"本次复制 {report['files']} 个文件，{report['bytes'] / 1024 ** 2:.1f} MB，"
+              f"用时 {report['seconds']:.1f} s，平均 {report['mb_s']:.1f} MB/s，读并发 {report['read_workers']}")
+        if report["linked_files"]:
+            print(f"其中 {report['linked_files']} 个文件与已有内容相同，已链接到去重存储，"
+                  f"节省 {report['linked_bytes'] / 1024 ** 2:.1f} MB")
+        if self.device_key and report["bytes"] >= PROFILE_MIN_BYTES:
+            save_device_profile(self.device_key, {
+                "read_workers": report["read_workers"],
+                "mb_s": round(report["mb_s"], 2),
+                "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            })
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+公式批量计算（命令行）：读取界面保存的 config.json（主公式 + 变量，子公式引用会自动展开），
+变量取值可以是列表、范围或 CSV 列，对全部组合（笛卡尔积）或逐行计算，结果写成 CSV。
+
+变量取值格式：
+  0.16             单个值
+  1, 2, 5          列表（JSON 中也可以写成 [1, 2, 5]）
+  0.1:0.5:21       等间距取值：起点:终点:点数（含两端）
+  csv:列名         --csv 表格中的一列
+  a*2 + 1          其他文本按子公式处理
+
+用法示例：
+  python batch_calc.py "result/K33 25.12.21-04.10/config.json" --set "f=0.05:0.3:26" --set "cos2phi_avg=-1:1:41"
+  python batch_calc.py config.json --csv samples.csv --bind-csv --mode rows --out result/samples_K33.csv
+"""
+import argparse
+import datetime
+import os
+import time
+
+from formula_engine import SWEEP_MODES, batch_evaluate, load_csv_table, load_formula_config, write_results_csv
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="公式批量计算")
+    parser.add_argument("config", help="界面保存的 config.json")
+    parser.add_argument("--set", action="append", default=[], metavar="变量=取值",
+                        help="覆盖配置中的变量取值，可重复使用")
+    parser.add_argument("--csv", help="CSV 表格（第一行为列名），供 csv:列名 引用")
+    parser.add_argument("--bind-csv", action="store_true", help="与输入变量同名的 CSV 列自动作为该变量的取值")
+    parser.add_argument("--mode", choices=sorted(SWEEP_MODES), default="product",
+                        help="product 对多值变量取笛卡尔积（默认），rows 按行对应")
+    parser.add_argument("--out", help="结果 CSV 路径，默认 result/<主变量> batch <时间>.csv")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        config = load_formula_config(args.config)
+    except (OSError, ValueError, RuntimeError) as e:
+        raise SystemExit(f"配置文件读取失败：{e}")
+    variables = dict(config.get("variables", {}))
+    for item in args.set:
+        name, sep, value = item.partition("=")
+        if not sep or not name.strip():
+            raise SystemExit(f"--set 的格式应为 变量=取值：{item}")
+        variables[name.strip()] = value.strip()
+    try:
+        table = load_csv_table(args.csv) if args.csv else None
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"CSV 表格读取失败：{e}")
+
+    t0 = time.perf_counter()
+    try:
+        graph, columns = batch_evaluate(config.get("main_formula", ""), variables, args.mode, table, args.bind_csv)
+    except ValueError as e:
+        raise SystemExit(f"批量计算失败：{e}")
+    elapsed = time.perf_counter() - t0
+
+    out_path = args.out or os.path.join(
+        "result", f"{graph.target} batch {datetime.datetime.now().strftime('%y.%m.%d-%H.%M')}.csv")
+    try:
+        write_results_csv(out_path, columns)
+    except OSError as e:
+        raise SystemExit(f"结果保存失败：{e}")
+    rows = len(columns[graph.target])
+    swept = [name for name in graph.inputs if len(set(columns[name].tolist())) > 1]
+    print(f"{graph.target}：按{SWEEP_MODES[args.mode]}计算 {rows} 组（变化的变量：{', '.join(swept) or '无'}），"
+          f"用时 {elapsed:.3f} s")
+    print(f"结果已保存至 {out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
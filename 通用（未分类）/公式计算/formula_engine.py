@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+编译后的公式依赖图：主公式和各子公式只解析一次，按依赖关系拓扑排序，
+每个节点用 lambdify（NumPy 后端）编译成普通函数，之后换一组参数重新计算只是按顺序调用这些函数，
+不再做 SymPy 的符号替换和 N(..., 15) 数值化。输入可以是标量，也可以是 NumPy 数组（逐元素计算）。
+编译结果按公式文本缓存（compile_formula_graph）。
+
+批量计算（batch_evaluate）：每个输入变量可以是单个值、列表、等间距范围或 CSV 表格中的一列，
+对全部组合（笛卡尔积）或逐行一次性用 NumPy 计算，结果用 write_results_csv 写成 CSV。
+"""
+
+import csv
+import json
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+from sympy import Basic, Symbol, lambdify
+from sympy.parsing.sympy_parser import parse_expr
+
+MATH_FUNCS = {'sin', 'cos', 'tan', 'tanh', 'sqrt', 'log', 'exp', 'ln',
+              'sinh', 'cosh', 'asin', 'acos', 'atan', 'atanh', 'pi', 'E'}
+NAME_PATTERN = re.compile(r'\b[A-Za-z_][A-Za-z0-9_]*\b')
+SWEEP_MODES = {"product": "笛卡尔积", "rows": "逐行"}
+MAX_SWEEP_POINTS = 10_000_000
+
+
+def split_formula(text, default_lhs="y"):
+    """把 "lhs = rhs" 拆成 (lhs, rhs)，没有等号时左侧为 default_lhs"""
+    if '=' in text:
+        lhs, rhs = text.split('=', 1)
+        return lhs.strip(), rhs.strip()
+    return default_lhs, text.strip()
+
+
+def formula_names(text):
+    """公式中出现的变量名（不含数学函数和常数）"""
+    return set(NAME_PATTERN.findall(text)) - MATH_FUNCS
+
+
+def parse_formula(text):
+    return parse_expr(text, local_dict={name: Symbol(name) for name in formula_names(text)})
+
+
+class FormulaNode:
+    """依赖图中的一个节点 name = expr：args 为直接依赖的变量名，func 为编译后的 NumPy 函数"""
+
+    def __init__(self, name, text, expr):
+        self.name = name
+        self.text = text
+        self.expr = expr
+        self.args = sorted(str(s) for s in expr.free_symbols)
+        self.func = lambdify([Symbol(arg) for arg in self.args], expr, modules="numpy")
+        self.is_alias = isinstance(expr, Symbol)  # a = b 这样的引用，不单独记录为子公式
+
+
+class FormulaGraph:
+    """
+    主公式及其子公式组成的有向无环图：
+      target       主公式左侧的变量名
+      nodes        {变量名: FormulaNode}
+      order        按拓扑顺序排列的节点（依赖在前）
+      inputs       需要数值输入的变量（出现在公式中但没有定义公式的变量）
+    """
+
+    def __init__(self, formula, definitions=()):
+        self.target, rhs = split_formula(formula)
+        self.nodes = {}
+        # 子公式中与主公式左侧同名的定义跳过，主公式始终以 formula 为准
+        definitions = [(name, text) for name, text in definitions if name != self.target]
+        for name, text in [(self.target, rhs)] + definitions:
+            if not isinstance(text, str) or not text.strip():
+                if name == self.target:
+                    raise ValueError("公式右侧为空或格式不正确，请重新输入公式！")
+                raise ValueError(f"变量 {name} 未赋值且未定义公式！")
+            left, sep, right = text.partition('=')
+            if sep and left.strip() == name:
+                text = right.strip()  # 历史配置中的 "p = 1/12"
+            try:
+                expr = parse_formula(text)
+            except Exception as e:
+                raise ValueError(f"变量 {name} 的公式解析失败：{e}")
+            if not isinstance(expr, Basic):  # 如 "None"
+                raise ValueError(f"变量 {name} 的公式解析失败：{text}")
+            self.nodes[name] = FormulaNode(name, text, expr)
+
+        self.order = []
+        state = {}
+
+        def visit(name):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"变量 {name} 存在循环引用！")
+            state[name] = "visiting"
+            for arg in self.nodes[name].args:
+                if arg in self.nodes:
+                    visit(arg)
+            state[name] = "done"
+            self.order.append(self.nodes[name])
+
+        for name in self.nodes:
+            visit(name)
+        self.inputs = sorted({arg for node in self.order for arg in node.args if arg not in self.nodes})
+
+    def evaluate(self, values):
+        """
+        按拓扑顺序计算所有节点。values 为输入变量的值（标量或可相互广播的 NumPy 数组），
+        返回包含输入在内的全部变量值；定义了公式的变量即使在 values 中出现也以公式结果为准。
+        """
+        missing = [name for name in self.inputs if name not in values]
+        if missing:
+            raise ValueError(f"变量 {missing[0]} 未赋值且未定义公式！")
+        result = dict(values)
+        with np.errstate(all="ignore"):
+            for node in self.order:
+                result[node.name] = node.func(*(result[arg] for arg in node.args))
+        return result
+
+    def process_steps(self, values):
+        """子公式的计算记录（与界面中 process_log 的格式一致），values 为 evaluate 的标量结果"""
+        return [
+            {"variable": node.name,
+             "formula": f"{node.name} = {node.text}",
+             "assignments": {arg: float(values[arg]) for arg in node.args},
+             "expr": node.expr}
+            for node in self.order
+            if node.name != self.target and not node.is_alias
+        ]
+
+
+@lru_cache(maxsize=128)
+def _compile(formula, definitions):
+    return FormulaGraph(formula, definitions)
+
+
+def compile_formula_graph(formula, definitions=None):
+    """
+    返回编译好的 FormulaGraph，相同的主公式文本和子公式定义只编译一次。
+    definitions 为 {变量名: 公式文本}，其中与主公式左侧同名的条目被忽略。
+    """
+    return _compile(formula, tuple(sorted((definitions or {}).items())))
+
+
+#############################################
+# 配置文件
+#############################################
+def load_formula_config(file_path, loaded=None):
+    """读取保存的 config.json，子公式引用（{"ref": ...}）递归展开为公式右侧文本"""
+    if loaded is None:
+        loaded = set()
+    abspath = os.path.abspath(file_path)
+    if abspath in loaded:
+        raise RuntimeError(f"循环引用: {file_path}")
+    loaded.add(abspath)
+    with open(file_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    # 递归加载子变量，只取等号右侧表达式
+    variables = config.get("variables", {})
+    for k, v in variables.items():
+        if isinstance(v, dict) and "ref" in v:
+            sub_path = os.path.join(os.path.dirname(file_path), v["ref"])
+            sub_config = load_formula_config(sub_path, loaded)
+            variables[k] = split_formula(sub_config.get("main_formula", ""))[1]
+    config["variables"] = variables
+    return config
+
+
+#############################################
+# 批量计算
+#############################################
+class CsvTable(dict):
+    """{列名: 数组}；invalid 为 {列名: 原因}，记录因含非数值单元格而不能作为输入的列"""
+
+    def __init__(self):
+        super().__init__()
+        self.invalid = {}
+
+
+def load_csv_table(file_path):
+    """读取 CSV 表格（第一行为列名），返回 CsvTable。空单元格按 NaN 处理，对应结果也为 NaN"""
+    with open(file_path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        raise ValueError(f"CSV 文件 {file_path} 没有数据行")
+    table = CsvTable()
+    for column in rows[0]:
+        if column is None:
+            continue  # 数据行比列名多出的单元格
+        values = []
+        for line_no, row in enumerate(rows, start=2):
+            cell = (row[column] or "").strip()
+            try:
+                values.append(float(cell) if cell else np.nan)
+            except ValueError:
+                # 非数值列（如样品名）不能作为输入
+                table.invalid[column.strip()] = f"第 {line_no} 行的值 {cell!r} 不是数值"
+                break
+        else:
+            table[column.strip()] = np.array(values)
+    return table
+
+
+def parse_sweep_value(value, table=None):
+    """
+    批量计算中一个变量的取值，返回一维数组；value 是公式（不是取值）时返回 None：
+      0.16 或 "0.16"        单个值
+      [1, 2, 5] 或 "1, 2, 5" 列表
+      "0.1:0.5:21"          等间距取值：起点:终点:点数（含两端）
+      "csv:列名"             CSV 表格中的一列
+    """
+    if isinstance(value, (int, float)):
+        return np.array([float(value)])
+    if isinstance(value, (list, tuple)):
+        return np.array([float(v) for v in value])
+    text = str(value).strip().replace("，", ",")
+    if text.lower().startswith("csv:"):
+        column = text[4:].strip()
+        if table is None:
+            raise ValueError(f"{text}：没有指定 CSV 表格")
+        if column in getattr(table, "invalid", {}):
+            raise ValueError(f"CSV 表格的列 {column} 不能作为输入：{table.invalid[column]}")
+        if column not in table:
+            raise ValueError(f"CSV 表格中没有数值列 {column}，可用的列：{', '.join(table)}")
+        return table[column]
+    if ":" in text:
+        parts = text.split(":")
+        if len(parts) != 3:
+            raise ValueError(f"范围 {text} 的格式应为 起点:终点:点数")
+        try:
+            start, stop, num = float(parts[0]), float(parts[1]), int(parts[2])
+        except ValueError:
+            raise ValueError(f"范围 {text} 的格式应为 起点:终点:点数")
+        if num < 1:
+            raise ValueError(f"范围 {text} 的点数必须大于 0")
+        return np.linspace(start, stop, num)
+    try:
+        return np.array([float(v) for v in text.split(",")])
+    except ValueError:
+        return None
+
+
+def batch_evaluate(formula, variables, mode="product", table=None, bind_table=False):
+    """
+    批量计算。variables 为 {变量名: 取值或公式}（取值格式见 parse_sweep_value，公式作为子公式进入依赖图），
+    mode="product" 对所有多值变量取笛卡尔积，mode="rows" 要求多值变量长度相同并逐行对应；
+    bind_table 为 True 时，与输入变量同名的 CSV 列覆盖 variables 中的取值。
+    返回 (graph, columns)，columns 为 {列名: 等长数组}：输入变量、子公式（拓扑顺序）、主公式。
+    """
+    if mode not in SWEEP_MODES:
+        raise ValueError(f"未知的批量计算方式: {mode}，可选 {', '.join(SWEEP_MODES)}")
+    arrays = {}
+    definitions = {}
+    for name, value in variables.items():
+        if value is None or (isinstance(value, str) and not value.strip()):
+            continue  # 未赋值：可由 CSV 同名列提供，否则下面报缺少取值
+        array = parse_sweep_value(value, table)
+        if array is None:
+            definitions[name] = value
+        else:
+            arrays[name] = array
+    graph = compile_formula_graph(formula, definitions)
+    if bind_table and table:
+        arrays.update({name: table[name] for name in graph.inputs if name in table})
+    missing = [name for name in graph.inputs if name not in arrays]
+    if missing:
+        raise ValueError(f"变量 {missing[0]} 未赋值且未定义公式！")
+
+    multi = [name for name in graph.inputs if arrays[name].size > 1]
+    if mode == "product":
+        size = int(np.prod([arrays[name].size for name in multi])) if multi else 1
+        if size > MAX_SWEEP_POINTS:
+            raise ValueError(f"组合数 {size} 超过上限 {MAX_SWEEP_POINTS}，请减少取值个数或改为逐行计算")
+        grids = np.meshgrid(*(arrays[name] for name in multi), indexing="ij") if multi else []
+        columns = {name: grid.ravel() for name, grid in zip(multi, grids)}
+    else:
+        sizes = {name: arrays[name].size for name in multi}
+        if len(set(sizes.values())) > 1:
+            raise ValueError("逐行计算时各多值变量的长度必须相同："
+                             + "，".join(f"{name}={n}" for name, n in sizes.items()))
+        size = next(iter(sizes.values()), 1)
+        columns = {name: arrays[name] for name in multi}
+    for name in graph.inputs:
+        if name not in columns:
+            columns[name] = np.full(size, arrays[name][0])
+
+    values = graph.evaluate(columns)
+    for node in graph.order:
+        columns[node.name] = np.broadcast_to(np.asarray(values[node.name], dtype=float), (size,))
+    return graph, {name: columns[name] for name in graph.inputs + [node.name for node in graph.order]}
+
+
+def write_results_csv(file_path, columns):
+    """把 batch_evaluate 的结果写成 CSV（UTF-8 带 BOM，Excel 可直接打开）"""
+    folder = os.path.dirname(file_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    names = list(columns)
+    with open(file_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        writer.writerows(zip(*(columns[name].tolist() for name in names)))
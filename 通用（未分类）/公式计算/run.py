@@ -7,12 +7,22 @@ from sympy import symbols, latex, N, acos, Rational
 from sympy.parsing.sympy_parser import parse_expr
 from sympy import SympifyError
 import re
+import math
 from PIL import Image, ImageTk
 import matplotlib.pyplot as plt
 import io
 import os
 import datetime
 
+from formula_engine import (
+    SWEEP_MODES,
+    batch_evaluate,
+    compile_formula_graph,
+    load_csv_table,
+    load_formula_config,
+    write_results_csv,
+)
+
 class FormulaCalculatorApp:
     def __init__(self, master):
         self.master = master
@@ -50,7 +60,7 @@ class FormulaCalculatorApp:
         # 弹窗显示参数并允许修改，后续可扩展为自动进入赋值界面
         param_win = tk.Toplevel(self.master)
         param_win.title("历史参数编辑")
-        param_win.geometry("500x400")
+        param_win.geometry("500x480")
         tk.Label(param_win, text="参数列表（可修改后重新计算）：").pack(pady=5)
         param_entries = {}
         vars_dict = config.get("variables", {})
@@ -63,7 +73,7 @@ class FormulaCalculatorApp:
             if isinstance(v, dict) and "ref" in v:
                 entry.insert(0, f"引用: {v['ref']}")
                 entry.config(state='readonly')
-            else:
+            elif v is not None:
                 entry.insert(0, str(v))
             param_entries[k] = entry
         def recalc():
@@ -94,6 +104,55 @@ class FormulaCalculatorApp:
             param_win.destroy()
         tk.Button(param_win, text="重新计算", command=recalc).pack(pady=10)
 
+        # 批量计算：参数可填列表、范围或 CSV 列，一次算出所有组合并保存为 CSV
+        tk.Label(param_win, text="批量计算时参数可填：列表 1, 2, 5 / 范围 起点:终点:点数 / csv:列名").pack(pady=5)
+        batch_frame = tk.Frame(param_win)
+        batch_frame.pack(pady=2)
+        mode_var = tk.StringVar(value="product")
+        for mode, label in SWEEP_MODES.items():
+            tk.Radiobutton(batch_frame, text=label, variable=mode_var, value=mode).pack(side=tk.LEFT)
+        table_holder = {}
+        table_label = tk.Label(batch_frame, text="未选择CSV表格")
+
+        def choose_table():
+            path = filedialog.askopenfilename(parent=param_win, title="选择CSV表格", filetypes=[("CSV文件", "*.csv")])
+            if not path:
+                return
+            try:
+                table_holder["table"] = load_csv_table(path)
+            except Exception as e:
+                messagebox.showerror("读取失败", f"CSV 表格读取失败：{e}", parent=param_win)
+                return
+            table_label.config(text=f"{os.path.basename(path)}（{len(table_holder['table'])} 列）")
+
+        def batch():
+            variables = {k: entry.get().strip() for k, entry in param_entries.items()
+                         if entry.cget('state') != 'readonly'}
+            try:
+                graph, columns = batch_evaluate(config.get("main_formula", ""), variables, mode_var.get(),
+                                                table_holder.get("table"))
+            except Exception as e:
+                messagebox.showerror("批量计算失败", f"{e}", parent=param_win)
+                return
+            timestamp = datetime.datetime.now().strftime("%y.%m.%d-%H.%M")
+            out_path = filedialog.asksaveasfilename(
+                parent=param_win, title="保存批量计算结果", initialdir="result",
+                initialfile=f"{graph.target} batch {timestamp}.csv",
+                defaultextension=".csv", filetypes=[("CSV文件", "*.csv")])
+            if not out_path:
+                return
+            try:
+                write_results_csv(out_path, columns)
+            except Exception as e:
+                messagebox.showerror("保存失败", f"批量计算结果保存失败：{e}", parent=param_win)
+                return
+            rows = len(columns[graph.target])
+            messagebox.showinfo("批量计算完成", f"共计算 {rows} 组，结果已保存至：\n{out_path}", parent=param_win)
+
+        tk.Button(batch_frame, text="选择CSV表格", command=choose_table).pack(side=tk.LEFT, padx=5)
+        table_label.pack(side=tk.LEFT)
+        tk.Button(param_win, text="批量计算", command=batch).pack(pady=5)
+
     def _direct_calculate_with_params(self, param_dict):
         # 直接用参数字典进行主公式和递归子公式计算
         formula_input = self.formula_text.get("1.0", tk.END).strip()
@@ -130,113 +189,35 @@ class FormulaCalculatorApp:
         except (SympifyError, Exception) as e:
             messagebox.showerror("错误", f"解析公式时出错：\n{e}")
             return
-        # 直接用参数字典递归赋值
+        # 直接用参数字典计算：数值作为输入，公式/引用组成依赖图，编译一次（按公式文本缓存）后按拓扑顺序求值
         assignments = {}
         formula_inputs = {}
-        # 统一变量名为字符串，优先用 param_dict 的所有变量
         for var_str in param_dict:
             try:
-                num_val = float(param_dict[var_str])
-                assignments[var_str] = num_val
-                self.resolved_values[var_str] = num_val
+                assignments[var_str] = float(param_dict[var_str])
             except ValueError:
                 formula_inputs[var_str] = param_dict[var_str]
-        def resolve_var(var, resolving_stack=None):
-            if var in self.resolved_values:
-                return self.resolved_values[var]
-            if var in assignments:
-                self.resolved_values[var] = assignments[var]
-                return assignments[var]
-            if var in formula_inputs:
-                if resolving_stack is None:
-                    resolving_stack = set()
-                if var in resolving_stack:
-                    messagebox.showerror("错误", f"变量 {var} 存在循环引用！")
-                    return None
-                resolving_stack.add(var)
-                # 检查是否为变量引用（如 a=b）
-                ref_val = formula_inputs[var]
-                ref_val_stripped = ref_val.strip()
-                # 如果是单变量名，递归引用
-                if re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', ref_val_stripped):
-                    sub_val = resolve_var(ref_val_stripped, resolving_stack)
-                    if sub_val is None:
-                        return None
-                    self.resolved_values[var] = sub_val
-                    return sub_val
-                try:
-                    vars_in_expr = set(re.findall(r'\b[A-Za-z_][A-Za-z0-9_]*\b', ref_val))
-                    math_funcs = {'sin', 'cos', 'tan', 'tanh', 'sqrt', 'log', 'exp', 'ln',
-                                  'sinh', 'cosh', 'asin', 'acos', 'atan', 'atanh', 'pi', 'E'}
-                    vars_in_expr -= math_funcs
-                    sub_symbols = symbols(list(vars_in_expr))
-                    sub_symbols_dict = {str(s): s for s in sub_symbols}
-                    sub_expr = parse_expr(ref_val, local_dict=sub_symbols_dict)
-                    sub_assignments = {}
-                    for sub_var in vars_in_expr:
-                        sub_val = resolve_var(sub_var, resolving_stack)
-                        if sub_val is None:
-                            return None
-                        sub_assignments[sub_var] = sub_val
-                    final_val = float(N(sub_expr.subs(sub_assignments), 15))
-                    self.resolved_values[var] = final_val
-                    self.process_log.append({
-                        "variable": var,
-                        "formula": f"{var} = {ref_val}",
-                        "assignments": sub_assignments,
-                        "expr": sub_expr
-                    })
-                    return final_val
-                except Exception as e:
-                    messagebox.showerror("错误", f"变量 {var} 的公式解析失败：{e}")
-                    return None
-            messagebox.showerror("错误", f"变量 {var} 未赋值且未定义公式！")
-            return None
-        main_assignments = {}
-        for var_str in param_dict:
-            if var_str == lhs:
-                continue
-            val = resolve_var(var_str)
-            if val is None:
-                return
-            main_assignments[var_str] = val
-        # 只对主公式涉及的变量做符号替换
-        main_subs = {self.symbols_dict[k]: v for k, v in main_assignments.items() if k in self.symbols_dict}
-        main_log = next(log for log in self.process_log if log["variable"] == (lhs if lhs else "Main"))
-        main_log["assignments"].update(main_assignments)
-        final_expr = self.expr.subs(main_subs)
         try:
-            final_value = float(N(final_expr, 15))
+            graph = compile_formula_graph(formula_input, formula_inputs)
+            values = graph.evaluate(assignments)
+        except Exception as e:
+            messagebox.showerror("错误", str(e))
+            return
+        try:
+            final_value = float(values[lhs])
+            if not math.isfinite(final_value):
+                raise ValueError(f"结果不是有限实数（{final_value}）")
         except Exception as e:
             messagebox.showerror("错误", f"最终计算出错：{e}")
             return
+        self.resolved_values.update({var: float(val) for var, val in values.items() if var != lhs})
+        self.process_log.extend(graph.process_steps(values))
+        main_log = next(log for log in self.process_log if log["variable"] == (lhs if lhs else "Main"))
+        main_log["assignments"].update({var: self.resolved_values[var] for var in param_dict if var != lhs})
         self.show_final_result(lhs, final_value)
 
     def _load_config_recursive(self, file_path, loaded=None):
-        import json, os
-        if loaded is None:
-            loaded = set()
-        abspath = os.path.abspath(file_path)
-        if abspath in loaded:
-            raise RuntimeError(f"循环引用: {file_path}")
-        loaded.add(abspath)
-        with open(file_path, "r", encoding="utf-8") as f:
-            config = json.load(f)
-        # 递归加载子变量，只取等号右侧表达式
-        variables = config.get("variables", {})
-        for k, v in variables.items():
-            if isinstance(v, dict) and "ref" in v:
-                sub_path = os.path.join(os.path.dirname(file_path), v["ref"])
-                sub_config = self._load_config_recursive(sub_path, loaded)
-                sub_formula = sub_config.get("main_formula", "")
-                # 只取等号右侧
-                if '=' in sub_formula:
-                    _, right = sub_formula.split('=', 1)
-                    variables[k] = right.strip()
-                else:
-                    variables[k] = sub_formula.strip()
-        config["variables"] = variables
-        return config
+        return load_formula_config(file_path, loaded)
 
     def center_window(self, win, width, height):
         win.update_idletasks()